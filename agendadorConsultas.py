@@ -0,0 +1,235 @@
+# agendadorConsultas.py
+# Agendador na frente do RepositorioPrincipal. Numa segunda-feira de manhã vários usuários abrem
+# a mesma planta ao mesmo tempo e cada sessão disparava o mesmo PIVOT pesado no Protheus, sem
+# limite de quantos rodavam juntos. Aqui:
+# - Voo único (single-flight): pedidos com a mesma chave enquanto a primeira execução está em
+#   andamento não vão ao banco; esperam e recebem o mesmo resultado (ou a mesma exceção).
+# - Admissão: no máximo AGENDADOR_MAX_SIMULTANEAS consultas pesadas ao mesmo tempo; as demais
+#   esperam em fila por ordem de chegada, até AGENDADOR_TIMEOUT_FILA segundos.
+# - Cancelamento: cada participante registra uma "desistência" no seu ControleCancelamento.
+#   O comando no SQL Server só é cancelado quando todos os participantes desistiram.
+#
+# Exemplo:
+#   python agendadorConsultas.py --planta 000123 --loja 01 --sessoes 20
+import argparse
+import logging
+import threading
+import time
+from collections import deque
+
+import metricas
+from execucaoConsultas import ConsultaCancelada, ControleCancelamento
+from settings import AGENDADOR_MAX_SIMULTANEAS, AGENDADOR_TIMEOUT_FILA
+
+# Intervalo com que quem espera confere se a própria consulta foi cancelada
+INTERVALO_VERIFICACAO = 0.25
+
+
+class FilaEsgotadaError(Exception):
+    pass
+
+
+class _Voo:
+    # Uma execução em andamento e quem está esperando por ela
+    def __init__(self):
+        self.controle = ControleCancelamento()  # Cursores da execução real
+        self.participantes = 1
+        self.concluido = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class _Desistencia:
+    # Registrada no controle do participante como se fosse um cursor: ControleCancelamento
+    # chama cancel() quando a sessão cancela a consulta
+    def __init__(self, agendador, chave, voo: _Voo):
+        self.agendador = agendador
+        self.chave = chave
+        self.voo = voo
+
+    def cancel(self) -> None:
+        self.agendador._desistir(self.chave, self.voo)
+
+
+class AgendadorConsultas:
+    def __init__(self, max_simultaneas: int, timeout_fila: float):
+        self.max_simultaneas = max_simultaneas
+        self.timeout_fila = timeout_fila
+        self._lock = threading.Lock()
+        self._voos = {}  # chave -> _Voo em andamento
+        self._condicao = threading.Condition()
+        self._fila = deque()  # Bilhetes por ordem de chegada
+        self._em_execucao = 0
+        self._lideres = 0
+        self._coalescidas = 0
+        self._desistencias = 0
+        self._admitidas = 0
+        self._esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_max = 0.0
+        self._timeouts = 0
+
+    def executar(self, chave, funcao, controle: ControleCancelamento = None, admitir: bool = True):
+        # funcao(controle) -> resultado; o controle recebido é o da execução compartilhada.
+        # admitir=False: só o voo único, sem ocupar vaga (ex.: consulta ao snapshot local).
+        with self._lock:
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+                self._lideres += 1
+            else:
+                voo.participantes += 1
+                self._coalescidas += 1
+
+        desistencia = _Desistencia(self, chave, voo)
+        if controle is not None:
+            try:
+                controle.registrar(desistencia)
+            except ConsultaCancelada:
+                self._desistir(chave, voo)
+                if lider:
+                    self._concluir(chave, voo, erro=ConsultaCancelada("Consulta cancelada antes de iniciar."))
+                raise
+
+        try:
+            if lider:
+                self._conduzir(chave, voo, funcao, admitir)
+            else:
+                while not voo.concluido.wait(INTERVALO_VERIFICACAO):
+                    if controle is not None and controle.cancelado:
+                        raise ConsultaCancelada("Consulta cancelada.")
+        finally:
+            if controle is not None:
+                controle.liberar(desistencia)
+
+        # O líder termina a execução para os demais mesmo se a própria sessão desistiu
+        if controle is not None and controle.cancelado:
+            raise ConsultaCancelada("Consulta cancelada.")
+        if voo.erro is not None:
+            raise voo.erro
+        return voo.resultado
+
+    def _conduzir(self, chave, voo: _Voo, funcao, admitir: bool) -> None:
+        try:
+            if admitir:
+                self._entrar(voo)
+            try:
+                resultado = funcao(voo.controle)
+            finally:
+                if admitir:
+                    self._sair()
+        except Exception as e:
+            self._concluir(chave, voo, erro=e)
+        else:
+            self._concluir(chave, voo, resultado=resultado)
+
+    def _concluir(self, chave, voo: _Voo, resultado=None, erro: Exception = None) -> None:
+        with self._lock:
+            if self._voos.get(chave) is voo:
+                del self._voos[chave]
+        voo.resultado = resultado
+        voo.erro = erro
+        voo.concluido.set()
+
+    def _desistir(self, chave, voo: _Voo) -> None:
+        with self._lock:
+            voo.participantes -= 1
+            self._desistencias += 1
+            abandonado = voo.participantes <= 0 and not voo.concluido.is_set()
+            if abandonado and self._voos.get(chave) is voo:
+                # Pedidos novos com a mesma chave começam outra execução
+                del self._voos[chave]
+        if abandonado:
+            voo.controle.cancelar()
+
+    # --- Admissão (fila justa) ---
+    def _entrar(self, voo: _Voo) -> None:
+        inicio = time.perf_counter()
+        prazo = time.monotonic() + self.timeout_fila
+        bilhete = object()
+        esperou = False
+        with self._condicao:
+            self._fila.append(bilhete)
+            try:
+                while self._fila[0] is not bilhete or self._em_execucao >= self.max_simultaneas:
+                    if voo.controle.cancelado:
+                        raise ConsultaCancelada("Consulta cancelada na fila.")
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        raise FilaEsgotadaError(
+                            f"Consulta não admitida após {self.timeout_fila}s na fila "
+                            f"({self._em_execucao} em execução, {len(self._fila)} na fila)."
+                        )
+                    esperou = True
+                    self._condicao.wait(min(restante, INTERVALO_VERIFICACAO))
+                self._em_execucao += 1
+            finally:
+                self._fila.remove(bilhete)
+                self._condicao.notify_all()
+
+            espera = time.perf_counter() - inicio
+            self._admitidas += 1
+            if esperou:
+                self._esperas += 1
+            self._tempo_espera_total += espera
+            self._tempo_espera_max = max(self._tempo_espera_max, espera)
+        metricas.registrar_fase("fila_admissao", espera)
+
+    def _sair(self) -> None:
+        with self._condicao:
+            self._em_execucao -= 1
+            self._condicao.notify_all()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            voos = len(self._voos)
+            lideres, coalescidas, desistencias = self._lideres, self._coalescidas, self._desistencias
+        with self._condicao:
+            return {
+                "voos_em_andamento": voos,
+                "em_execucao": self._em_execucao,
+                "na_fila": len(self._fila),
+                "max_simultaneas": self.max_simultaneas,
+                "execucoes": lideres,
+                "coalescidas": coalescidas,
+                "desistencias": desistencias,
+                "admitidas": self._admitidas,
+                "admitidas_com_espera": self._esperas,
+                "espera_media_ms": (
+                    1000 * self._tempo_espera_total / self._admitidas if self._admitidas else 0.0
+                ),
+                "espera_max_ms": 1000 * self._tempo_espera_max,
+                "timeouts": self._timeouts,
+            }
+
+
+agendador = AgendadorConsultas(AGENDADOR_MAX_SIMULTANEAS, AGENDADOR_TIMEOUT_FILA)
+metricas.registrar_coletor("agendador", agendador.estatisticas)
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    from consultaBD import RepositorioPrincipal
+
+    parser = argparse.ArgumentParser(description="Simula uma rajada de sessões abrindo a mesma planta.")
+    parser.add_argument("--planta", required=True)
+    parser.add_argument("--loja", required=True)
+    parser.add_argument("--sessoes", type=int, default=20)
+    args = parser.parse_args()
+
+    repositorio = RepositorioPrincipal()
+    filtros = {"planta": args.planta, "loja": args.loja}
+
+    def sessao(_):
+        inicio = time.perf_counter()
+        repositorio.buscar_dados(filtros, usar_cache=False)
+        return time.perf_counter() - inicio
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with ThreadPoolExecutor(max_workers=args.sessoes) as executor:
+        tempos = sorted(executor.map(sessao, range(args.sessoes)))
+    print(f"{args.sessoes} sessões: p50 {tempos[len(tempos) // 2]:.2f}s, máx {tempos[-1]:.2f}s")
+    print(agendador.estatisticas())
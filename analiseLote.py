@@ -0,0 +1,214 @@
+# analiseLote.py
+# Gera o relatório de gaps de aftermarket para várias plantas sem passar pela interface.
+# Pensado para o cron / Agendador de Tarefas do Windows: cada planta é isolada (uma falha
+# não interrompe as demais) e a execução pode ser retomada de onde parou. O progresso vale só
+# para a execução em andamento: quando todas as plantas terminam sem erro o estado é encerrado
+# e a próxima execução agendada começa do zero.
+#
+# Exemplos:
+#   python analiseLote.py                           # todas as plantas do SA1010
+#   python analiseLote.py --plantas 000123 000456 --concorrencia 2
+#   python analiseLote.py --reiniciar               # ignora o progresso salvo
+import argparse
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from consultaBD import MOTORES, RepositorioPrincipal
+from exportacao import FORMATOS, exportar, exportar_consulta, lotes_de_dataframe
+from settings import LOTE_CONCORRENCIA, LOTE_SAIDA_PATH
+
+ARQUIVO_ESTADO = "estado_lote.json"
+ARQUIVO_RESUMO = "resumo_lote.csv"
+
+
+def _gravar_atomico(caminho: str, escrever) -> None:
+    # Grava em arquivo temporário e troca no fim: uma interrupção nunca deixa arquivo pela metade
+    raiz, extensao = os.path.splitext(caminho)
+    temporario = f"{raiz}.tmp{extensao}"  # Mantém a extensão (o pandas escolhe o formato por ela)
+    escrever(temporario)
+    os.replace(temporario, caminho)
+
+
+class EstadoLote:
+    def __init__(self, pasta: str, reiniciar: bool):
+        self.caminho = os.path.join(pasta, ARQUIVO_ESTADO)
+        self._lock = threading.Lock()
+        self.plantas = {}
+        self.execucao = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.concluido_em = None
+        if not reiniciar and os.path.exists(self.caminho):
+            with open(self.caminho, encoding="utf-8") as arquivo:
+                estado = json.load(arquivo)
+            # Só retoma uma execução interrompida ou com falhas; a concluída não vale para a próxima
+            if not estado.get("concluido_em"):
+                self.plantas = estado.get("plantas", {})
+                self.execucao = estado.get("execucao") or self.execucao
+
+    def concluida(self, planta: str) -> bool:
+        return self.plantas.get(planta, {}).get("status") == "ok"
+
+    def registrar(self, planta: str, registro: dict) -> None:
+        with self._lock:
+            self.plantas[planta] = registro
+            self._gravar()
+
+    def encerrar(self) -> None:
+        # Todas as plantas ok: a execução termina e o progresso deixa de ser retomado
+        with self._lock:
+            self.concluido_em = datetime.datetime.now().isoformat(timespec="seconds")
+            self._gravar()
+
+    def _gravar(self) -> None:
+        def escrever(caminho):
+            with open(caminho, "w", encoding="utf-8") as arquivo:
+                json.dump(
+                    {
+                        "execucao": self.execucao,
+                        "atualizado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+                        "concluido_em": self.concluido_em,
+                        "plantas": self.plantas,
+                    },
+                    arquivo,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+
+        _gravar_atomico(self.caminho, escrever)
+
+
+def processar_planta(
+    repositorio: RepositorioPrincipal,
+    planta: str,
+    loja: str,
+    pasta: str,
+    formato: str,
+    motor: str,
+) -> dict:
+    inicio = time.perf_counter()
+    registro = {"planta": planta, "loja": loja, "arquivo": None, "linhas": 0, "erro": None}
+    try:
+        loja_principal = loja or next(iter(repositorio.listar_lojas(planta)), None)
+        registro["loja"] = loja_principal
+        if not loja_principal:
+            raise ValueError(f"Planta {planta} não possui lojas ativas no SA1010.")
+
+        filtros = {"planta": planta, "loja": loja_principal}
+        caminho = os.path.join(pasta, f"aftermarket_{planta}.{formato}")
+        estatisticas = {}
+
+        def escrever(destino):
+            if motor == "sql":
+                # Do cursor direto para o arquivo, sem o limite de linhas da interface
+                estatisticas.update(exportar_consulta(repositorio, filtros, destino, formato))
+            else:
+                df = pd.DataFrame(repositorio.buscar_dados(filtros, usar_cache=False, motor=motor))
+                estatisticas.update(exportar(lotes_de_dataframe(df), destino, formato))
+
+        _gravar_atomico(caminho, escrever)
+        registro.update(
+            status="ok",
+            arquivo=caminho,
+            linhas=estatisticas["linhas"],
+            bytes_por_segundo=estatisticas["bytes_por_segundo"],
+        )
+    except Exception as e:
+        logging.error(f"Lote: falha na planta {planta}: {e}")
+        logging.error(traceback.format_exc())
+        registro.update(status="erro", erro=str(e))
+
+    registro["segundos"] = round(time.perf_counter() - inicio, 2)
+    registro["concluido_em"] = datetime.datetime.now().isoformat(timespec="seconds")
+    return registro
+
+
+def executar_lote(
+    plantas: list = None,
+    loja: str = None,
+    concorrencia: int = LOTE_CONCORRENCIA,
+    pasta: str = LOTE_SAIDA_PATH,
+    formato: str = "xlsx",
+    motor: str = "sql",
+    reiniciar: bool = False,
+    min_lojas: int = 1,
+    repositorio: RepositorioPrincipal = None,
+) -> list:
+    os.makedirs(pasta, exist_ok=True)
+    repositorio = repositorio or RepositorioPrincipal()
+    estado = EstadoLote(pasta, reiniciar)
+
+    if not plantas:
+        plantas = repositorio.listar_plantas(min_lojas=min_lojas)
+        logging.info(f"Lote: {len(plantas)} planta(s) descobertas no SA1010.")
+
+    pendentes = [planta for planta in plantas if not estado.concluida(planta)]
+    logging.info(
+        f"Lote {estado.execucao}: {len(plantas) - len(pendentes)} já concluída(s), "
+        f"{len(pendentes)} pendente(s), concorrência {concorrencia}."
+    )
+
+    # A concorrência limita quantas consultas pesadas o lote dispara ao mesmo tempo no ERP
+    with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="lote") as executor:
+        futuros = {
+            executor.submit(processar_planta, repositorio, planta, loja, pasta, formato, motor): planta
+            for planta in pendentes
+        }
+        for futuro in as_completed(futuros):
+            registro = futuro.result()
+            estado.registrar(futuros[futuro], registro)
+            logging.info(
+                f"Lote: planta {registro['planta']} -> {registro['status']} "
+                f"({registro['linhas']} linhas em {registro['segundos']}s)"
+            )
+
+    registros = [estado.plantas[planta] for planta in plantas if planta in estado.plantas]
+    if all(estado.concluida(planta) for planta in plantas):
+        estado.encerrar()
+    caminho_resumo = os.path.join(pasta, ARQUIVO_RESUMO)
+    _gravar_atomico(
+        caminho_resumo,
+        lambda c: pd.DataFrame(registros).to_csv(c, index=False, sep=";", encoding="utf-8-sig"),
+    )
+    logging.info(f"Lote: resumo gravado em {caminho_resumo}")
+    return registros
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Análise de aftermarket em lote por planta.")
+    parser.add_argument("--plantas", nargs="*", help="Códigos A1_COD; vazio = todas do SA1010.")
+    parser.add_argument("--loja", help="Loja principal; padrão: a primeira loja de cada planta.")
+    parser.add_argument("--min-lojas", type=int, default=1,
+                        help="Na descoberta, considera só clientes com ao menos N lojas.")
+    parser.add_argument("--concorrencia", type=int, default=LOTE_CONCORRENCIA)
+    parser.add_argument("--saida", default=LOTE_SAIDA_PATH)
+    parser.add_argument("--formato", choices=FORMATOS, default="xlsx")
+    parser.add_argument("--motor", choices=MOTORES, default="sql")
+    parser.add_argument("--reiniciar", action="store_true",
+                        help="Descarta o progresso salvo e processa todas as plantas de novo.")
+    args = parser.parse_args()
+
+    registros = executar_lote(
+        plantas=args.plantas,
+        loja=args.loja,
+        concorrencia=args.concorrencia,
+        pasta=args.saida,
+        formato=args.formato,
+        motor=args.motor,
+        reiniciar=args.reiniciar,
+        min_lojas=args.min_lojas,
+    )
+    falhas = [r for r in registros if r.get("status") != "ok"]
+    print(f"{len(registros) - len(falhas)} planta(s) ok, {len(falhas)} com erro.")
+    # Código de saída diferente de zero para o agendador sinalizar a falha
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,188 +1,75 @@
 # app.py
+# Módulos pesados (pandas, pyodbc via consultaBD, XlsxWriter, pyarrow...) são importados
+# dentro das funções que os usam: a primeira tela não espera por eles, e a thread de
+# aquecimento (inicializacao.py) já os carrega em segundo plano. Anotações ficam como texto.
+from __future__ import annotations
+
 import io
 import re
 import traceback
 import streamlit as st
-import pandas as pd
-from consultaBD import RepositorioPrincipal
+import inicializacao
+import metricas
+import perfilRequisicao
+from execucaoConsultas import ConsultaCancelada, submeter_consulta
 import os
 from datetime import datetime
-import tempfile
 import logging
 import time
-from settings import FOLDER_LOG_PATH_LOCAL
+from typing import TYPE_CHECKING
+from settings import DIARIO_EXCEL_PATH
 from settings import FOLDER_LOG_PATH
 from settings import SMTP_SERVER
 from settings import SMTP_PORT
 from settings import SMTP_USER
-import openpyxl
-import smtplib
-from email.message import EmailMessage
+from settings import CONSULTA_MOTOR
 
-# Configuração do sistema de logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
+if TYPE_CHECKING:
+    import pandas as pd
+    from consultaBD import RepositorioPrincipal
 
-# ---> Funções de Log CSV
-def encontra_ultimo_arquivo(folder_path, base_name):
-    try:
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-            logging.info(f"Diretório de log CSV criado: {folder_path}")
-        arquivos = os.listdir(folder_path)
-        arquivos_data = [
-            file
-            for file in arquivos
-            if re.match(f"^{re.escape(base_name)}(\\d+)\\.csv$", file, re.IGNORECASE)
-        ]
-        if not arquivos_data:
-            logging.info(f"Nenhum log CSV anterior encontrado para base: {base_name}")
-            return None
-        return max(
-            arquivos_data,
-            key=lambda x: int(
-                re.match(
-                    f"^{re.escape(base_name)}(\\d+)\\.csv$", x, re.IGNORECASE
-                ).group(1)
-            ),
-        )
-    except Exception as e:
-        logging.error(f"Erro ao encontrar último arquivo de log CSV: {e}")
-        return None
-
-def cria_proximo_arquivo(folder_path, base_name):
-    try:
-        ultimo_arquivo = encontra_ultimo_arquivo(folder_path, base_name)
-        ultimo_numero = (
-            int(
-                re.match(
-                    f"^{re.escape(base_name)}(\\d+)\\.csv$",
-                    ultimo_arquivo,
-                    re.IGNORECASE,
-                ).group(1)
-            )
-            if ultimo_arquivo
-            else 0
-        )
-        proximo_numero = ultimo_numero + 1
-        return os.path.join(folder_path, f"{base_name}{proximo_numero}.csv")
-    except Exception as e:
-        logging.error(f"Erro ao criar próximo nome de arquivo de log CSV: {e}")
-        return os.path.join(folder_path, f"{base_name}1.csv")  # Fallback
+# Logging, métricas e aquecimento: uma vez por processo, não a cada rerun
+inicializacao.iniciar()
 
+# ---> Log CSV de uso
 def criar_log_csv(quantidade_itens: int, usuario: str, folder_path: str):
-    base_name = "data"
+    # A gravação em folder_path (rede) é feita pelo escritor de auditoria em segundo plano
+    from escritorAuditoria import obter_escritor
+
     try:
         total_tempo_humano_por_item = 180
         tempo_bot_fixo_segundos = 20
 
-        df_log = pd.DataFrame(
-            {
-                "Usuario": [usuario],
-                "Rotina": "Vendas - After Market",
-                "Data/Hora": [time.strftime("%Y-%m-%d %H:%M:%S")],
-                "Quantidade de itens": [quantidade_itens],
-                "Tempo_humano(segundos)": [
-                    quantidade_itens * total_tempo_humano_por_item
-                ],
-                "Tempo_bot(segundos)": [tempo_bot_fixo_segundos],
-            }
-        )
-
-        caminho_do_log = cria_proximo_arquivo(
-            folder_path=folder_path, base_name=base_name
-        )
-
-        if not caminho_do_log:
-            logging.error("Erro: Não foi possível gerar um nome de arquivo de log CSV.")
-            return
-
-        df_log.to_csv(caminho_do_log, index=False, sep=";", encoding="utf-8-sig")
-        logging.info(f"Log CSV de uso salvo com sucesso em: {caminho_do_log}")
+        registro = {
+            "Usuario": usuario,
+            "Rotina": "Vendas - After Market",
+            "Data/Hora": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "Quantidade de itens": quantidade_itens,
+            "Tempo_humano(segundos)": quantidade_itens * total_tempo_humano_por_item,
+            "Tempo_bot(segundos)": tempo_bot_fixo_segundos,
+        }
+        with metricas.span("log_uso", linhas=quantidade_itens):
+            obter_escritor().enfileirar_uso(registro, pasta=folder_path)
+        logging.info(f"Log CSV de uso enfileirado para: {usuario}")
 
     except Exception as e:
-        logging.error(f"Erro ao salvar log CSV: {e}")
+        logging.error(f"Erro ao enfileirar log CSV: {e}")
         traceback.print_exc()
 
-# --- Função helper para verificar bloqueio ---
-def verificar_bloqueio_arquivo(
-    caminho_arquivo: str, tentativas: int = 5, espera: int = 2
-) -> bool:
-    if not os.path.exists(caminho_arquivo):
-        logging.info(
-            f"Arquivo de log Excel não existe em {caminho_arquivo}. Será criado."
-        )
-        return False
-
-    tentativa_atual = 0
-    while tentativa_atual < tentativas:
-        try:
-            os.rename(caminho_arquivo, caminho_arquivo)
-            logging.info(
-                f"Verificação de bloqueio: Arquivo {caminho_arquivo} está livre."
-            )
-            return False
-        except (IOError, OSError, PermissionError) as e:
-            if (
-                hasattr(e, "errno")
-                and (e.errno == 13 or e.errno == 32)
-                or isinstance(e, PermissionError)
-            ):
-                logging.warning(
-                    f"Verificação de bloqueio (tentativa {tentativa_atual + 1}/{tentativas}): "
-                    f"Arquivo {caminho_arquivo} está bloqueado. Tentando novamente em {espera}s..."
-                )
-                time.sleep(espera)
-                tentativa_atual += 1
-            else:
-                logging.error(
-                    f"Erro inesperado ao verificar bloqueio de {caminho_arquivo}: {e}"
-                )
-                raise
-
-    logging.error(
-        f"ARQUIVO BLOQUEADO: {caminho_arquivo} continua bloqueado após {tentativas} tentativas."
-    )
-    st.toast(
-        f"Não foi possível acessar a planilha '{os.path.basename(caminho_arquivo)}'. Verifique se alguém a está usando.",
-        icon="❌",
-    )
-    return True
-
 # --- Função para enviar as linhas selecionadas para o Excel ---
 def enviar_para_excel(df_selecionado: pd.DataFrame, loja_filtrada: str) -> None:
-    caminho_arquivo = os.path.normpath(FOLDER_LOG_PATH_LOCAL)
+    from diarioAuditoria import montar_registros_selecao
+    from escritorAuditoria import obter_escritor
+
+    caminho_arquivo = os.path.normpath(DIARIO_EXCEL_PATH)
     nome_aba = "Base - AfterMarket"
 
     if df_selecionado.empty:
         logging.info("Nenhuma linha selecionada para adicionar ao log Excel.")
         return
 
-    coluna_nf = f"Última NF {loja_filtrada}"
-    coluna_preco = f"Preço Venda {loja_filtrada}"
-
-    df_para_log_temp = df_selecionado.copy()
-    colunas_data_log = [
-        col for col in df_para_log_temp.columns if "NF" in col or "Previsão" in col
-    ]
-    for col in colunas_data_log:
-        if pd.api.types.is_datetime64_any_dtype(df_para_log_temp[col]):
-            df_para_log_temp[col] = df_para_log_temp[col].dt.strftime("%d/%m/%Y")
-        elif pd.api.types.is_object_dtype(df_para_log_temp[col]):
-            df_para_log_temp[col] = pd.to_datetime(
-                df_para_log_temp[col], errors="coerce"
-            ).dt.strftime("%d/%m/%Y")
-
-    df_para_log = pd.DataFrame()
     try:
-        df_para_log["PN Voss"] = df_para_log_temp["PN Voss"].astype(str)
-        df_para_log["PN Cliente"] = df_para_log_temp["PN Cliente"].astype(str)
-        df_para_log["Planta"] = df_para_log_temp["Planta"]
-        df_para_log["Loja"] = loja_filtrada
-        df_para_log["Ultima NF"] = df_para_log_temp[coluna_nf]
-        df_para_log["Preço atual"] = df_para_log_temp[coluna_preco]
-        df_para_log["Data"] = datetime.now().strftime("%d/%m/%Y")
+        df_para_log = montar_registros_selecao(df_selecionado, loja_filtrada)
     except KeyError as e:
         msg_erro = f"Erro de mapeamento no log. A coluna {e} (baseada na loja '{loja_filtrada}') não foi encontrada."
         logging.error(msg_erro)
@@ -192,69 +79,21 @@ def enviar_para_excel(df_selecionado: pd.DataFrame, loja_filtrada: str) -> None:
         st.error(f"Erro inesperado ao preparar dados para o log: {e}")
         return
 
-    caminho_diretorio = os.path.dirname(caminho_arquivo)
-    if not os.path.exists(caminho_diretorio):
-        try:
-            os.makedirs(caminho_diretorio, exist_ok=True)
-            logging.info(f"Diretório {caminho_diretorio} verificado/criado.")
-        except Exception as e_mkdir:
-            st.error(
-                f"Não foi possível criar o diretório de log: {caminho_diretorio}. Erro: {e_mkdir}"
-            )
-            return
-
-    logging.info(f"Iniciando verificação de bloqueio para: {caminho_arquivo}")
-
-    if verificar_bloqueio_arquivo(caminho_arquivo):
-        return
-
     try:
-        if os.path.exists(caminho_arquivo):
-            workbook = openpyxl.load_workbook(caminho_arquivo)
-        else:
-            workbook = openpyxl.Workbook()
-            if "Sheet" in workbook.sheetnames:
-                workbook.remove(workbook["Sheet"])
-
-        if nome_aba in workbook.sheetnames:
-            sheet = workbook[nome_aba]
-        else:
-            sheet = workbook.create_sheet(title=nome_aba)
-            headers = list(df_para_log.columns)
-            sheet.append(headers)
-
-        for _, row in df_para_log.iterrows():
-            row_data = list(row)
-            try:
-                pn_voss_idx = list(df_para_log.columns).index("PN Voss")
-                row_data[pn_voss_idx] = (
-                    str(row_data[pn_voss_idx])
-                    if row_data[pn_voss_idx] is not None
-                    else ""
-                )
-            except ValueError:
-                pass
-
-            try:
-                pn_cli_idx = list(df_para_log.columns).index("PN Cliente")
-                row_data[pn_cli_idx] = (
-                    str(row_data[pn_cli_idx])
-                    if row_data[pn_cli_idx] is not None
-                    else ""
-                )
-            except ValueError:
-                pass
-
-            sheet.append(row_data)
-
-        workbook.save(caminho_arquivo)
+        # Grava só as linhas selecionadas no diário e retorna; a planilha é reconstruída
+        # pelo escritor de auditoria em segundo plano (com nova tentativa se estiver aberta).
+        with metricas.span("log_excel", linhas=len(df_para_log)):
+            quantidade = obter_escritor().enfileirar_selecao(
+                df_para_log, usuario=st.session_state.get("nome_usuario")
+            )
         st.success(
-            f"{len(df_para_log)} linha(s) adicionada(s) ao log '{nome_aba}' com sucesso!"
+            f"{quantidade} linha(s) registrada(s) no log '{nome_aba}' com sucesso! "
+            f"A planilha {os.path.basename(caminho_arquivo)} será atualizada na próxima compactação."
         )
 
     except Exception as e:
-        st.error(f"Erro ao salvar no Excel (openpyxl): {e}")
-        logging.error(f"Erro ao salvar log Excel (openpyxl): {e}")
+        st.error(f"Erro ao registrar no diário de auditoria: {e}")
+        logging.error(f"Erro ao registrar no diário de auditoria: {e}")
 
 # --- Função para identificar o usuário
 def obter_nome_usuario() -> str:
@@ -309,46 +148,178 @@ def enviar_email_notificacao(
         return
 
     try:
-        porta_smtp_int = int(porta_smtp_str)
+        int(porta_smtp_str)
     except (ValueError, TypeError):
         st.error(f"Porta SMTP inválida: {porta_smtp_str}")
         return
 
-    temp_file_paths = []
     try:
-        if not df_principal.empty:
-             with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx", prefix="After_Market_Filtrado_") as tmp:
-                temp_file_paths.append(tmp.name)
-                df_principal.to_excel(tmp.name, index=False) # Simplificado para o exemplo
+        from filaEmail import montar_notificacao, obter_despachante
 
-        if not df_selecao.empty:
-             with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx", prefix="After_Market_Selecao_") as tmp:
-                temp_file_paths.append(tmp.name)
-                df_selecao.to_excel(tmp.name, index=False) # Simplificado para o exemplo
+        # Anexos renderizados em memória; o envio fica com a fila de e-mails (filaEmail.py)
+        with metricas.span("email_preparo", linhas=len(df_principal) + len(df_selecao)):
+            msg = montar_notificacao(
+                usuario_email, destinatario_principal, nome_do_usuario_logado, df_principal, df_selecao
+            )
 
-        # --- PREPARAÇÃO DO E-MAIL ---
-        msg = EmailMessage()
-        msg["Subject"] = f"Análise de After Market - {datetime.now().strftime('%d/%m/%Y')}"
-        msg["From"] = usuario_email
-        msg["To"] = destinatario_principal
-        msg["Cc"] = f"{nome_do_usuario_logado}@example.com"
+        # --- ENVIO (em segundo plano) ---
+        id_envio = obter_despachante().enfileirar(msg)
+        st.session_state.setdefault("emails_enviados", []).append(id_envio)
+        st.info(f"E-mail para {destinatario_principal} enfileirado para envio.")
 
-        msg.set_content("Segue em anexo o relatório de análise de After Market.\n\nAtenciosamente,\nBot")
+    except Exception as e:
+        st.error(f"Erro ao preparar e-mail: {e}")
+        logging.error(f"Erro email: {e}")
 
-        for path in temp_file_paths:
-            with open(path, 'rb') as f:
-                msg.add_attachment(f.read(), maintype='application', subtype='xlsx', filename=os.path.basename(path))
+# --- Status dos e-mails enfileirados nesta sessão ---
+def mostrar_status_emails():
+    from filaEmail import obter_despachante
+
+    pendentes = []
+    despachante = obter_despachante()
+    for id_envio in st.session_state.get("emails_enviados", []):
+        registro = despachante.status(id_envio)
+        if registro is None:
+            continue
+        if registro["status"] == "enviado":
+            st.toast(f"E-mail enviado para {registro['destinatario']}!", icon="✅")
+        elif registro["status"] == "falhou":
+            st.error(
+                f"Não foi possível enviar o e-mail para {registro['destinatario']}: {registro['erro']}"
+            )
+        else:
+            pendentes.append(id_envio)
+            if registro["status"] == "aguardando_nova_tentativa":
+                st.caption(
+                    f"E-mail para {registro['destinatario']}: nova tentativa em andamento "
+                    f"({registro['tentativas']} até agora)."
+                )
+    st.session_state["emails_enviados"] = pendentes
 
-        # --- ENVIO ---
-        with smtplib.SMTP(servidor_smtp, porta_smtp_int) as smtp:
-            smtp.send_message(msg)
+# --- Consulta ao ERP sem bloquear a interface ---
+def executar_consulta_nao_bloqueante(
+    repositorio: RepositorioPrincipal, filtros: dict, intervalo: float = 0.5
+):
+    # A consulta roda no executor de execucaoConsultas.py. Cada rerun do Streamlit
+    # (filtro alterado, clique em "Cancelar") reavalia a consulta guardada na sessão:
+    # se os filtros mudaram, a anterior foi superada e é cancelada no SQL Server.
+    # O resultado é uma ReferenciaResultado: os dados ficam uma única vez no armazém do
+    # processo (armazemResultados.py) e cada rerun recebe uma visão somente-leitura.
+    from agendadorConsultas import FilaEsgotadaError
+    from armazemResultados import armazem
+
+    consulta = st.session_state.get("consulta_em_andamento")
+    if consulta is not None and consulta.filtros != filtros:
+        if not consulta.concluida():
+            consulta.cancelar()
+        consulta = None
+    elif consulta is not None and consulta.bem_sucedida():
+        # Conjunto despejado do armazém (orçamento de memória): consulta de novo
+        if armazem.visao(consulta.resultado()) is None:
+            consulta = None
+
+    if consulta is None:
+        # Motor "planta" (padrão): a planta é buscada uma vez e a troca de loja principal ou
+        # de filtros vira operação em memória
+        perfilRequisicao.anotar(filtros=filtros, motor=CONSULTA_MOTOR)
+        consulta = submeter_consulta(
+            perfilRequisicao.envolver(repositorio.buscar_resultado), filtros, motor=CONSULTA_MOTOR
+        )
+        st.session_state["consulta_em_andamento"] = consulta
+
+    if not consulta.concluida():
+        area_status = st.empty()
+        if st.button("Cancelar consulta", key="cancelar_consulta"):
+            consulta.cancelar()
+            st.session_state.pop("consulta_em_andamento", None)
+            area_status.warning("Consulta cancelada.")
+            return None
 
-        st.success(f"E-mail enviado para {destinatario_principal}!")
+        while not consulta.concluida():
+            area_status.info(
+                f"Consultando o Protheus... {consulta.decorrido():.0f}s decorridos."
+            )
+            time.sleep(intervalo)
+        area_status.empty()
 
+    try:
+        referencia = consulta.resultado()
+    except ConsultaCancelada:
+        st.session_state.pop("consulta_em_andamento", None)
+        st.warning("Consulta cancelada.")
+        return None
+    except FilaEsgotadaError:
+        st.session_state.pop("consulta_em_andamento", None)
+        st.warning("O Protheus está com muitas consultas no momento. Tente novamente em instantes.")
+        return None
     except Exception as e:
-        st.error(f"Erro ao enviar e-mail: {e}")
-        logging.error(f"Erro email: {e}")
-    finally:
-        for path in temp_file_paths:
-            if os.path.exists(path):
-                os.remove(path)
\ No newline at end of file
+        st.session_state.pop("consulta_em_andamento", None)
+        st.error(f"Erro ao consultar o banco de dados: {e}")
+        return None
+
+    # A consulta concluída fica na sessão: reruns com os mesmos filtros não voltam ao banco
+    logging.info(f"Consulta concluída em {consulta.decorrido():.1f}s: {filtros}")
+    return armazem.visao(referencia)
+
+# --- Download dos dados completos (exportação em streaming) ---
+TIPOS_MIME = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def preparar_download_completo(
+    repositorio: RepositorioPrincipal, filtros: dict, formato: str = "xlsx"
+):
+    # As linhas vão do cursor para o arquivo em lotes; só o arquivo final fica em memória
+    from exportacao import exportar_consulta
+
+    buffer = io.BytesIO()
+    try:
+        with metricas.span("download", formato=formato, planta=filtros.get("planta")):
+            estatisticas = exportar_consulta(repositorio, filtros, buffer, formato)
+    except Exception as e:
+        st.error(f"Erro ao exportar os dados: {e}")
+        logging.error(f"Erro ao exportar os dados: {e}")
+        return None
+    logging.info(
+        f"Download {formato}: {estatisticas['linhas']} linhas, "
+        f"{estatisticas['bytes_por_segundo'] / 1024:.0f} KB/s"
+    )
+    nome_arquivo = f"After_Market_{filtros.get('planta')}_{datetime.now():%Y%m%d}.{formato}"
+    return buffer.getvalue(), nome_arquivo, TIPOS_MIME[formato]
+
+# --- Perfil sob demanda (perfilRequisicao.py) ---
+def iniciar_perfil():
+    # ?perfil=1 (ou PERFIL_ATIVO=1) para usuários de PERFIL_ADMINS; desligado, devolve None
+    return perfilRequisicao.iniciar(
+        st.query_params, lambda: st.session_state.get("nome_usuario") or obter_nome_usuario()
+    )
+
+
+def exibir_perfil(artefato) -> None:
+    # artefato: retorno de perfilRequisicao.finalizar
+    if artefato is None:
+        return
+    nome, conteudo, resumo = artefato
+    st.caption(
+        f"Perfil do rerun: {resumo['duracao_ms']:.0f} ms, "
+        f"{resumo['memoria_alocada_bytes'] / 1024 / 1024:.1f} MB alocados."
+    )
+    st.download_button("Baixar perfil (cProfile, flamegraph, tracemalloc)", conteudo, nome, "application/zip")
+
+
+# O perfil mede só o que roda dentro deste try. Este arquivo define as funções da tela
+# (executar_consulta_nao_bloqueante, enviar_para_excel, preparar_download_completo...), mas o
+# corpo que as chama não está aqui: ele entra no perfil quando for chamado dentro do try. Hoje o
+# perfil cobre só o fim do script; para perfilar uma consulta real, use
+# "python perfilRequisicao.py". st.stop() e st.rerun() interrompem o script com exceção; o
+# finally encerra o perfil e o libera mesmo assim.
+perfil_rerun = iniciar_perfil()
+try:
+    # Fim da primeira execução do script no processo (tempo até a primeira tela)
+    inicializacao.marcar("primeiro_render")
+finally:
+    artefato_perfil = perfilRequisicao.finalizar(perfil_rerun)
+exibir_perfil(artefato_perfil)
@@ -0,0 +1,263 @@
+# armazemResultados.py
+# Armazém de resultados do processo. Antes, cada sessão do Streamlit guardava a sua lista de
+# dicts de buscar_dados (e os DataFrames derivados): 30 pessoas olhando a mesma planta eram 30
+# cópias. Aqui cada conjunto de dados distinto fica uma única vez, em colunas tipadas
+# (resultadoColunar.py: datas datetime64, números float, nomes repetidos como categoria), e a
+# sessão guarda só uma ReferenciaResultado. A cada rerun a sessão pede uma visão: DataFrame
+# raso sobre as mesmas colunas; com o Copy-on-Write do pandas qualquer alteração na visão copia
+# só a coluna alterada e o conjunto compartilhado não muda. No pandas 3 ele é sempre ativo; no
+# 2.x este módulo o liga ao ser importado (opção global do processo).
+#
+# Deduplicação: a chave é a dos filtros (consultaBD._chave_filtros + motor), mas o conjunto é
+# identificado pela impressão digital do conteúdo; filtros diferentes com o mesmo resultado
+# (ex.: motores "sql" e "local") apontam para o mesmo conjunto.
+#
+# Orçamento: ARMAZEM_MAX_MB por processo. Ao passar do limite saem primeiro os conjuntos
+# expirados (ARMAZEM_TTL_SEGUNDOS) e depois os menos usados; a sessão cuja referência foi
+# despejada refaz a consulta no próximo rerun. Conjunto maior que o orçamento inteiro não
+# entra no armazém: a referência leva o próprio DataFrame (cópia só daquela sessão).
+#
+# Exemplo:
+#   python armazemResultados.py --planta 000123 --loja 01 --sessoes 30
+import argparse
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import metricas
+from resultadoColunar import ConstrutorColunar
+from settings import ARMAZEM_MAX_MB, ARMAZEM_TTL_SEGUNDOS
+
+if int(pd.__version__.split(".")[0]) < 3:
+    # Sem isto, no pandas 2.x uma alteração in-place na visão altera o conjunto de todas as sessões
+    pd.options.mode.copy_on_write = True
+
+
+class ReferenciaResultado:
+    # O que a sessão guarda: a chave dos filtros e a impressão do conjunto no armazém
+    def __init__(self, chave: tuple, impressao: str, linhas: int, avulso: pd.DataFrame = None):
+        self.chave = chave
+        self.impressao = impressao
+        self.linhas = linhas
+        self._avulso = avulso  # Só para conjuntos maiores que o orçamento
+
+    def __repr__(self) -> str:
+        return f"ReferenciaResultado({dict(self.chave)}, {self.impressao[:12]}, {self.linhas} linhas)"
+
+
+class _Conjunto:
+    def __init__(self, frame: pd.DataFrame, tamanho: int, expira_em: float):
+        self.frame = frame
+        self.tamanho = tamanho
+        self.expira_em = expira_em
+        self.criado_em = time.time()
+        self.chaves = set()
+        self.visoes = 0
+
+
+def compactar(dados) -> pd.DataFrame:
+    # Lista de dicts (buscar_dados) -> DataFrame em colunas tipadas, sem DataFrame intermediário
+    if isinstance(dados, pd.DataFrame):
+        return dados
+    dados = list(dados)
+    if not dados:
+        return pd.DataFrame()
+    colunas = list(dados[0])
+    construtor = ConstrutorColunar(colunas)
+    construtor.adicionar([tuple(linha[c] for c in colunas) for linha in dados])
+    return construtor.dataframe()
+
+
+def impressao_digital(frame: pd.DataFrame) -> str:
+    # Hash das colunas (nomes e ordem) e dos valores linha a linha
+    resumo = hashlib.blake2b(digest_size=16)
+    resumo.update("\x1f".join(map(str, frame.columns)).encode("utf-8"))
+    if len(frame.columns) and len(frame):
+        resumo.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return resumo.hexdigest()
+
+
+class ArmazemResultados:
+    def __init__(self, max_bytes: int, ttl_segundos: float):
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self._conjuntos = OrderedDict()  # impressao -> _Conjunto (ordem de uso)
+        self._chaves = {}  # chave dos filtros -> impressao
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._acertos = 0
+        self._falhas = 0
+        self._deduplicados = 0
+        self._despejados = 0
+        self._grandes_demais = 0
+
+    def obter(self, chave: tuple):
+        # Referência para os filtros, se o conjunto ainda está no armazém e não expirou
+        with self._lock:
+            impressao = self._chaves.get(chave)
+            conjunto = self._conjuntos.get(impressao) if impressao is not None else None
+            if conjunto is None or conjunto.expira_em <= time.monotonic():
+                self._falhas += 1
+                return None
+            self._conjuntos.move_to_end(impressao)
+            self._acertos += 1
+            return ReferenciaResultado(chave, impressao, len(conjunto.frame))
+
+    def guardar(self, chave: tuple, dados) -> ReferenciaResultado:
+        frame = compactar(dados)
+        impressao = impressao_digital(frame)
+        tamanho = int(frame.memory_usage(deep=True).sum())
+        if tamanho > self.max_bytes:
+            logging.info(
+                f"Armazém de resultados: conjunto de {tamanho} bytes excede o limite de "
+                f"{self.max_bytes} bytes; fica só com a sessão que o consultou."
+            )
+            with self._lock:
+                self._grandes_demais += 1
+            return ReferenciaResultado(chave, impressao, len(frame), avulso=frame)
+
+        with self._lock:
+            self._desassociar(chave)
+            conjunto = self._conjuntos.get(impressao)
+            if conjunto is not None:
+                self._deduplicados += 1
+                self._conjuntos.move_to_end(impressao)
+            else:
+                conjunto = _Conjunto(frame, tamanho, time.monotonic() + self.ttl_segundos)
+                self._conjuntos[impressao] = conjunto
+                self._bytes += tamanho
+            conjunto.expira_em = time.monotonic() + self.ttl_segundos
+            conjunto.chaves.add(chave)
+            self._chaves[chave] = impressao
+            self._despejar(manter=impressao)
+        return ReferenciaResultado(chave, impressao, len(frame))
+
+    def visao(self, referencia: ReferenciaResultado):
+        # DataFrame somente-leitura (Copy-on-Write) sobre o conjunto; None se foi despejado
+        if referencia._avulso is not None:
+            return referencia._avulso
+        with self._lock:
+            conjunto = self._conjuntos.get(referencia.impressao)
+            if conjunto is None:
+                return None
+            self._conjuntos.move_to_end(referencia.impressao)
+            conjunto.visoes += 1
+            frame = conjunto.frame
+        return frame.copy(deep=False)
+
+    def invalidar(self, filtro=None) -> int:
+        # Sem filtro limpa tudo; com filtro remove as chaves para as quais filtro(chave) é verdadeiro
+        with self._lock:
+            chaves = [chave for chave in self._chaves if filtro is None or filtro(chave)]
+            for chave in chaves:
+                self._desassociar(chave)
+        logging.info(f"Armazém de resultados: {len(chaves)} chave(s) invalidada(s).")
+        return len(chaves)
+
+    def _desassociar(self, chave: tuple) -> None:
+        # Conjunto sem nenhuma chave apontando para ele sai do armazém
+        impressao = self._chaves.pop(chave, None)
+        conjunto = self._conjuntos.get(impressao) if impressao is not None else None
+        if conjunto is None:
+            return
+        conjunto.chaves.discard(chave)
+        if not conjunto.chaves:
+            self._remover(impressao)
+
+    def _remover(self, impressao: str) -> None:
+        conjunto = self._conjuntos.pop(impressao)
+        self._bytes -= conjunto.tamanho
+        for chave in conjunto.chaves:
+            self._chaves.pop(chave, None)
+
+    def _despejar(self, manter: str) -> None:
+        # Expirados primeiro, depois os menos usados (início da OrderedDict)
+        if self._bytes <= self.max_bytes:
+            return
+        agora = time.monotonic()
+        ordem = [i for i, c in self._conjuntos.items() if c.expira_em <= agora]
+        ordem += [i for i in self._conjuntos if i not in ordem]
+        for impressao in ordem:
+            if self._bytes <= self.max_bytes:
+                break
+            if impressao == manter:
+                continue
+            self._remover(impressao)
+            self._despejados += 1
+
+    def conjuntos(self) -> list:
+        # Um item por conjunto: filtros que apontam para ele, tamanho e uso
+        agora = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "impressao": impressao,
+                    "chaves": [dict(chave) for chave in conjunto.chaves],
+                    "linhas": len(conjunto.frame),
+                    "colunas": len(conjunto.frame.columns),
+                    "bytes": conjunto.tamanho,
+                    "visoes": conjunto.visoes,
+                    "idade_segundos": round(time.time() - conjunto.criado_em, 1),
+                    "expirado": conjunto.expira_em <= agora,
+                }
+                for impressao, conjunto in self._conjuntos.items()
+            ]
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            consultas = self._acertos + self._falhas
+            return {
+                "conjuntos": len(self._conjuntos),
+                "chaves": len(self._chaves),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "acertos": self._acertos,
+                "falhas": self._falhas,
+                "taxa_acerto": self._acertos / consultas if consultas else 0.0,
+                "deduplicados": self._deduplicados,
+                "despejados": self._despejados,
+                "grandes_demais": self._grandes_demais,
+            }
+
+
+armazem = ArmazemResultados(int(ARMAZEM_MAX_MB * 1024 * 1024), ARMAZEM_TTL_SEGUNDOS)
+metricas.registrar_coletor("armazem_resultados", armazem.estatisticas)
+
+
+if __name__ == "__main__":
+    import tracemalloc
+
+    from consultaBD import RepositorioPrincipal
+
+    parser = argparse.ArgumentParser(description="Compara N sessões com cópia própria x armazém compartilhado.")
+    parser.add_argument("--planta", required=True)
+    parser.add_argument("--loja", required=True)
+    parser.add_argument("--sessoes", type=int, default=30)
+    args = parser.parse_args()
+
+    repositorio = RepositorioPrincipal()
+    filtros = {"planta": args.planta, "loja": args.loja}
+    dados = repositorio.buscar_dados(filtros, usar_cache=False)
+
+    tracemalloc.start()
+    copias = [pd.DataFrame(dados) for _ in range(args.sessoes)]
+    _, pico_copias = tracemalloc.get_traced_memory()
+    del copias
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    referencias = [repositorio.buscar_resultado(filtros) for _ in range(args.sessoes)]
+    visoes = [armazem.visao(r) for r in referencias]
+    _, pico_armazem = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{len(dados)} linhas, {args.sessoes} sessões")
+    print(f"cópia por sessão: {pico_copias / 1024 / 1024:.1f} MB")
+    print(f"armazém:          {pico_armazem / 1024 / 1024:.1f} MB")
+    print(armazem.estatisticas())
+    for conjunto in armazem.conjuntos():
+        print(conjunto)
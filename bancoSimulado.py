@@ -0,0 +1,390 @@
+# bancoSimulado.py
+# Banco local que imita as tabelas do Protheus (SA1010, SA7010, SD2010, SC4010) sobre SQLite.
+# Traduz o dialeto T-SQL usado pelo repositório e expõe a mesma API de conexão/cursor do
+# pyodbc, para rodar RepositorioPrincipal fora da produção (benchmarks e testes de carga).
+import datetime
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+
+# --- Tradução T-SQL -> SQLite ---
+_RE_COMENTARIO = re.compile(r"--[^\n]*")
+_RE_TOP = re.compile(r"\bSELECT\s+TOP\s*(\(\s*\?\d+\s*\)|\(\s*\d+\s*\)|\d+)", re.IGNORECASE)
+_RE_CAST = re.compile(r"\b(TRY_CAST|CAST)\s*\(", re.IGNORECASE)
+_RE_DATA_ISO = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_RE_DECLARE = re.compile(r"\bDECLARE\b(.*?);", re.IGNORECASE | re.DOTALL)
+_RE_VARIAVEL = re.compile(r"@(\w+)\s+[^=]+?=\s*(\?\d+)")
+
+
+def _fechamento(sql: str, abertura: int) -> int:
+    # Índice do ')' que fecha o '(' em sql[abertura]
+    nivel = 0
+    em_texto = False
+    for i in range(abertura, len(sql)):
+        c = sql[i]
+        if c == "'":
+            em_texto = not em_texto
+        elif not em_texto and c == "(":
+            nivel += 1
+        elif not em_texto and c == ")":
+            nivel -= 1
+            if nivel == 0:
+                return i
+    raise ValueError("Parênteses desbalanceados na consulta.")
+
+
+def _abertura(sql: str, posicao: int) -> int:
+    # Índice do '(' ainda aberto antes de sql[posicao] (-1 no nível zero)
+    nivel = 0
+    em_texto = False
+    for i in range(posicao - 1, -1, -1):
+        c = sql[i]
+        if c == "'":
+            em_texto = not em_texto
+        elif not em_texto and c == ")":
+            nivel += 1
+        elif not em_texto and c == "(":
+            if nivel == 0:
+                return i
+            nivel -= 1
+    return -1
+
+
+def _separar_as(conteudo: str) -> tuple:
+    # Divide 'expr AS tipo' no último AS de nível zero
+    nivel = 0
+    posicao = -1
+    for m in re.finditer(r"\(|\)|\bAS\b", conteudo, re.IGNORECASE):
+        token = m.group(0)
+        if token == "(":
+            nivel += 1
+        elif token == ")":
+            nivel -= 1
+        elif nivel == 0:
+            posicao = m.start()
+    if posicao < 0:
+        raise ValueError(f"CAST sem AS: {conteudo}")
+    return conteudo[:posicao].strip(), conteudo[posicao + 2 :].strip()
+
+
+def _traduzir_casts(sql: str) -> str:
+    inicio = 0
+    while True:
+        m = _RE_CAST.search(sql, inicio)
+        if not m:
+            return sql
+        abertura = m.end() - 1
+        fechamento = _fechamento(sql, abertura)
+        expressao, tipo = _separar_as(sql[abertura + 1 : fechamento])
+        expressao = _traduzir_casts(expressao)
+        tipo_upper = tipo.upper()
+        if tipo_upper == "DATE":
+            novo = f"TO_DATE({expressao})"
+        elif tipo_upper.startswith("DECIMAL") or tipo_upper.startswith("NUMERIC"):
+            casas = re.search(r",\s*(\d+)", tipo)
+            novo = f"ROUND(CAST({expressao} AS REAL), {casas.group(1) if casas else 0})"
+        else:
+            novo = f"CAST({expressao} AS {tipo})"
+        sql = sql[: m.start()] + novo + sql[fechamento + 1 :]
+        inicio = m.start() + len(novo)
+
+
+def _numerar_parametros(sql: str) -> str:
+    # '?' posicionais viram '?N' para que o TOP possa ser movido para o LIMIT
+    partes = sql.split("?")
+    return "".join(
+        parte + (f"?{i + 1}" if i < len(partes) - 1 else "")
+        for i, parte in enumerate(partes)
+    )
+
+
+def _traduzir_variaveis(sql: str) -> str:
+    # SQLite não tem variáveis: 'DECLARE @x tipo = ?N;' sai e cada @x vira o parâmetro ?N
+    m = _RE_DECLARE.search(sql)
+    if not m:
+        return sql
+    variaveis = dict(_RE_VARIAVEL.findall(m.group(1)))
+    sql = sql[: m.start()] + sql[m.end() :]
+    return re.sub(r"@(\w+)", lambda v: variaveis.get(v.group(1), v.group(0)), sql)
+
+
+def traduzir_sql(sql: str) -> str:
+    sql = _RE_COMENTARIO.sub("", sql)
+    sql = _numerar_parametros(sql)
+    sql = _traduzir_variaveis(sql)
+    sql = sql.replace("[dbo].", "")
+    sql = re.sub(r"\bISNULL\s*\(", "IFNULL(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bDATEDIFF\s*\(\s*DAY\s*,", "DATEDIFF_DIAS(", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bOPENJSON\s*\(", "json_each(", sql, flags=re.IGNORECASE)
+    sql = _traduzir_casts(sql)
+
+    limite = None
+    m = _RE_TOP.search(sql)
+    while m:
+        abertura = _abertura(sql, m.start())
+        if abertura < 0:
+            # TOP do SELECT principal: LIMIT no fim do comando
+            limite = m.group(1).strip("() ")
+            sql = sql[: m.start()] + "SELECT" + sql[m.end() :]
+        else:
+            # TOP dentro de subconsulta/CTE: LIMIT antes do ')' que a fecha
+            fechamento = _fechamento(sql, abertura)
+            sql = (
+                sql[: m.start()] + "SELECT" + sql[m.end() : fechamento]
+                + f" LIMIT {m.group(1).strip('() ')}\n" + sql[fechamento:]
+            )
+        m = _RE_TOP.search(sql)
+    sql = sql.strip().rstrip(";")
+    if limite:
+        sql += f"\nLIMIT {limite}"
+    return sql
+
+
+# --- Funções T-SQL registradas no SQLite ---
+_data_referencia = None  # Permite fixar "hoje" para resultados reproduzíveis
+
+
+def _hoje() -> datetime.date:
+    return _data_referencia or datetime.date.today()
+
+
+def _para_data(valor):
+    if valor is None or valor == "":
+        return None
+    texto = str(valor).strip()
+    try:
+        if len(texto) == 8 and texto.isdigit():
+            return datetime.date(int(texto[:4]), int(texto[4:6]), int(texto[6:8]))
+        return datetime.date.fromisoformat(texto[:10])
+    except ValueError:
+        return None
+
+
+def _sql_to_date(valor):
+    data = _para_data(valor)
+    return data.isoformat() if data else None
+
+
+def _sql_getdate():
+    return _hoje().isoformat() + " " + datetime.datetime.now().strftime("%H:%M:%S")
+
+
+def _sql_datediff_dias(inicio, fim):
+    inicio, fim = _para_data(inicio), _para_data(fim)
+    if inicio is None or fim is None:
+        return None
+    return (fim - inicio).days
+
+
+def _converter_valor(valor):
+    if isinstance(valor, str) and _RE_DATA_ISO.match(valor):
+        return datetime.date.fromisoformat(valor)
+    return valor
+
+
+class ErroSimulado(Exception):
+    pass
+
+
+class CursorSimulado:
+    def __init__(self, conexao):
+        self._conexao = conexao
+        self._cursor = conexao._sqlite.cursor()
+        self.description = None
+        self.rowcount = -1
+
+    def execute(self, sql, parametros=None):
+        traduzida = traduzir_sql(sql)
+        try:
+            self._cursor.execute(traduzida, list(parametros or []))
+        except sqlite3.Error as e:
+            raise ErroSimulado("42000", f"{e} -- SQL traduzido: {traduzida}") from e
+        self.description = self._cursor.description
+        self.rowcount = self._cursor.rowcount
+        return self
+
+    def _converter(self, linhas):
+        return [tuple(_converter_valor(v) for v in linha) for linha in linhas]
+
+    def fetchall(self):
+        return self._converter(self._cursor.fetchall())
+
+    def fetchmany(self, tamanho=1):
+        return self._converter(self._cursor.fetchmany(tamanho))
+
+    def fetchone(self):
+        linha = self._cursor.fetchone()
+        return None if linha is None else self._converter([linha])[0]
+
+    def cancel(self):
+        self._conexao._sqlite.interrupt()
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoSimulada:
+    def __init__(self, caminho: str, latencia_conexao: float = 0.0):
+        if latencia_conexao:
+            threading.Event().wait(latencia_conexao)  # Simula o handshake/login
+        self._sqlite = sqlite3.connect(caminho, check_same_thread=False, timeout=30)
+        self._sqlite.create_function("TO_DATE", 1, _sql_to_date, deterministic=True)
+        self._sqlite.create_function("GETDATE", 0, _sql_getdate)
+        self._sqlite.create_function("DATEDIFF_DIAS", 2, _sql_datediff_dias, deterministic=True)
+
+    def cursor(self):
+        return CursorSimulado(self)
+
+    def commit(self):
+        self._sqlite.commit()
+
+    def rollback(self):
+        self._sqlite.rollback()
+
+    def close(self):
+        self._sqlite.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        # Mesma semântica do pyodbc: commit/rollback na saída, sem fechar a conexão
+        if tipo is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+def fabrica_conexao(caminho: str, latencia_conexao: float = 0.0):
+    return lambda: ConexaoSimulada(caminho, latencia_conexao)
+
+
+# --- Geração de dados sintéticos ---
+ESQUEMA = """
+    CREATE TABLE SA1010 (
+        A1_COD TEXT, A1_LOJA TEXT, A1_NOME TEXT, A1_NREDUZ TEXT,
+        D_E_L_E_T_ TEXT DEFAULT ' ', R_E_C_N_O_ INTEGER PRIMARY KEY
+    );
+    CREATE TABLE SA7010 (
+        A7_CLIENTE TEXT, A7_LOJA TEXT, A7_PRODUTO TEXT, A7_CODCLI TEXT, A7_XPRCLIQ REAL,
+        D_E_L_E_T_ TEXT DEFAULT ' ', R_E_C_N_O_ INTEGER PRIMARY KEY
+    );
+    CREATE TABLE SD2010 (
+        D2_COD TEXT, D2_CLIENTE TEXT, D2_LOJA TEXT, D2_EMISSAO TEXT, D2_QUANT REAL,
+        D_E_L_E_T_ TEXT DEFAULT ' ', R_E_C_N_O_ INTEGER PRIMARY KEY
+    );
+    CREATE TABLE SC4010 (
+        C4_PRODUTO TEXT, C4_CLIENTE TEXT, C4_LOJA TEXT, C4_DATA TEXT, C4_QUANT REAL,
+        D_E_L_E_T_ TEXT DEFAULT ' ', R_E_C_N_O_ INTEGER PRIMARY KEY
+    );
+    CREATE INDEX IX_SA1_COD ON SA1010 (A1_COD, A1_LOJA);
+    CREATE INDEX IX_SA7_CLI ON SA7010 (A7_CLIENTE, A7_LOJA);
+    CREATE INDEX IX_SD2_CLI ON SD2010 (D2_CLIENTE);
+    CREATE INDEX IX_SC4_CLI ON SC4010 (C4_CLIENTE);
+"""
+
+
+def _data_protheus(data: datetime.date) -> str:
+    return data.strftime("%Y%m%d")
+
+
+def gerar_base(
+    caminho: str,
+    plantas: int = 3,
+    lojas_por_planta: int = 5,
+    produtos_por_planta: int = 200,
+    linhas_nf: int = 20000,
+    linhas_previsao: int = 2000,
+    semente: int = 42,
+) -> dict:
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+    aleatorio = random.Random(semente)
+    hoje = _hoje()
+    conexao = sqlite3.connect(caminho)
+    conexao.executescript(ESQUEMA)
+
+    codigos_plantas = [f"{100000 + i:06d}" for i in range(plantas)]
+    sa1, sa7, sd2, sc4 = [], [], [], []
+    produtos_por_codigo = {}
+
+    for indice, planta in enumerate(codigos_plantas):
+        nome = f"MONTADORA {indice + 1} LTDA"
+        lojas = [f"{n + 1:02d}" for n in range(lojas_por_planta)]
+        for loja in lojas:
+            sa1.append((planta, loja, nome, f"PLANTA {indice + 1}-{loja}"))
+
+        produtos = [f"VS{indice:02d}{n:07d}" for n in range(produtos_por_planta)]
+        produtos_por_codigo[planta] = (lojas, produtos)
+        for produto in produtos:
+            pn_cliente = f"{aleatorio.randint(10, 99)} {aleatorio.randint(100000, 999999)}"
+            # Cada produto é cadastrado na maioria das lojas, com preço por loja
+            for loja in lojas:
+                if aleatorio.random() < 0.8:
+                    sa7.append(
+                        (planta, loja, produto, pn_cliente, round(aleatorio.uniform(5, 500), 4))
+                    )
+
+    for _ in range(linhas_nf):
+        planta = aleatorio.choice(codigos_plantas)
+        lojas, produtos = produtos_por_codigo[planta]
+        emissao = hoje - datetime.timedelta(days=aleatorio.randint(0, 5 * 365))
+        sd2.append(
+            (
+                aleatorio.choice(produtos),
+                planta,
+                aleatorio.choice(lojas),
+                _data_protheus(emissao),
+                aleatorio.randint(1, 500),
+            )
+        )
+
+    for _ in range(linhas_previsao):
+        planta = aleatorio.choice(codigos_plantas)
+        lojas, produtos = produtos_por_codigo[planta]
+        data = hoje + datetime.timedelta(days=aleatorio.randint(-365, 365))
+        sc4.append(
+            (
+                aleatorio.choice(produtos),
+                planta,
+                aleatorio.choice(lojas),
+                _data_protheus(data),
+                aleatorio.randint(1, 1000),
+            )
+        )
+
+    conexao.executemany(
+        "INSERT INTO SA1010 (A1_COD, A1_LOJA, A1_NOME, A1_NREDUZ) VALUES (?, ?, ?, ?)", sa1
+    )
+    conexao.executemany(
+        "INSERT INTO SA7010 (A7_CLIENTE, A7_LOJA, A7_PRODUTO, A7_CODCLI, A7_XPRCLIQ) "
+        "VALUES (?, ?, ?, ?, ?)",
+        sa7,
+    )
+    conexao.executemany(
+        "INSERT INTO SD2010 (D2_COD, D2_CLIENTE, D2_LOJA, D2_EMISSAO, D2_QUANT) "
+        "VALUES (?, ?, ?, ?, ?)",
+        sd2,
+    )
+    conexao.executemany(
+        "INSERT INTO SC4010 (C4_PRODUTO, C4_CLIENTE, C4_LOJA, C4_DATA, C4_QUANT) "
+        "VALUES (?, ?, ?, ?, ?)",
+        sc4,
+    )
+    conexao.commit()
+    conexao.close()
+
+    resumo = {
+        "plantas": codigos_plantas,
+        "SA1010": len(sa1),
+        "SA7010": len(sa7),
+        "SD2010": len(sd2),
+        "SC4010": len(sc4),
+    }
+    logging.info(f"Base simulada gerada em {caminho}: {resumo}")
+    return resumo
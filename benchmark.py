@@ -0,0 +1,231 @@
+# benchmark.py
+# Mede buscar_dados contra uma base simulada do Protheus (bancoSimulado.py) em vários
+# pontos de escala e grava os resultados em JSON para comparação entre versões.
+#
+# Exemplos:
+#   python benchmark.py
+#   python benchmark.py --escalas 2:5:500:50000 10:20:2000:500000 --motores sql local
+#   python benchmark.py --comparar resultados_benchmark/benchmark_20260101_120000.json
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import bancoSimulado
+import modelosConsulta
+from consultaBD import MOTORES, RepositorioPrincipal
+from snapshotProtheus import SnapshotProtheus
+
+# plantas:lojas_por_planta:produtos_por_planta:linhas_nf
+ESCALAS_PADRAO = ["2:3:200:20000", "4:8:500:100000", "4:20:1000:300000"]
+
+
+def _percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p / 100
+    inferior = int(k)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (k - inferior)
+
+
+def _versao() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or "desconhecida"
+    except OSError:
+        return "desconhecida"
+
+
+def contar_parametros(repositorio: RepositorioPrincipal, filtros: dict, motor: str) -> int:
+    # Parâmetros enviados ao SQL Server em uma chamada (o limite do SQL Server é 2100 por comando).
+    # Os modelos têm quantidade fixa, independente da quantidade de lojas e dos filtros.
+    if motor == "snapshot":
+        return 0
+    if motor == "sql":
+        return len(modelosConsulta.PRODUTOS_LOJAS.variaveis)
+    if motor == "planta":
+        # Só na carga da planta; as trocas de loja/filtro seguintes não vão ao banco
+        return sum(
+            len(modelo.variaveis)
+            for modelo in (
+                modelosConsulta.LOJAS_PLANTA,
+                modelosConsulta.NOMES_LOJAS,
+                modelosConsulta.PRODUTOS_PLANTA,
+                modelosConsulta.DATAS_NF,
+                modelosConsulta.PREVISOES,
+                modelosConsulta.PRECOS,
+            )
+        )
+    # lojas + nomes das lojas + produtos + NF + previsões + preços
+    return sum(
+        len(modelo.variaveis)
+        for modelo in (
+            modelosConsulta.LOJAS_PLANTA,
+            modelosConsulta.NOMES_LOJAS,
+            modelosConsulta.PRODUTOS,
+            modelosConsulta.DATAS_NF,
+            modelosConsulta.PREVISOES,
+            modelosConsulta.PRECOS,
+        )
+    )
+
+
+def medir_escala(escala: str, motores: list, repeticoes: int, latencia_conexao: float) -> list:
+    plantas, lojas, produtos, linhas_nf = (int(parte) for parte in escala.split(":"))
+    resultados = []
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_aftermarket_") as pasta:
+        caminho_base = os.path.join(pasta, "protheus.db")
+        inicio = time.perf_counter()
+        base = bancoSimulado.gerar_base(
+            caminho_base,
+            plantas=plantas,
+            lojas_por_planta=lojas,
+            produtos_por_planta=produtos,
+            linhas_nf=linhas_nf,
+            linhas_previsao=max(1000, linhas_nf // 10),
+        )
+        logging.info(f"Base {escala} gerada em {time.perf_counter() - inicio:.1f}s")
+
+        repositorio = RepositorioPrincipal(
+            fabrica_conexao=bancoSimulado.fabrica_conexao(caminho_base, latencia_conexao)
+        )
+        # Os caches são do processo e os códigos de planta se repetem entre as bases geradas
+        repositorio.invalidar_cache()
+        if "snapshot" in motores:
+            repositorio._snapshot = SnapshotProtheus(os.path.join(pasta, "snapshot.db"))
+            repositorio.atualizar_snapshot(completo=True)
+
+        # Alterna plantas e lojas principais para não medir sempre a mesma combinação
+        cenarios = [
+            {"planta": planta, "loja": f"{(i % lojas) + 1:02d}"}
+            for i, planta in enumerate(base["plantas"])
+        ]
+
+        for motor in motores:
+            latencias = []
+            linhas = 0
+            repositorio.buscar_dados(cenarios[0], usar_cache=False, motor=motor)  # aquecimento
+            for i in range(repeticoes):
+                filtros = cenarios[i % len(cenarios)]
+                inicio = time.perf_counter()
+                resultado = repositorio.buscar_dados(filtros, usar_cache=False, motor=motor)
+                latencias.append(time.perf_counter() - inicio)
+                linhas += len(resultado)
+
+            tracemalloc.start()
+            repositorio.buscar_dados(cenarios[0], usar_cache=False, motor=motor)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            resultados.append(
+                {
+                    "escala": escala,
+                    "plantas": plantas,
+                    "lojas_por_planta": lojas,
+                    "produtos_por_planta": produtos,
+                    "linhas_nf": linhas_nf,
+                    "motor": motor,
+                    "repeticoes": repeticoes,
+                    "p50_ms": round(1000 * _percentil(latencias, 50), 2),
+                    "p95_ms": round(1000 * _percentil(latencias, 95), 2),
+                    "p99_ms": round(1000 * _percentil(latencias, 99), 2),
+                    "media_ms": round(1000 * statistics.fmean(latencias), 2),
+                    "linhas_por_segundo": round(linhas / sum(latencias), 1) if linhas else 0.0,
+                    "linhas_por_consulta": linhas // repeticoes,
+                    "pico_memoria_mb": round(pico / 1024 / 1024, 2),
+                    "parametros": contar_parametros(repositorio, cenarios[0], motor),
+                }
+            )
+            logging.info(f"Benchmark: {resultados[-1]}")
+
+        repositorio._pool.fechar()
+    return resultados
+
+
+def comparar(atual: list, referencia_caminho: str, tolerancia: float) -> list:
+    with open(referencia_caminho, encoding="utf-8") as arquivo:
+        referencia = json.load(arquivo)
+    por_chave = {(r["escala"], r["motor"]): r for r in referencia["resultados"]}
+
+    regressoes = []
+    for resultado in atual:
+        anterior = por_chave.get((resultado["escala"], resultado["motor"]))
+        if not anterior:
+            continue
+        for metrica in ("p50_ms", "p95_ms", "pico_memoria_mb"):
+            if anterior[metrica] and resultado[metrica] > anterior[metrica] * (1 + tolerancia):
+                regressoes.append(
+                    f"{resultado['escala']} [{resultado['motor']}] {metrica}: "
+                    f"{anterior[metrica]} -> {resultado[metrica]}"
+                )
+    return regressoes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de buscar_dados com base simulada.")
+    parser.add_argument("--escalas", nargs="+", default=ESCALAS_PADRAO,
+                        help="plantas:lojas_por_planta:produtos_por_planta:linhas_nf")
+    parser.add_argument("--motores", nargs="+", default=list(MOTORES), choices=MOTORES)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--latencia-conexao", type=float, default=0.0,
+                        help="Segundos de handshake simulado por conexão nova.")
+    parser.add_argument("--saida", default="resultados_benchmark")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões.")
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="Piora relativa tolerada na comparação (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    resultados = []
+    for escala in args.escalas:
+        resultados += medir_escala(escala, args.motores, args.repeticoes, args.latencia_conexao)
+
+    os.makedirs(args.saida, exist_ok=True)
+    caminho = os.path.join(
+        args.saida, f"benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(
+            {
+                "versao": _versao(),
+                "data": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "plataforma": platform.platform(),
+                "resultados": resultados,
+            },
+            arquivo,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    print(f"{'escala':<22}{'motor':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'linhas/s':>12}{'pico MB':>10}{'params':>8}")
+    for r in resultados:
+        print(f"{r['escala']:<22}{r['motor']:<10}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['linhas_por_segundo']:>12}{r['pico_memoria_mb']:>10}"
+              f"{r['parametros']:>8}")
+    print(f"Resultados gravados em {caminho}")
+
+    if args.comparar:
+        regressoes = comparar(resultados, args.comparar, args.tolerancia)
+        for regressao in regressoes:
+            print(f"REGRESSÃO: {regressao}")
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+# cacheConsultas.py
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimar_tamanho(valor) -> int:
+    # Estimativa rasa do tamanho em bytes (suficiente para limitar a memória do cache)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(
+            sys.getsizeof(k) + estimar_tamanho(v) for k, v in valor.items()
+        )
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(estimar_tamanho(v) for v in valor)
+    tamanho_bytes = getattr(valor, "tamanho_bytes", None)
+    if callable(tamanho_bytes):
+        return int(tamanho_bytes())  # Objetos que sabem o próprio tamanho (ex.: motorLocal.PlantaLocal)
+    uso_memoria = getattr(valor, "memory_usage", None)
+    if callable(uso_memoria):
+        try:
+            return int(uso_memoria(deep=True).sum())  # DataFrame do pandas
+        except Exception:
+            pass
+    return sys.getsizeof(valor)
+
+
+class CacheTTL:
+    def __init__(self, nome: str, ttl_segundos: float, max_bytes: int):
+        self.nome = nome
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes
+        self._itens = OrderedDict()  # chave -> (expira_em, tamanho, valor)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._acertos = 0
+        self._falhas = 0
+        self._expirados = 0
+        self._despejados = 0
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self._falhas += 1
+                return padrao
+            expira_em, tamanho, valor = item
+            if expira_em <= time.monotonic():
+                del self._itens[chave]
+                self._bytes -= tamanho
+                self._expirados += 1
+                self._falhas += 1
+                return padrao
+            self._itens.move_to_end(chave)
+            self._acertos += 1
+            return valor
+
+    def guardar(self, chave, valor, ttl_segundos: float = None) -> None:
+        tamanho = estimar_tamanho(valor)
+        if tamanho > self.max_bytes:
+            logging.info(
+                f"Cache '{self.nome}': resultado de {tamanho} bytes excede o limite "
+                f"de {self.max_bytes} bytes e não será armazenado."
+            )
+            return
+
+        ttl = self.ttl_segundos if ttl_segundos is None else ttl_segundos
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._bytes -= anterior[1]
+            self._itens[chave] = (time.monotonic() + ttl, tamanho, valor)
+            self._bytes += tamanho
+            while self._bytes > self.max_bytes and self._itens:
+                _, (_, tamanho_antigo, _) = self._itens.popitem(last=False)
+                self._bytes -= tamanho_antigo
+                self._despejados += 1
+
+    def invalidar(self, filtro=None) -> int:
+        # Sem filtro limpa tudo; com filtro remove as chaves para as quais filtro(chave) é verdadeiro
+        with self._lock:
+            if filtro is None:
+                removidos = len(self._itens)
+                self._itens.clear()
+                self._bytes = 0
+            else:
+                chaves = [chave for chave in self._itens if filtro(chave)]
+                for chave in chaves:
+                    self._bytes -= self._itens.pop(chave)[1]
+                removidos = len(chaves)
+        logging.info(f"Cache '{self.nome}': {removidos} entrada(s) invalidada(s).")
+        return removidos
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            consultas = self._acertos + self._falhas
+            return {
+                "nome": self.nome,
+                "entradas": len(self._itens),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_segundos": self.ttl_segundos,
+                "acertos": self._acertos,
+                "falhas": self._falhas,
+                "taxa_acerto": self._acertos / consultas if consultas else 0.0,
+                "expirados": self._expirados,
+                "despejados": self._despejados,
+            }
@@ -1,21 +1,150 @@
 # consultaBD.py
 import pyodbc
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 import traceback
+import json
 import logging
+from cacheConsultas import CacheTTL
+from poolConexoes import PoolConexoes
+from resultadoColunar import montar_resultado
+import motorLocal
+import metricas
+from snapshotProtheus import SnapshotProtheus
+from indiceTrigramas import catalogo
+from armazemResultados import armazem
+from agendadorConsultas import agendador
+import modelosConsulta
+from modelosConsulta import (
+    PRODUTOS_LOJAS,
+    NOMES_LOJAS,
+    PRODUTOS,
+    PRODUTOS_PLANTA,
+    DATAS_NF,
+    PREVISOES,
+    PRECOS,
+    LOJAS_PLANTA,
+    SEM_LIMITE,
+)
+from execucaoConsultas import ConsultaCancelada, cursor_cancelavel
 from settings import (
     DB_SERVER,
     DB_DATABASE,
     DB_USER,
     DB_PASSWORD,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_POOL_TIMEOUT,
+    DB_POOL_MAX_OCIOSO,
+    DB_POOL_VERIFICACAO,
+    CACHE_TTL_SEGUNDOS,
+    CACHE_MAX_MB,
+    CACHE_LOJAS_TTL_SEGUNDOS,
+    PLANTA_TTL_SEGUNDOS,
+    PLANTA_CACHE_MAX_MB,
+    SNAPSHOT_PATH,
+    CATALOGO_ATIVO,
 )
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+# O Streamlit reexecuta o script a cada interação; os pools ficam no nível do
+# módulo para que todas as sessões do processo compartilhem as mesmas conexões.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _obter_pool(chave: str, fabrica_conexao) -> PoolConexoes:
+    with _pools_lock:
+        pool = _pools.get(chave)
+        if pool is None:
+            pool = PoolConexoes(
+                fabrica_conexao,
+                tamanho_minimo=DB_POOL_MIN,
+                tamanho_maximo=DB_POOL_MAX,
+                timeout_espera=DB_POOL_TIMEOUT,
+                max_ocioso=DB_POOL_MAX_OCIOSO,
+                intervalo_verificacao=DB_POOL_VERIFICACAO,
+            )
+            pool.aquecer(em_segundo_plano=True)
+            _pools[chave] = pool
+        return pool
+
+
+# Caches de processo: as mesmas plantas/lojas são consultadas por vários usuários
+_cache_resultados = CacheTTL(
+    "resultados", CACHE_TTL_SEGUNDOS, int(CACHE_MAX_MB * 1024 * 1024)
+)
+_cache_lojas = CacheTTL("lojas", CACHE_LOJAS_TTL_SEGUNDOS, 4 * 1024 * 1024)
+# Fontes de cada planta inteira (motor "planta"): trocar loja principal ou filtros não volta ao ERP
+_cache_plantas = CacheTTL(
+    "plantas", PLANTA_TTL_SEGUNDOS, int(PLANTA_CACHE_MAX_MB * 1024 * 1024)
+)
+
+
+def _estatisticas_pools() -> dict:
+    # Soma dos pools do processo (normalmente um só) para o endpoint de métricas
+    with _pools_lock:
+        pools = list(_pools.values())
+    totais = {}
+    for pool in pools:
+        for chave, valor in pool.estatisticas().items():
+            if chave not in ("espera_media_ms", "espera_max_ms"):
+                totais[chave] = totais.get(chave, 0) + valor
+            else:
+                totais[chave] = max(totais.get(chave, 0), valor)
+    return totais
+
+
+metricas.registrar_coletor("pool", _estatisticas_pools)
+metricas.registrar_coletor("cache_resultados", _cache_resultados.estatisticas)
+metricas.registrar_coletor("cache_lojas", _cache_lojas.estatisticas)
+metricas.registrar_coletor("cache_plantas", _cache_plantas.estatisticas)
+
+CAMPOS_FILTRO = ("planta", "loja", "cliente", "pn_cliente", "pn_voss")
+
+
+def _chave_filtros(filtros: dict) -> tuple:
+    # Normaliza o dicionário de filtros: ignora campos desconhecidos, espaços e vazios
+    chave = []
+    for campo in CAMPOS_FILTRO:
+        valor = filtros.get(campo)
+        valor = str(valor).strip() if valor is not None else ""
+        chave.append((campo, valor or None))
+    return tuple(chave)
+
+
+def _copiar_linhas(resultado: list) -> list:
+    # Cada chamador recebe os próprios dicts: alterar uma linha não altera o cache do processo
+    return [dict(linha) for linha in resultado]
+
+
+# --- Consultas "estreitas" do motor local (cada uma com poucos parâmetros fixos) ---
+MOTORES = ("sql", "local", "snapshot", "planta")
+
+
+def _medir_fonte(nome: str, funcao, argumentos: tuple, duracoes: dict):
+    # Roda em thread do executor, fora do span da requisição: a duração volta em 'duracoes'
+    # para ser anotada pela thread que fez a chamada
+    inicio = time.perf_counter()
+    try:
+        return funcao(*argumentos)
+    finally:
+        segundos = time.perf_counter() - inicio
+        duracoes[nome] = round(1000 * segundos, 2)
+        metricas.registrar_fase("fonte", segundos, fonte=nome)
+
 
 class RepositorioPrincipal:
-    def __init__(self):
+    # Limite de linhas de buscar_dados; use iterar_dados/buscar_pagina para resultados maiores
+    LIMITE_LINHAS = 5000
+
+    def __init__(self, fabrica_conexao=None):
         # A string de conexão usa as variáveis importadas do settings.py
         # Certifique-se de que o driver ODBC correspondente esteja instalado no ambiente de destino.
         self.connection_string = (
@@ -25,242 +154,580 @@ class RepositorioPrincipal:
             f"UID={DB_USER};"
             f"PWD={DB_PASSWORD}"
         )
+        # Permite trocar o driver (ex.: banco simulado) sem alterar o restante do repositório
+        self._fabrica_conexao = fabrica_conexao or self._nova_conexao
+        self._snapshot = None
+        self._pool = _obter_pool(
+            self.connection_string if fabrica_conexao is None else fabrica_conexao,
+            self._fabrica_conexao,
+        )
         logging.info(f"Repositório Principal inicializado para DB: {DB_DATABASE}")
 
-    def _conectar(self):
+    def _nova_conexao(self):
         return pyodbc.connect(self.connection_string, timeout=15)
 
-    def _obter_lojas_da_planta(self, planta: str, connection) -> list[str]:
-        query_lojas = f"""
-            SELECT DISTINCT TRIM(A1_LOJA)
+    @contextmanager
+    def _conectar(self):
+        # Checkout de uma conexão do pool; é devolvida ao sair do bloco 'with'
+        inicio = time.perf_counter()
+        with self._pool.conexao() as connection:
+            metricas.registrar_fase("conexao", time.perf_counter() - inicio)
+            yield connection
+
+    def aquecer_pool(self) -> None:
+        # Abre as conexões mínimas do pool agora (bloqueante), em vez de na primeira consulta
+        self._pool.aquecer()
+
+    def estatisticas_pool(self) -> dict:
+        return self._pool.estatisticas()
+
+    def estatisticas_cache(self) -> dict:
+        return {
+            "resultados": _cache_resultados.estatisticas(),
+            "lojas": _cache_lojas.estatisticas(),
+            "plantas": _cache_plantas.estatisticas(),
+            "armazem": armazem.estatisticas(),
+        }
+
+    def estatisticas_modelos(self) -> dict:
+        # Execuções dos modelos de consulta na visão do processo (compilações: planos_em_cache)
+        return {**modelosConsulta.estatisticas(), "por_modelo": modelosConsulta.usos_por_modelo()}
+
+    def planos_em_cache(self) -> dict:
+        # Planos dos modelos no cache do SQL Server (requer VIEW SERVER STATE)
+        return modelosConsulta.planos_em_cache(self._conectar)
+
+    def invalidar_cache(self, planta: str = None) -> int:
+        if planta is None:
+            return (
+                _cache_resultados.invalidar()
+                + _cache_lojas.invalidar()
+                + _cache_plantas.invalidar()
+                + armazem.invalidar()
+            )
+        planta = planta.strip()
+        return (
+            _cache_resultados.invalidar(lambda chave: dict(chave)["planta"] == planta)
+            + _cache_lojas.invalidar(lambda chave: chave == planta)
+            + _cache_plantas.invalidar(lambda chave: chave == planta)
+            + armazem.invalidar(lambda chave: dict(chave)["planta"] == planta)
+        )
+
+    def listar_plantas(self, min_lojas: int = 1) -> list[str]:
+        query_plantas = """
+            SELECT TRIM(A1_COD)
             FROM [dbo].[SA1010]
-            WHERE A1_COD = ? AND D_E_L_E_T_ <> '*'
+            WHERE D_E_L_E_T_ <> '*'
+            GROUP BY TRIM(A1_COD)
+            HAVING COUNT(DISTINCT TRIM(A1_LOJA)) >= ?
             ORDER BY 1
         """
-        cursor = connection.cursor()
-        cursor.execute(query_lojas, (planta,))
-        return [row[0].strip() for row in cursor.fetchall()]
+        try:
+            with self._conectar() as connection:
+                cursor = connection.cursor()
+                cursor.execute(query_plantas, (min_lojas,))
+                return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            self._registrar_erro(e)
+            raise
+
+    def listar_lojas(self, planta: str) -> list[str]:
+        with self._conectar() as connection:
+            return self._obter_lojas_da_planta(planta, connection)
+
+    def precarregar_lojas(self, plantas: list = None) -> int:
+        # Uma única consulta para as lojas de todas as plantas (ou das informadas), direto
+        # para o cache de lojas; usada no aquecimento do processo. Retorna quantas plantas.
+        query_lojas = """
+            SELECT TRIM(A1_COD), TRIM(A1_LOJA)
+            FROM [dbo].[SA1010]
+            WHERE D_E_L_E_T_ <> '*'
+        """
+        parametros = []
+        if plantas:
+            query_lojas += f" AND A1_COD IN ({', '.join('?' for _ in plantas)})"
+            parametros = [planta.strip() for planta in plantas]
+        query_lojas += " GROUP BY TRIM(A1_COD), TRIM(A1_LOJA) ORDER BY 1, 2"
+
+        lojas_por_planta = {}
+        with self._conectar() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query_lojas, parametros)
+            for planta, loja in cursor.fetchall():
+                lojas_por_planta.setdefault(planta.strip(), []).append(loja.strip())
+        for planta, lojas in lojas_por_planta.items():
+            _cache_lojas.guardar(planta, tuple(lojas))
+        return len(lojas_por_planta)
+
+    def _obter_lojas_da_planta(self, planta: str, connection) -> list[str]:
+        with metricas.span("lojas", planta=planta) as tags:
+            lojas = _cache_lojas.obter(planta.strip())
+            if lojas is not None:
+                tags.update(cache="acerto", lojas=len(lojas))
+                return list(lojas)
+
+            cursor = connection.cursor()
+            LOJAS_PLANTA.executar(cursor, planta=planta)
+            lojas = [row[0].strip() for row in cursor.fetchall()]
+            if lojas:
+                _cache_lojas.guardar(planta.strip(), tuple(lojas))
+            tags.update(cache="falha", lojas=len(lojas))
+            return lojas
+
+    def buscar_dados(
+        self, filtros: dict, usar_cache: bool = True, motor: str = "sql", controle=None
+    ) -> list:
+        # motor="sql": PIVOT dinâmico no SQL Server (padrão)
+        # motor="local": consultas estreitas em paralelo + junção/pivot local (motorLocal.py)
+        # motor="snapshot": mesmas fontes lidas do snapshot local (snapshotProtheus.py)
+        # motor="planta": fontes da planta inteira mantidas em memória por PLANTA_TTL_SEGUNDOS;
+        #   loja principal e filtros de PN/cliente aplicados localmente (motorLocal.PlantaLocal)
+        # controle: ControleCancelamento (execucaoConsultas.py) para cancelar o comando no ODBC
+        if motor not in MOTORES:
+            raise ValueError(f"Motor desconhecido: {motor}. Opções: {MOTORES}")
+
+        with metricas.span("buscar_dados", motor=motor, planta=filtros.get("planta")) as tags:
+            chave_cache = _chave_filtros(filtros) + (("motor", motor),)
+            if usar_cache:
+                resultado = _cache_resultados.obter(chave_cache)
+                if resultado is not None:
+                    logging.info(f"buscar_dados atendido pelo cache: {filtros}")
+                    tags.update(cache="acerto", linhas=len(resultado))
+                    return _copiar_linhas(resultado)
+
+            def executar(controle_execucao):
+                if motor == "local":
+                    resultado = self._executar_busca_local(filtros, controle_execucao)
+                elif motor == "snapshot":
+                    resultado = self._executar_busca_snapshot(filtros)
+                elif motor == "planta":
+                    resultado = self._executar_busca_planta(filtros, controle_execucao, usar_cache)
+                else:
+                    resultado = self._executar_busca(filtros, controle_execucao)
+                if usar_cache and resultado:
+                    _cache_resultados.guardar(chave_cache, resultado)
+                return resultado
+
+            # Pedidos iguais em andamento compartilham uma execução; as que vão ao ERP
+            # passam pela fila de admissão (agendadorConsultas.py). No motor "planta" só a
+            # carga da planta ocupa vaga, não cada derivação local
+            resultado = agendador.executar(
+                chave_cache, executar, controle, admitir=motor in ("sql", "local")
+            )
+            tags.update(cache="falha" if usar_cache else None, linhas=len(resultado))
+            # O mesmo resultado foi para o cache e para os pedidos coalescidos
+            return _copiar_linhas(resultado)
+
+    def buscar_resultado(self, filtros: dict, motor: str = "sql", controle=None):
+        # Mesmo resultado de buscar_dados, guardado uma única vez no armazém do processo
+        # (armazemResultados.py). Devolve uma ReferenciaResultado; o DataFrame sai de
+        # armazem.visao(referencia). O cache de dicts fica de fora para não guardar o
+        # mesmo conjunto duas vezes.
+        chave = _chave_filtros(filtros) + (("motor", motor),)
+        referencia = armazem.obter(chave)
+        if referencia is not None:
+            logging.info(f"buscar_resultado atendido pelo armazém: {filtros}")
+            return referencia
+        return agendador.executar(
+            ("armazem",) + chave,
+            lambda controle_execucao: armazem.guardar(
+                chave,
+                self.buscar_dados(filtros, usar_cache=False, motor=motor, controle=controle_execucao),
+            ),
+            controle,
+            admitir=False,
+        )
+
+    def _filtros_validos(self, filtros: dict) -> bool:
+        if not filtros.get("planta") or not filtros.get("loja"):
+            logging.error("Filtros obrigatórios (Planta, Loja) não fornecidos.")
+            return False
+        return True
 
-    def buscar_dados(self, filtros: dict) -> list:
+    def _lojas_ordenadas(self, filtros: dict, connection) -> list[str]:
         planta_filtrada = filtros.get("planta")
         loja_principal = filtros.get("loja")
-        cliente_filtrado = filtros.get("cliente")
-        pn_cliente_filtrado = filtros.get("pn_cliente")
-        pn_voss_filtrado = filtros.get("pn_voss")
 
-        logging.info(f"Iniciando buscar_dados com filtros: {filtros}")
+        todas_as_lojas = self._obter_lojas_da_planta(planta_filtrada, connection)
 
-        if not planta_filtrada or not loja_principal:
-            logging.error("Filtros obrigatórios (Planta, Loja) não fornecidos.")
+        if not todas_as_lojas:
+            logging.warning(f"Nenhuma loja encontrada para a planta: {planta_filtrada}")
             return []
 
-        # --- Parâmetros de filtro para a CTE 'ProdutosFiltrados' ---
-        where_conditions_cte = []
-        parameters_cte = []
+        if loja_principal in todas_as_lojas:
+            todas_as_lojas.remove(loja_principal)
+            todas_as_lojas.insert(0, loja_principal)
+        return todas_as_lojas
 
-        if pn_voss_filtrado:
-            where_conditions_cte.append(f"A7.A7_PRODUTO LIKE ?")
-            parameters_cte.append(f"%{pn_voss_filtrado}%")
-
-        if pn_cliente_filtrado:
-            where_conditions_cte.append(f"REPLACE(TRIM(A7.A7_CODCLI), ' ', '') LIKE ?")
-            parameters_cte.append(f"%{pn_cliente_filtrado}%")
+    def _valores_filtros(self, filtros: dict) -> dict:
+        # Variáveis dos filtros opcionais (PN Voss, PN Cliente, Cliente) dos modelos; None
+        # desliga o filtro sem mudar o texto do comando
+        cliente_filtrado = filtros.get("cliente")
+        pn_cliente_filtrado = filtros.get("pn_cliente")
+        pn_voss_filtrado = filtros.get("pn_voss")
 
-        if cliente_filtrado:
-            cliente_like_param = f"%{cliente_filtrado}%"
-            where_conditions_cte.append(
-                f"(TRIM(A1.A1_NOME) LIKE ? OR TRIM(A1.A1_NREDUZ) LIKE ?)"
+        valores = {
+            "pn_voss": f"%{pn_voss_filtrado}%" if pn_voss_filtrado else None,
+            "pn_cliente": f"%{pn_cliente_filtrado}%" if pn_cliente_filtrado else None,
+            "cliente": f"%{cliente_filtrado}%" if cliente_filtrado else None,
+            "chaves": None,
+            "marca": None,
+        }
+        if (pn_voss_filtrado or pn_cliente_filtrado) and CATALOGO_ATIVO:
+            busca_indice = catalogo.chaves_produtos(
+                filtros.get("planta"), filtros.get("loja"), pn_voss_filtrado, pn_cliente_filtrado
             )
-            parameters_cte.extend([cliente_like_param, cliente_like_param])
+            if busca_indice is not None:
+                # R_E_C_N_O_ exatos vindos do índice de trigramas; o LIKE continua valendo e
+                # sozinho só para as linhas incluídas no SA7010 depois da última atualização
+                chaves, marca = busca_indice
+                valores.update(chaves=json.dumps(chaves), marca=marca)
+        return valores
 
-        where_clause_cte = ""
-        if where_conditions_cte:
-            where_clause_cte = " AND " + " AND ".join(where_conditions_cte)
-        # --- Fim Parâmetros CTE ---
+    def _valores_consulta(
+        self, filtros: dict, todas_as_lojas: list, limite: int = SEM_LIMITE, apos: tuple = None
+    ) -> dict:
+        # Variáveis do modelo 'produtos_lojas': as lojas vão em um único parâmetro JSON e a
+        # chave da página anterior (apos), quando houver, entra nas variáveis apos_*
+        cliente_apos, pn_voss_apos, pn_cliente_apos = apos or (None, None, None)
+        return {
+            "planta": filtros.get("planta"),
+            "loja": filtros.get("loja"),
+            "lojas": json.dumps(todas_as_lojas),
+            **self._valores_filtros(filtros),
+            "limite": limite,
+            "apos_cliente": cliente_apos,
+            "apos_pn_voss": pn_voss_apos,
+            "apos_pn_cliente": pn_cliente_apos,
+        }
+
+    def _registrar_erro(self, e: Exception) -> None:
+        if isinstance(e, ConsultaCancelada):
+            logging.info(f"Consulta cancelada pelo usuário: {e}")
+        elif isinstance(e, pyodbc.Error):
+            sqlstate = e.args[0] if e.args else "UNKNOWN"
+            logging.error(f"ERRO DE BANCO DE DADOS SQLSTATE-{sqlstate}: {e}")
+        else:
+            logging.error(f"ERRO INESPERADO: {e}")
+            logging.error(traceback.format_exc())
+
+    def _executar_busca(self, filtros: dict, controle=None) -> list:
+        logging.info(f"Iniciando buscar_dados com filtros: {filtros}")
+
+        if not self._filtros_validos(filtros):
+            return []
 
         try:
             with self._conectar() as connection:
-                todas_as_lojas = self._obter_lojas_da_planta(
-                    planta_filtrada, connection
+                todas_as_lojas = self._lojas_ordenadas(filtros, connection)
+                if not todas_as_lojas:
+                    return []
+
+                with metricas.span("montagem_sql", lojas=len(todas_as_lojas)) as tags:
+                    valores = self._valores_consulta(filtros, todas_as_lojas, self.LIMITE_LINHAS)
+                    tags["parametros"] = len(PRODUTOS_LOJAS.variaveis)
+                # Vai para o log de requisições lentas junto com a requisição
+                metricas.anotar(
+                    sql=PRODUTOS_LOJAS.sql,
+                    modelo=PRODUTOS_LOJAS.nome,
+                    lojas=len(todas_as_lojas),
+                    parametros=len(PRODUTOS_LOJAS.variaveis),
                 )
 
-                if not todas_as_lojas:
-                    logging.warning(
-                        f"Nenhuma loja encontrada para a planta: {planta_filtrada}"
+                with cursor_cancelavel(connection, controle) as cursor:
+                    with metricas.span("execucao", parametros=len(PRODUTOS_LOJAS.variaveis)):
+                        PRODUTOS_LOJAS.executar(cursor, **valores)
+                    with metricas.span("fetch") as tags:
+                        columns = [column[0] for column in cursor.description]
+                        longo = motorLocal.frame_longo(cursor.fetchall(), columns)
+                        tags["linhas"] = len(longo)
+                with metricas.span("pivot_local", lojas=len(todas_as_lojas)):
+                    resultado = motorLocal.para_registros(
+                        motorLocal.pivotar_longo(longo, todas_as_lojas)
                     )
-                    return []
 
-                if loja_principal in todas_as_lojas:
-                    todas_as_lojas.remove(loja_principal)
-                    todas_as_lojas.insert(0, loja_principal)
-
-                # --- PIVOT Dinâmico ---
-                pivot_columns_select = ""
-                pivot_parameters = []
-
-                for loja in todas_as_lojas:
-                    # Aliases são seguros pois vêm de um replace para evitar SQL Injection via nome de loja
-                    loja_alias_safe = loja.replace("]", "]]")
-
-                    alias_nome_red = f"[Nome Reduzido {loja_alias_safe}]"
-                    alias_data_primeira = f"[Primeira NF {loja_alias_safe}]"
-                    alias_data_ultima = f"[Última NF {loja_alias_safe}]"
-                    alias_previsao = f"[Previsão Vendas {loja_alias_safe}]"
-                    alias_qtd_previsao = f"[Qtd Previsão Futura {loja_alias_safe}]"
-                    alias_dias = f"[Dias {loja_alias_safe}]"
-                    alias_preco = f"[Preço Venda {loja_alias_safe}]"
-
-                    pivot_columns_select += f"""
-                        ,MAX(CASE WHEN T.D2_LOJA = ? THEN T.[NomeReduzidoClienteLoja] END) AS {alias_nome_red}
-                        ,MAX(CASE WHEN T.D2_LOJA = ? THEN T.DataPrimeiraNF END) AS {alias_data_primeira}
-                        ,MAX(CASE WHEN T.D2_LOJA = ? THEN T.DataUltimaNF END) AS {alias_data_ultima}
-                        ,MAX(CASE WHEN T.D2_LOJA = ? THEN T.DataPrevisao END) AS {alias_previsao}
-                        ,ISNULL(MAX(CASE WHEN T.D2_LOJA = ? THEN T.QuantidadePrevisaoFutura END), 0) AS {alias_qtd_previsao}
-                        ,MAX(CASE WHEN T.D2_LOJA = ? THEN T.DiasDesdeUltimaNF END) AS {alias_dias}
-                        ,MAX(CASE WHEN T.D2_LOJA = ? THEN T.PrecoVenda END) AS {alias_preco}
-                    """
-                    # Adiciona os parâmetros 'loja' para cada '?' (7 vezes por loja)
-                    pivot_parameters.extend([loja] * 7)
-
-                # --- Query Base com CTEs ---
-                query_base_cte = f"""
-                    WITH DatasNF AS (
-                        -- 1. Busca NFs
-                        SELECT
-                            TRIM(D2_COD) AS D2_COD, TRIM(D2_CLIENTE) AS D2_CLIENTE, TRIM(D2_LOJA) AS D2_LOJA,
-                            MAX(D2_EMISSAO) AS DataUltimaNF, MIN(D2_EMISSAO) AS DataPrimeiraNF
-                        FROM [dbo].[SD2010]
-                        WHERE D_E_L_E_T_ <> '*' AND D2_CLIENTE = ? -- Param 1
-                        GROUP BY TRIM(D2_COD), TRIM(D2_CLIENTE), TRIM(D2_LOJA)
-                    ),
-                    PrevisaoVendas AS (
-                        -- 2. Busca Previsões
-                        SELECT
-                            TRIM(C4_PRODUTO) AS C4_PRODUTO, TRIM(C4_CLIENTE) AS C4_CLIENTE, TRIM(C4_LOJA) AS C4_LOJA,
-                            SUM(CASE WHEN TRY_CAST(C4_DATA AS DATE) >= CAST(GETDATE() AS DATE) THEN C4_QUANT ELSE 0 END) AS QuantidadePrevisaoFutura,
-                            CAST(MAX(C4_DATA) AS DATE) AS DataPrevisao
-                        FROM [dbo].[SC4010]
-                        WHERE D_E_L_E_T_ <> '*' AND C4_CLIENTE = ? AND C4_DATA <> '' -- Param 2
-                        GROUP BY TRIM(C4_PRODUTO), TRIM(C4_CLIENTE), TRIM(C4_LOJA)
-                    ),
-                    ProdutosFiltrados AS (
-                        -- 3. FILTRA os produtos com base na LOJA PRINCIPAL e filtros da UI
-                        SELECT DISTINCT
-                            A1.A1_COD AS Planta,
-                            TRIM(A1.A1_NOME) AS Cliente,
-                            TRIM(A1.A1_NREDUZ) AS [Nome Reduzido Cliente Mestre],
-                            REPLACE(TRIM(A7.A7_CODCLI), ' ', '') AS [PN Cliente],
-                            A7.A7_PRODUTO AS [PN Voss]
-                        FROM [dbo].[SA1010] AS A1
-                        INNER JOIN [dbo].[SA7010] AS A7
-                            ON A7.A7_CLIENTE = A1.A1_COD
-                            AND TRIM(A7.A7_LOJA) = TRIM(A1.A1_LOJA)
-                            AND A7.D_E_L_E_T_ <> '*'
-                        WHERE A1.A1_COD = ? -- Param 3
-                          AND TRIM(A1.A1_LOJA) = ? -- Param 4
-                          AND A1.D_E_L_E_T_ <> '*'
-                          {where_clause_cte} -- Filtros dinâmicos (Params 5...N)
-                    ),
-                    LojaNomes AS (
-                        -- 4. Busca o Nome Reduzido de TODAS as lojas
-                        SELECT DISTINCT
-                            TRIM(A1_LOJA) AS Loja, TRIM(A1_NREDUZ) AS NomeReduzidoClienteLoja
-                        FROM [dbo].[SA1010]
-                        WHERE A1_COD = ? -- Param N+1
-                          AND D_E_L_E_T_ <> '*'
-                    ),
-                    PrecosVenda AS (
-                        -- 5. Busca Preços de Venda
-                        SELECT
-                            A7_CLIENTE,
-                            TRIM(A7_LOJA) AS A7_LOJA,
-                            A7_PRODUTO,
-                            A7_XPRCLIQ
-                        FROM [dbo].[SA7010]
-                        WHERE A7_CLIENTE = ? -- Param N+2
-                          AND D_E_L_E_T_ <> '*'
-                    ),
-                    TabelaBase AS (
-                        -- 6. Monta a ESTRUTURA (PRODUTO x LOJA) e anexa os dados
-                        SELECT
-                            PF.Cliente,
-                            PF.[Nome Reduzido Cliente Mestre] AS [Nome Reduzido Mestre],
-                            PF.[PN Cliente],
-                            PF.[PN Voss],
-                            LN.Loja AS D2_LOJA,
-                            LN.NomeReduzidoClienteLoja,
-                            PF.Planta,
-                            CAST(UNF.DataUltimaNF AS DATE) AS DataUltimaNF,
-                            CAST(UNF.DataPrimeiraNF AS DATE) AS DataPrimeiraNF,
-                            PV.DataPrevisao,
-                            ISNULL(PV.QuantidadePrevisaoFutura, 0) AS QuantidadePrevisaoFutura,
-                            DATEDIFF(DAY, UNF.DataUltimaNF, GETDATE()) AS DiasDesdeUltimaNF,
-                            CAST(PVN.A7_XPRCLIQ AS DECIMAL(18,2)) AS PrecoVenda
-
-                        FROM ProdutosFiltrados AS PF
-                        CROSS JOIN LojaNomes AS LN
-                        LEFT JOIN DatasNF AS UNF
-                            ON UNF.D2_COD = PF.[PN Voss]
-                            AND UNF.D2_CLIENTE = PF.Planta
-                            AND UNF.D2_LOJA = LN.Loja
-                        LEFT JOIN PrevisaoVendas AS PV
-                            ON PV.C4_PRODUTO = PF.[PN Voss]
-                            AND PV.C4_CLIENTE = PF.Planta
-                            AND PV.C4_LOJA = LN.Loja
-                        LEFT JOIN PrecosVenda AS PVN
-                            ON PVN.A7_PRODUTO = PF.[PN Voss]
-                            AND PVN.A7_CLIENTE = PF.Planta
-                            AND PVN.A7_LOJA = LN.Loja
+                if len(resultado) >= self.LIMITE_LINHAS:
+                    logging.warning(
+                        f"buscar_dados atingiu o limite de {self.LIMITE_LINHAS} linhas para a planta "
+                        f"{filtros.get('planta')}; o resultado pode estar truncado. "
+                        f"Use iterar_dados ou buscar_pagina para o conjunto completo."
                     )
-                """
-
-                # Parâmetros iniciais fixos (Params 1-4)
-                cte_base_parameters = [
-                    planta_filtrada,
-                    planta_filtrada,
-                    planta_filtrada,
-                    loja_principal,
-                ]
-
-                # Montagem final da lista de parâmetros na ordem exata dos '?'
-                final_parameters = (
-                    cte_base_parameters
-                    + parameters_cte
-                    + [planta_filtrada]  # Para LojaNomes
-                    + [planta_filtrada]  # Para PrecosVenda
-                    + pivot_parameters   # Para o PIVOT dinâmico
-                )
+                return resultado
 
-                final_query = f"""
-                    {query_base_cte}
-                    SELECT TOP 5000
-                        T.Cliente,
-                        T.[PN Voss],
-                        T.[PN Cliente],
-                        T.Planta,
-                        T.[Nome Reduzido Mestre] AS [Nome Reduzido]
-                        {pivot_columns_select}
-                    FROM TabelaBase AS T
-                    GROUP BY T.Cliente, T.[PN Voss], T.[PN Cliente], T.Planta, T.[Nome Reduzido Mestre]
-                    ORDER BY T.Cliente, T.[PN Voss];
-                """
-
-                logging.info(
-                    f"Executando query dinâmica com {len(final_parameters)} parâmetros."
+        except Exception as e:
+            self._registrar_erro(e)
+            raise
+
+    # --- Motor local: fan-out das fontes estreitas + pivot vetorizado ---
+    def _consultar_frame(self, modelo, valores: dict, controle=None) -> pd.DataFrame:
+        # Cada fonte usa sua própria conexão do pool para rodar em paralelo
+        with self._conectar() as connection:
+            with cursor_cancelavel(connection, controle) as cursor:
+                modelo.executar(cursor, **valores)
+                columns = [column[0] for column in cursor.description]
+                return pd.DataFrame.from_records(
+                    [tuple(row) for row in cursor.fetchall()], columns=columns
                 )
 
+    def _lojas_ordenadas_pool(self, filtros: dict) -> list[str]:
+        with self._conectar() as connection:
+            return self._lojas_ordenadas(filtros, connection)
+
+    def _buscar_fontes(self, filtros: dict, controle=None) -> dict:
+        planta = {"planta": filtros.get("planta")}
+        valores_produtos = {**planta, "loja": filtros.get("loja"), **self._valores_filtros(filtros)}
+
+        return self._executar_fontes(
+            {
+                "lojas": (self._lojas_ordenadas_pool, (filtros,)),
+                "nomes_lojas": (self._consultar_frame, (NOMES_LOJAS, planta, controle)),
+                "produtos": (self._consultar_frame, (PRODUTOS, valores_produtos, controle)),
+                "datas_nf": (self._consultar_frame, (DATAS_NF, planta, controle)),
+                "previsoes": (self._consultar_frame, (PREVISOES, planta, controle)),
+                "precos": (self._consultar_frame, (PRECOS, planta, controle)),
+            }
+        )
+
+    def _executar_fontes(self, tarefas: dict) -> dict:
+        # tarefas: nome -> (funcao, argumentos), executadas em paralelo (uma conexão cada)
+        with ThreadPoolExecutor(
+            max_workers=len(tarefas), thread_name_prefix="motor-local"
+        ) as executor:
+            duracoes = {}
+            futuros = {
+                nome: executor.submit(_medir_fonte, nome, funcao, argumentos, duracoes)
+                for nome, (funcao, argumentos) in tarefas.items()
+            }
+            resultados = {nome: futuro.result() for nome, futuro in futuros.items()}
+            metricas.anotar(fontes_ms=duracoes)
+            return resultados
+
+    def _executar_busca_local(self, filtros: dict, controle=None) -> list:
+        logging.info(f"Iniciando buscar_dados (motor local) com filtros: {filtros}")
+
+        if not self._filtros_validos(filtros):
+            return []
+
+        try:
+            with metricas.span("fontes"):
+                fontes = self._buscar_fontes(filtros, controle)
+            return self._pivotar_fontes(fontes)
+        except Exception as e:
+            self._registrar_erro(e)
+            raise
+
+    def _pivotar_fontes(self, fontes: dict) -> list:
+        if not fontes["lojas"]:
+            logging.warning("Nenhuma loja encontrada para a planta informada.")
+            return []
+
+        with metricas.span("pivot_local", lojas=len(fontes["lojas"])) as tags:
+            df = motorLocal.montar_pivot(
+                fontes["produtos"],
+                fontes["lojas"],
+                fontes["nomes_lojas"],
+                fontes["datas_nf"],
+                fontes["previsoes"],
+                fontes["precos"],
+                limite=self.LIMITE_LINHAS,
+            )
+            tags["linhas"] = len(df)
+            return motorLocal.para_registros(df)
+
+    # --- Motor planta: fontes da planta inteira em memória, derivação local por loja/filtro ---
+    def _carregar_planta(self, planta: str, controle=None) -> motorLocal.PlantaLocal:
+        valores = {"planta": planta}
+        with metricas.span("fontes_planta", planta=planta):
+            fontes = self._executar_fontes(
+                {
+                    "lojas": (self._lojas_ordenadas_pool, ({"planta": planta},)),
+                    "nomes_lojas": (self._consultar_frame, (NOMES_LOJAS, valores, controle)),
+                    "produtos": (self._consultar_frame, (PRODUTOS_PLANTA, valores, controle)),
+                    "datas_nf": (self._consultar_frame, (DATAS_NF, valores, controle)),
+                    "previsoes": (self._consultar_frame, (PREVISOES, valores, controle)),
+                    "precos": (self._consultar_frame, (PRECOS, valores, controle)),
+                }
+            )
+        with metricas.span("matrizes_planta", lojas=len(fontes["lojas"])):
+            conjunto = motorLocal.PlantaLocal(
+                fontes["produtos"],
+                fontes["lojas"],
+                fontes["nomes_lojas"],
+                fontes["datas_nf"],
+                fontes["previsoes"],
+                fontes["precos"],
+            )
+        if conjunto.lojas:
+            _cache_plantas.guardar(planta, conjunto)
+        return conjunto
+
+    def _obter_planta(self, planta: str, controle=None, usar_cache: bool = True) -> motorLocal.PlantaLocal:
+        # usar_cache=False recarrega a planta do ERP; a carga nova substitui a do cache
+        planta = planta.strip()
+        if usar_cache:
+            conjunto = _cache_plantas.obter(planta)
+            if conjunto is not None:
+                return conjunto
+        # Várias lojas/filtros da mesma planta pedidos juntos dividem uma única carga
+        return agendador.executar(
+            ("planta", planta), lambda controle_execucao: self._carregar_planta(planta, controle_execucao), controle
+        )
+
+    def _executar_busca_planta(self, filtros: dict, controle=None, usar_cache: bool = True) -> list:
+        logging.info(f"Iniciando buscar_dados (motor planta) com filtros: {filtros}")
+
+        if not self._filtros_validos(filtros):
+            return []
+
+        try:
+            conjunto = self._obter_planta(filtros.get("planta"), controle, usar_cache)
+            if not conjunto.lojas:
+                logging.warning(f"Nenhuma loja encontrada para a planta: {filtros.get('planta')}")
+                return []
+            with metricas.span("derivacao_local", lojas=len(conjunto.lojas)) as tags:
+                df = conjunto.derivar(filtros.get("loja"), filtros, limite=self.LIMITE_LINHAS)
+                tags["linhas"] = len(df)
+            return motorLocal.para_registros(df)
+        except Exception as e:
+            self._registrar_erro(e)
+            raise
+
+    # --- Snapshot local: tira a agregação pesada do ERP em horário comercial ---
+    def _obter_snapshot(self) -> SnapshotProtheus:
+        if self._snapshot is None:
+            self._snapshot = SnapshotProtheus(SNAPSHOT_PATH)
+        return self._snapshot
+
+    def atualizar_snapshot(self, completo: bool = False) -> dict:
+        return self._obter_snapshot().atualizar(self._conectar, completo)
+
+    # --- Catálogo de busca (índice de trigramas de PNs e clientes, em memória) ---
+    def atualizar_catalogo(self, completo: bool = False) -> dict:
+        return catalogo.atualizar(self._conectar, completo)
+
+    def manter_catalogo(self) -> None:
+        # Carga inicial e atualização periódica em segundo plano (uma thread por processo)
+        catalogo.iniciar_atualizacao(self._conectar)
+
+    def sugerir_pn(self, texto: str, planta: str = None, loja: str = None, campo: str = "pn_voss", limite: int = 10) -> list:
+        return catalogo.sugerir_pn(texto, planta, loja, campo, limite)
+
+    def sugerir_clientes(self, texto: str, limite: int = 10) -> list:
+        return catalogo.sugerir_clientes(texto, limite)
+
+    def _executar_busca_snapshot(self, filtros: dict) -> list:
+        logging.info(f"Iniciando buscar_dados (snapshot) com filtros: {filtros}")
+
+        if not self._filtros_validos(filtros):
+            return []
+
+        snapshot = self._obter_snapshot()
+        if snapshot.atualizado_em() is None:
+            raise RuntimeError(
+                f"O snapshot em {snapshot.caminho} ainda não foi carregado. "
+                f"Execute 'python snapshotProtheus.py --completo'."
+            )
+        try:
+            with metricas.span("fontes"):
+                fontes = snapshot.fontes(filtros)
+            return self._pivotar_fontes(fontes)
+        except Exception as e:
+            self._registrar_erro(e)
+            raise
+
+    # --- Modo streaming: lotes via fetchmany, sem limite de linhas ---
+    def iterar_lotes(self, filtros: dict, tamanho_lote: int = 1000):
+        # Gera (colunas, lote_de_linhas). A conexão fica reservada até o gerador ser
+        # consumido por completo ou fechado (close()/saída do 'for').
+        logging.info(f"Iniciando iterar_lotes com filtros: {filtros}")
+
+        if not self._filtros_validos(filtros):
+            return
+
+        try:
+            with self._conectar() as connection:
+                todas_as_lojas = self._lojas_ordenadas(filtros, connection)
+                if not todas_as_lojas:
+                    return
+
                 cursor = connection.cursor()
-                cursor.execute(final_query, final_parameters)
+                PRODUTOS_LOJAS.executar(cursor, **self._valores_consulta(filtros, todas_as_lojas))
                 columns = [column[0] for column in cursor.description]
-                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+                colunas_largas = motorLocal.colunas_pivot(todas_as_lojas)
+                chave = len(motorLocal.COLUNAS_BASE)  # Colunas que identificam o produto
+                # Cada produto chega em várias linhas (uma por loja), em sequência: o último
+                # produto de um lote pode continuar no próximo e fica pendente até fechar
+                pendentes = []
+                while True:
+                    lote = cursor.fetchmany(tamanho_lote * len(todas_as_lojas))
+                    if lote:
+                        pendentes.extend(lote)
+                        corte = len(pendentes)
+                        ultimo = tuple(pendentes[-1][:chave])
+                        while corte and tuple(pendentes[corte - 1][:chave]) == ultimo:
+                            corte -= 1
+                    else:
+                        corte = len(pendentes)
+                    if corte:
+                        completos, pendentes = pendentes[:corte], pendentes[corte:]
+                        largo = motorLocal.pivotar_longo(
+                            motorLocal.frame_longo(completos, columns),
+                            todas_as_lojas,
+                        )
+                        yield colunas_largas, list(largo.itertuples(index=False, name=None))
+                    if not lote:
+                        break
 
-        except pyodbc.Error as ex:
-            sqlstate = ex.args[0] if ex.args else "UNKNOWN"
-            logging.error(
-                f"ERRO DE BANCO DE DADOS SQLSTATE-{sqlstate}: {ex}"
-            )
+        except Exception as e:
+            self._registrar_erro(e)
             raise
+
+    def iterar_dados(self, filtros: dict, tamanho_lote: int = 1000):
+        for columns, lote in self.iterar_lotes(filtros, tamanho_lote):
+            for row in lote:
+                yield dict(zip(columns, row))
+
+    def buscar_dataframe(
+        self, filtros: dict, formato: str = "pandas", tamanho_lote: int = 2000
+    ):
+        # Resultado completo (sem LIMITE_LINHAS) montado em colunas tipadas a partir dos
+        # lotes do cursor: datas como datetime64, preços/quantidades como float e
+        # Cliente/Planta/Nome Reduzido como categorias. formato: "pandas" ou "arrow".
+        with metricas.span("dataframe", formato=formato, planta=filtros.get("planta")) as tags:
+            resultado = montar_resultado(self.iterar_lotes(filtros, tamanho_lote), formato)
+            tags["linhas"] = len(resultado) if formato == "pandas" else resultado.num_rows
+            return resultado
+
+    # --- Paginação por chave (keyset) em (Cliente, PN Voss, PN Cliente) ---
+    def buscar_pagina(self, filtros: dict, apos: tuple = None, limite: int = 500) -> dict:
+        # 'apos' é a 'proxima_chave' devolvida pela página anterior (None na primeira página).
+        # PN Cliente entra na chave como desempate, pois um PN Voss pode ter vários PN Cliente.
+        logging.info(f"Iniciando buscar_pagina com filtros: {filtros} após {apos}")
+
+        pagina_vazia = {"linhas": [], "proxima_chave": None}
+        if not self._filtros_validos(filtros):
+            return pagina_vazia
+
+        try:
+            with self._conectar() as connection:
+                todas_as_lojas = self._lojas_ordenadas(filtros, connection)
+                if not todas_as_lojas:
+                    return pagina_vazia
+
+                cursor = connection.cursor()
+                PRODUTOS_LOJAS.executar(
+                    cursor, **self._valores_consulta(filtros, todas_as_lojas, int(limite), apos)
+                )
+                columns = [column[0] for column in cursor.description]
+                longo = motorLocal.frame_longo(cursor.fetchall(), columns)
+                linhas = motorLocal.para_registros(motorLocal.pivotar_longo(longo, todas_as_lojas))
+
+                proxima_chave = None
+                if len(linhas) == limite:
+                    ultima = linhas[-1]
+                    proxima_chave = (ultima["Cliente"], ultima["PN Voss"], ultima["PN Cliente"])
+                return {"linhas": linhas, "proxima_chave": proxima_chave}
+
         except Exception as e:
-            logging.error(f"ERRO INESPERADO: {e}")
-            logging.error(traceback.format_exc())
-            raise
\ No newline at end of file
+            self._registrar_erro(e)
+            raise
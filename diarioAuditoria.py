@@ -0,0 +1,380 @@
+# diarioAuditoria.py
+# Diário de auditoria append-only (SQLite) das linhas enviadas pela interface.
+# Cada clique grava só as linhas selecionadas; a aba "Base - AfterMarket" da planilha dos
+# gestores (DIARIO_EXCEL_PATH, por padrão a mesma FOLDER_PATH_LOCAL que a tela atualizava) é
+# reconstruída em uma única passada por compactar_excel (agendada ou sob demanda). Só a aba de
+# dados é substituída; as outras abas da pasta são regravadas como estão. Na primeira
+# compactação, as linhas já existentes na aba são importadas para o diário.
+#
+# Exemplos:
+#   python diarioAuditoria.py compactar
+#   python diarioAuditoria.py consultar --planta 000123 --desde 2026-01-01
+import argparse
+import datetime
+import logging
+import os
+import sqlite3
+import uuid
+from contextlib import ExitStack, contextmanager
+
+import openpyxl
+import pandas as pd
+
+from logUso import trava_arquivo
+
+# Mesmas colunas (e ordem) da aba "Base - AfterMarket"
+COLUNAS_EXCEL = ["PN Voss", "PN Cliente", "Planta", "Loja", "Ultima NF", "Preço atual", "Data"]
+NOME_ABA = "Base - AfterMarket"
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS selecoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pn_voss TEXT, pn_cliente TEXT, planta TEXT, loja TEXT,
+        ultima_nf TEXT, preco_atual REAL, data TEXT,
+        usuario TEXT, registrado_em TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_selecoes_planta ON selecoes (planta, loja);
+    CREATE INDEX IF NOT EXISTS ix_selecoes_registro ON selecoes (registrado_em);
+    CREATE TABLE IF NOT EXISTS controle (
+        chave TEXT PRIMARY KEY, valor TEXT
+    );
+"""
+
+COLUNAS_DIARIO = ["pn_voss", "pn_cliente", "planta", "loja", "ultima_nf", "preco_atual", "data"]
+
+# Trava da compactação ao lado da planilha: vale para todos os workers do lancador.py, para a
+# linha de comando e para outras máquinas. O dono renova o mtime durante a compactação; sem
+# renovação há mais que isso, a trava é de um processo que morreu.
+TRAVA_COMPACTACAO_EXPIRACAO = 300.0
+
+
+class CompactacaoEmAndamento(Exception):
+    pass
+
+
+def montar_registros_selecao(df_selecionado: pd.DataFrame, loja: str) -> pd.DataFrame:
+    # Linhas selecionadas na tela -> COLUNAS_EXCEL. Sem cópia do DataFrame selecionado (pode ser
+    # uma visão do armazém de resultados): só as colunas do log são lidas, e só a coluna de NF é
+    # convertida. KeyError se a loja não tem as colunas "Última NF"/"Preço Venda" no resultado.
+    coluna_nf = f"Última NF {loja}"
+    coluna_preco = f"Preço Venda {loja}"
+
+    def formatar_data(coluna: pd.Series) -> pd.Series:
+        if pd.api.types.is_datetime64_any_dtype(coluna):
+            return coluna.dt.strftime("%d/%m/%Y")
+        if pd.api.types.is_object_dtype(coluna):
+            return pd.to_datetime(coluna, errors="coerce").dt.strftime("%d/%m/%Y")
+        return coluna
+
+    df_para_log = pd.DataFrame()
+    df_para_log["PN Voss"] = df_selecionado["PN Voss"].astype(str)
+    df_para_log["PN Cliente"] = df_selecionado["PN Cliente"].astype(str)
+    df_para_log["Planta"] = df_selecionado["Planta"].astype(object)
+    df_para_log["Loja"] = loja
+    df_para_log["Ultima NF"] = formatar_data(df_selecionado[coluna_nf])
+    df_para_log["Preço atual"] = df_selecionado[coluna_preco]
+    df_para_log["Data"] = datetime.datetime.now().strftime("%d/%m/%Y")
+    return df_para_log
+
+
+def _texto(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    return str(valor)
+
+
+def _numero(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+class DiarioAuditoria:
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        with self._abrir() as conexao:
+            conexao.executescript(ESQUEMA)
+
+    @contextmanager
+    def _abrir(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            conexao.execute("PRAGMA journal_mode=WAL")  # A compactação lê sem bloquear os registros
+            with conexao:
+                yield conexao
+        finally:
+            conexao.close()
+
+    # --- Escrita: O(linhas selecionadas), independente do histórico ---
+    def registrar(self, df_log: pd.DataFrame, usuario: str = None) -> int:
+        # df_log: DataFrame com as COLUNAS_EXCEL (o mesmo montado por enviar_para_excel)
+        if df_log.empty:
+            return 0
+        registrado_em = datetime.datetime.now().isoformat(timespec="seconds")
+        linhas = [
+            (
+                _texto(pn_voss) or "",
+                _texto(pn_cliente) or "",
+                _texto(planta),
+                _texto(loja),
+                _texto(ultima_nf),
+                _numero(preco),
+                _texto(data),
+                usuario,
+                registrado_em,
+            )
+            for pn_voss, pn_cliente, planta, loja, ultima_nf, preco, data in (
+                df_log[COLUNAS_EXCEL].itertuples(index=False, name=None)
+            )
+        ]
+        with self._abrir() as conexao:
+            conexao.executemany(
+                "INSERT INTO selecoes (pn_voss, pn_cliente, planta, loja, ultima_nf, "
+                "preco_atual, data, usuario, registrado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                linhas,
+            )
+        return len(linhas)
+
+    # --- Leitura direta do diário (sem abrir o Excel) ---
+    def consultar(
+        self,
+        planta: str = None,
+        loja: str = None,
+        pn_voss: str = None,
+        usuario: str = None,
+        desde: str = None,
+    ) -> pd.DataFrame:
+        # desde: data ISO (AAAA-MM-DD) comparada com o momento do registro
+        condicoes, parametros = [], []
+        for coluna, valor in (
+            ("planta", planta), ("loja", loja), ("pn_voss", pn_voss), ("usuario", usuario)
+        ):
+            if valor:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(str(valor).strip())
+        if desde:
+            condicoes.append("registrado_em >= ?")
+            parametros.append(desde)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+        with self._abrir() as conexao:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(COLUNAS_DIARIO)}, usuario, registrado_em "
+                f"FROM selecoes {where} ORDER BY registrado_em, id",
+                conexao,
+                params=parametros,
+            )
+        return df.rename(columns=dict(zip(COLUNAS_DIARIO, COLUNAS_EXCEL)))
+
+    def ultimo_envio(self, planta: str, loja: str) -> pd.DataFrame:
+        # Última vez em que cada PN da planta/loja foi enviado
+        with self._abrir() as conexao:
+            return pd.read_sql_query(
+                "SELECT pn_voss AS [PN Voss], MAX(registrado_em) AS [Último envio], "
+                "COUNT(*) AS [Envios] FROM selecoes WHERE planta = ? AND loja = ? "
+                "GROUP BY pn_voss ORDER BY pn_voss",
+                conexao,
+                params=[planta, loja],
+            )
+
+    # --- Histórico anterior ao diário ---
+    def _importar_excel_legado(self, caminho_excel: str, nome_aba: str) -> int:
+        # Executado uma única vez: traz para o diário as linhas já existentes na planilha,
+        # para que a primeira compactação não as descarte.
+        with self._abrir() as conexao:
+            if conexao.execute(
+                "SELECT 1 FROM controle WHERE chave = 'legado_importado'"
+            ).fetchone():
+                return 0
+
+        importadas = 0
+        if os.path.exists(caminho_excel):
+            workbook = openpyxl.load_workbook(caminho_excel, read_only=True)
+            try:
+                if nome_aba in workbook.sheetnames:
+                    linhas = workbook[nome_aba].iter_rows(min_row=2, values_only=True)
+                    registros = []
+                    for linha in linhas:
+                        valores = (list(linha) + [None] * len(COLUNAS_EXCEL))[: len(COLUNAS_EXCEL)]
+                        if not any(v is not None for v in valores):
+                            continue
+                        registros.append(valores)
+                    # O momento do registro original não existe na planilha; usa a coluna Data
+                    with self._abrir() as conexao:
+                        conexao.executemany(
+                            "INSERT INTO selecoes (pn_voss, pn_cliente, planta, loja, ultima_nf, "
+                            "preco_atual, data, usuario, registrado_em) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                            [
+                                (
+                                    _texto(r[0]) or "", _texto(r[1]) or "", _texto(r[2]),
+                                    _texto(r[3]), _texto(r[4]), _numero(r[5]), _texto(r[6]),
+                                    _data_iso(r[6]),
+                                )
+                                for r in registros
+                            ],
+                        )
+                    importadas = len(registros)
+            finally:
+                workbook.close()
+
+        with self._abrir() as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO controle (chave, valor) VALUES ('legado_importado', ?)",
+                (str(importadas),),
+            )
+        logging.info(f"Diário: {importadas} linha(s) importada(s) de {caminho_excel}")
+        return importadas
+
+    # --- Compactação: reconstrói a aba de dados da planilha em uma passada ---
+    def compactar_excel(self, caminho_excel: str, nome_aba: str = NOME_ABA, tamanho_lote: int = 5000) -> int:
+        os.makedirs(os.path.dirname(os.path.abspath(caminho_excel)), exist_ok=True)
+        with ExitStack() as pilha:
+            try:
+                pilha.enter_context(
+                    trava_arquivo(f"{caminho_excel}.lock", timeout=0, expiracao=TRAVA_COMPACTACAO_EXPIRACAO)
+                )
+            except TimeoutError:
+                # Outro processo já está reconstruindo a planilha; o que ele não pegar fica
+                # pendente (compactacao_pendente) para a próxima
+                raise CompactacaoEmAndamento(f"Compactação de {caminho_excel} já em andamento.") from None
+            return self._compactar_excel(caminho_excel, nome_aba, tamanho_lote)
+
+    def _compactar_excel(self, caminho_excel: str, nome_aba: str, tamanho_lote: int) -> int:
+        self._importar_excel_legado(caminho_excel, nome_aba)
+
+        diretorio = os.path.dirname(os.path.abspath(caminho_excel))
+        os.makedirs(diretorio, exist_ok=True)
+        raiz, extensao = os.path.splitext(caminho_excel)
+        # Nome único no mesmo diretório (o os.replace final precisa do mesmo volume)
+        temporario = f"{raiz}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp{extensao}"
+
+        workbook, sheet = _pasta_para_reconstruir(caminho_excel, nome_aba)
+        sheet.append(COLUNAS_EXCEL)
+        total = 0
+        try:
+            with self._abrir() as conexao:
+                # Até o último registro visto agora: o que chegar durante a compactação fica para a próxima
+                ultimo_id = conexao.execute("SELECT COALESCE(MAX(id), 0) FROM selecoes").fetchone()[0]
+                cursor = conexao.execute(
+                    # O histórico importado da planilha (registrado_em = coluna Data) vem antes dos novos
+                    f"SELECT {', '.join(COLUNAS_DIARIO)} FROM selecoes WHERE id <= ? "
+                    "ORDER BY registrado_em, id",
+                    (ultimo_id,),
+                )
+                while True:
+                    lote = cursor.fetchmany(tamanho_lote)
+                    if not lote:
+                        break
+                    for linha in lote:
+                        sheet.append(list(linha))
+                    total += len(lote)
+            workbook.save(temporario)
+
+            # Troca atômica: quem abrir a planilha nunca vê um arquivo pela metade. Se alguém
+            # estiver com ela aberta no Excel, o Windows recusa a troca e a próxima execução tenta de novo.
+            os.replace(temporario, caminho_excel)
+        except PermissionError:
+            logging.warning(
+                f"Compactação adiada: {caminho_excel} está em uso por outro usuário."
+            )
+            raise
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+        with self._abrir() as conexao:
+            conexao.executemany(
+                "INSERT OR REPLACE INTO controle (chave, valor) VALUES (?, ?)",
+                [
+                    ("compactado_em", datetime.datetime.now().isoformat(timespec="seconds")),
+                    ("compactado_id", str(ultimo_id)),
+                ],
+            )
+        logging.info(f"Diário: {total} linha(s) compactada(s) em {caminho_excel}")
+        return total
+
+    def compactacao_pendente(self) -> bool:
+        # Há seleções registradas depois da última compactação? (consulta pelo índice da chave)
+        with self._abrir() as conexao:
+            ultimo_id = conexao.execute("SELECT MAX(id) FROM selecoes").fetchone()[0]
+            linha = conexao.execute(
+                "SELECT valor FROM controle WHERE chave = 'compactado_id'"
+            ).fetchone()
+        return ultimo_id is not None and (linha is None or ultimo_id > int(linha[0]))
+
+    def compactado_em(self) -> str:
+        with self._abrir() as conexao:
+            linha = conexao.execute(
+                "SELECT valor FROM controle WHERE chave = 'compactado_em'"
+            ).fetchone()
+        return linha[0] if linha else None
+
+
+def _pasta_para_reconstruir(caminho_excel: str, nome_aba: str):
+    # (workbook, aba de dados vazia). Arquivo novo ou só com a aba de dados: write_only, as
+    # linhas vão direto para o arquivo. Com outras abas (tabelas dinâmicas, gráficos dos
+    # gestores): a pasta é carregada inteira e só a aba de dados é trocada, na mesma posição.
+    abas = []
+    if os.path.exists(caminho_excel):
+        leitura = openpyxl.load_workbook(caminho_excel, read_only=True)
+        try:
+            abas = leitura.sheetnames
+        finally:
+            leitura.close()
+    if all(aba == nome_aba for aba in abas):
+        workbook = openpyxl.Workbook(write_only=True)
+        return workbook, workbook.create_sheet(title=nome_aba)
+
+    workbook = openpyxl.load_workbook(caminho_excel)
+    aba_ativa = workbook.active.title
+    posicao = abas.index(nome_aba) if nome_aba in abas else len(abas)
+    if nome_aba in abas:
+        workbook.remove(workbook[nome_aba])
+    sheet = workbook.create_sheet(title=nome_aba, index=posicao)
+    workbook.active = workbook.sheetnames.index(aba_ativa)
+    return workbook, sheet
+
+
+def _data_iso(valor) -> str:
+    # Converte a coluna Data (dd/mm/aaaa ou datetime) em ISO para o filtro 'desde'
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    try:
+        return datetime.datetime.strptime(str(valor), "%d/%m/%Y").date().isoformat()
+    except (TypeError, ValueError):
+        return ""
+
+
+if __name__ == "__main__":
+    from settings import DIARIO_EXCEL_PATH, DIARIO_PATH
+
+    parser = argparse.ArgumentParser(description="Diário de auditoria do After Market.")
+    parser.add_argument("--caminho", default=DIARIO_PATH)
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    parser_compactar = subcomandos.add_parser("compactar", help="Reconstrói a aba de dados da planilha.")
+    parser_compactar.add_argument("--excel", default=DIARIO_EXCEL_PATH)
+    parser_compactar.add_argument("--aba", default=NOME_ABA)
+
+    parser_consultar = subcomandos.add_parser("consultar", help="Lista registros do diário.")
+    parser_consultar.add_argument("--planta")
+    parser_consultar.add_argument("--loja")
+    parser_consultar.add_argument("--pn")
+    parser_consultar.add_argument("--usuario")
+    parser_consultar.add_argument("--desde", help="AAAA-MM-DD")
+    args = parser.parse_args()
+
+    diario = DiarioAuditoria(args.caminho)
+    if args.comando == "compactar":
+        total = diario.compactar_excel(os.path.normpath(args.excel), args.aba)
+        print(f"{total} linha(s) gravada(s).")
+    else:
+        print(
+            diario.consultar(args.planta, args.loja, args.pn, args.usuario, args.desde)
+            .to_string(index=False)
+        )
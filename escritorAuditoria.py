@@ -0,0 +1,296 @@
+# escritorAuditoria.py
+# Escritor único, em thread de fundo, para os registros de auditoria que vão para a rede
+# (planilha compartilhada e log de uso). A interface só enfileira em uma fila durável
+# local (SQLite) e retorna; o escritor agrupa o que estiver pendente em uma escrita por
+# descarga e, se o arquivo estiver bloqueado, tenta de novo com backoff fora da requisição.
+# A seleção enviada pela tela só vai para o diário (custo proporcional às linhas
+# selecionadas); a planilha do diário é reconstruída a cada AUDITORIA_INTERVALO_COMPACTACAO
+# segundos, se houver seleções novas, ou sob demanda (solicitar_compactacao / diarioAuditoria.py).
+#
+# Não usar st.* aqui: a thread não pertence a nenhuma sessão do Streamlit.
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+import metricas
+from diarioAuditoria import CompactacaoEmAndamento, DiarioAuditoria
+from logUso import LogUso
+from settings import (
+    AUDITORIA_BACKOFF_MAX,
+    AUDITORIA_INTERVALO_COMPACTACAO,
+    AUDITORIA_INTERVALO_FLUSH,
+    DIARIO_EXCEL_PATH,
+    DIARIO_PATH,
+    FILA_AUDITORIA_PATH,
+    FOLDER_LOG_PATH,
+)
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS fila (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        payload TEXT,
+        criado_em REAL NOT NULL,
+        tentativas INTEGER NOT NULL DEFAULT 0,
+        proxima_tentativa REAL NOT NULL DEFAULT 0
+    );
+"""
+
+TIPO_USO = "uso"
+TIPO_COMPACTACAO = "compactacao"
+CAMPO_PASTA = "_pasta"  # Pasta de log de uso diferente da do escritor, dentro do registro
+BACKOFF_INICIAL = 5.0
+JANELA_AGRUPAMENTO = 1.0
+
+
+class EscritorAuditoria:
+    def __init__(
+        self,
+        caminho_fila: str,
+        diario: DiarioAuditoria,
+        caminho_excel: str,
+        pasta_log_csv: str,
+        intervalo: float = AUDITORIA_INTERVALO_FLUSH,
+        backoff_maximo: float = AUDITORIA_BACKOFF_MAX,
+        intervalo_compactacao: float = AUDITORIA_INTERVALO_COMPACTACAO,
+    ):
+        self.caminho_fila = caminho_fila
+        self.diario = diario
+        self.caminho_excel = caminho_excel  # Planilha dos gestores (DIARIO_EXCEL_PATH)
+        self.pasta_log_csv = pasta_log_csv
+        self.log_uso = LogUso(pasta_log_csv)
+        self._logs_uso = {os.path.normpath(pasta_log_csv): self.log_uso}
+        self.intervalo = intervalo
+        self.backoff_maximo = backoff_maximo
+        self.intervalo_compactacao = intervalo_compactacao
+        self._proxima_compactacao = time.monotonic() + intervalo_compactacao
+
+        os.makedirs(os.path.dirname(os.path.abspath(caminho_fila)), exist_ok=True)
+        with self._abrir() as conexao:
+            conexao.executescript(ESQUEMA)
+
+        self._evento = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._estatisticas = {
+            "descargas": 0,
+            "registros_gravados": 0,
+            "falhas": 0,
+            "ultima_falha": None,
+            "latencia_ultima_ms": 0.0,
+            "latencia_total_ms": 0.0,
+            "latencia_max_ms": 0.0,
+        }
+
+    @contextmanager
+    def _abrir(self):
+        conexao = sqlite3.connect(self.caminho_fila, timeout=30)
+        try:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            with conexao:
+                yield conexao
+        finally:
+            conexao.close()
+
+    # --- Lado da requisição: só grava na fila local e retorna ---
+    def _enfileirar(self, tipo: str, payload: dict = None) -> None:
+        with self._abrir() as conexao:
+            conexao.execute(
+                "INSERT INTO fila (tipo, payload, criado_em) VALUES (?, ?, ?)",
+                (tipo, json.dumps(payload, ensure_ascii=False, default=str), time.time()),
+            )
+        self._evento.set()
+
+    def enfileirar_uso(self, registro: dict, pasta: str = None) -> None:
+        # pasta: log de uso em outra pasta (padrão: pasta_log_csv do escritor)
+        if pasta and os.path.normpath(pasta) != os.path.normpath(self.pasta_log_csv):
+            registro = {**registro, CAMPO_PASTA: pasta}
+        self._enfileirar(TIPO_USO, registro)
+
+    def enfileirar_selecao(self, df_log: pd.DataFrame, usuario: str = None) -> int:
+        # Só o diário local (durável); a planilha é reconstruída pela compactação periódica
+        return self.diario.registrar(df_log, usuario=usuario)
+
+    def solicitar_compactacao(self) -> None:
+        # Sob demanda: a próxima descarga reconstrói a planilha do diário
+        self._enfileirar(TIPO_COMPACTACAO)
+
+    def _agendar_compactacao(self) -> None:
+        # No timer, e só se houver seleções novas e nenhuma compactação já na fila (ex.: adiada)
+        if not self.intervalo_compactacao or time.monotonic() < self._proxima_compactacao:
+            return
+        self._proxima_compactacao = time.monotonic() + self.intervalo_compactacao
+        with self._abrir() as conexao:
+            na_fila = conexao.execute(
+                "SELECT 1 FROM fila WHERE tipo = ? LIMIT 1", (TIPO_COMPACTACAO,)
+            ).fetchone()
+        if not na_fila and self.diario.compactacao_pendente():
+            self._enfileirar(TIPO_COMPACTACAO)
+
+    # --- Thread do escritor ---
+    def iniciar(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(
+            target=self._executar, name="escritor-auditoria", daemon=True
+        )
+        self._thread.start()
+
+    def parar(self, timeout: float = 30.0) -> None:
+        self._parar.set()
+        self._evento.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _executar(self) -> None:
+        # Pendências de uma execução anterior (fila durável) são tratadas logo no início
+        while not self._parar.is_set():
+            try:
+                self._agendar_compactacao()
+                self.descarregar()
+            except Exception as e:
+                logging.error(f"Escritor de auditoria: erro inesperado na descarga: {e}")
+            # Acorda com o primeiro registro novo (ou a cada 'intervalo', para os adiados)
+            # e espera um pouco para agrupar os cliques seguintes na mesma escrita
+            if self._evento.wait(self.intervalo):
+                self._parar.wait(JANELA_AGRUPAMENTO)
+            self._evento.clear()
+        self.descarregar()
+
+    def descarregar(self) -> int:
+        agora = time.time()
+        with self._abrir() as conexao:
+            pendentes = conexao.execute(
+                "SELECT id, tipo, payload, tentativas FROM fila "
+                "WHERE proxima_tentativa <= ? ORDER BY id",
+                (agora,),
+            ).fetchall()
+        if not pendentes:
+            return 0
+
+        inicio = time.perf_counter()
+        gravados = 0
+        for tipo, gravar in ((TIPO_USO, self._gravar_usos), (TIPO_COMPACTACAO, self._compactar)):
+            itens = [item for item in pendentes if item[1] == tipo]
+            if not itens:
+                continue
+            try:
+                gravar([json.loads(item[2]) if item[2] else None for item in itens])
+            except CompactacaoEmAndamento as e:
+                self._adiar(itens, e, payload={"repetir_se_pendente": True})
+                continue
+            except Exception as e:
+                self._adiar(itens, e)
+                continue
+            with self._abrir() as conexao:
+                conexao.executemany(
+                    "DELETE FROM fila WHERE id = ?", [(item[0],) for item in itens]
+                )
+            gravados += len(itens)
+
+        latencia_ms = 1000 * (time.perf_counter() - inicio)
+        metricas.registrar_fase("descarga_auditoria", latencia_ms / 1000)
+        with self._lock:
+            self._estatisticas["descargas"] += 1
+            self._estatisticas["registros_gravados"] += gravados
+            self._estatisticas["latencia_ultima_ms"] = round(latencia_ms, 2)
+            self._estatisticas["latencia_total_ms"] += latencia_ms
+            self._estatisticas["latencia_max_ms"] = max(
+                self._estatisticas["latencia_max_ms"], round(latencia_ms, 2)
+            )
+        return gravados
+
+    def _adiar(self, itens: list, erro: Exception, payload: dict = None) -> None:
+        # Backoff exponencial por item: arquivo aberto por alguém no Excel, share fora do ar,
+        # compactação de outro worker em andamento etc. payload, se dado, substitui o dos itens
+        tentativas = max(item[3] for item in itens) + 1
+        espera = min(BACKOFF_INICIAL * 2 ** (tentativas - 1), self.backoff_maximo)
+        logging.warning(
+            f"Escritor de auditoria: falha ao gravar {len(itens)} registro(s) "
+            f"({erro}); nova tentativa em {espera:.0f}s."
+        )
+        with self._abrir() as conexao:
+            if payload is not None:
+                conexao.executemany(
+                    "UPDATE fila SET payload = ? WHERE id = ?",
+                    [(json.dumps(payload), item[0]) for item in itens],
+                )
+            conexao.executemany(
+                "UPDATE fila SET tentativas = ?, proxima_tentativa = ? WHERE id = ?",
+                [(tentativas, time.time() + espera, item[0]) for item in itens],
+            )
+        with self._lock:
+            self._estatisticas["falhas"] += 1
+            self._estatisticas["ultima_falha"] = (
+                f"{datetime.datetime.now().isoformat(timespec='seconds')}: {erro}"
+            )
+
+    def _gravar_usos(self, registros: list) -> None:
+        # Todos os registros pendentes de cada pasta em um único acréscimo ao log de uso do mês
+        por_pasta = {}
+        for registro in registros:
+            pasta = os.path.normpath(registro.pop(CAMPO_PASTA, None) or self.pasta_log_csv)
+            por_pasta.setdefault(pasta, []).append(registro)
+        for pasta, grupo in por_pasta.items():
+            if pasta not in self._logs_uso:
+                self._logs_uso[pasta] = LogUso(pasta)
+            self._logs_uso[pasta].registrar(grupo)
+
+    def _compactar(self, pedidos: list) -> None:
+        # Vários pedidos pendentes viram uma única reconstrução da planilha. Com vários workers,
+        # só um compacta por vez (trava ao lado da planilha). A compactação do outro pode ter
+        # começado antes das nossas seleções chegarem ao diário: CompactacaoEmAndamento sobe e
+        # o pedido volta para a fila com backoff, como a planilha aberta no Excel. Na nova
+        # tentativa, se a do outro já cobriu tudo (nada pendente no diário), não há o que refazer.
+        if any(pedido and pedido.get("repetir_se_pendente") for pedido in pedidos) and (
+            not self.diario.compactacao_pendente()
+        ):
+            return
+        self.diario.compactar_excel(self.caminho_excel)
+
+    def estatisticas(self) -> dict:
+        with self._abrir() as conexao:
+            profundidade, mais_antigo = conexao.execute(
+                "SELECT COUNT(*), MIN(criado_em) FROM fila"
+            ).fetchone()
+        with self._lock:
+            estatisticas = dict(self._estatisticas)
+        descargas = estatisticas.pop("descargas")
+        latencia_total = estatisticas.pop("latencia_total_ms")
+        return {
+            "profundidade_fila": profundidade,
+            "idade_mais_antigo_s": round(time.time() - mais_antigo, 1) if mais_antigo else 0.0,
+            "descargas": descargas,
+            "latencia_media_ms": round(latencia_total / descargas, 2) if descargas else 0.0,
+            "ativo": self._thread is not None and self._thread.is_alive(),
+            **estatisticas,
+        }
+
+
+# Um escritor por processo, compartilhado por todas as sessões
+_escritor = None
+_escritor_lock = threading.Lock()
+
+
+def obter_escritor() -> EscritorAuditoria:
+    global _escritor
+    with _escritor_lock:
+        if _escritor is None:
+            _escritor = EscritorAuditoria(
+                FILA_AUDITORIA_PATH,
+                DiarioAuditoria(DIARIO_PATH),
+                os.path.normpath(DIARIO_EXCEL_PATH),
+                FOLDER_LOG_PATH,
+            )
+            _escritor.iniciar()
+            metricas.registrar_coletor("auditoria", _escritor.estatisticas)
+        return _escritor
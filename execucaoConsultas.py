@@ -0,0 +1,124 @@
+# execucaoConsultas.py
+# Execução de consultas em segundo plano com cancelamento do comando em andamento no ODBC.
+# Assim a thread do script do Streamlit não fica presa e uma consulta superada (filtros
+# alterados ou botão "Cancelar") libera o SQL Server na hora.
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from settings import CONSULTAS_WORKERS
+
+
+class ConsultaCancelada(Exception):
+    pass
+
+
+class ControleCancelamento:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cursores = []
+        self.cancelado = False
+
+    def registrar(self, cursor) -> None:
+        with self._lock:
+            if self.cancelado:
+                raise ConsultaCancelada("Consulta cancelada antes de iniciar.")
+            self._cursores.append(cursor)
+
+    def liberar(self, cursor) -> None:
+        with self._lock:
+            if cursor in self._cursores:
+                self._cursores.remove(cursor)
+
+    def cancelar(self) -> None:
+        with self._lock:
+            self.cancelado = True
+            cursores = list(self._cursores)
+        for cursor in cursores:
+            try:
+                cursor.cancel()  # SQLCancel: interrompe o comando no servidor
+            except Exception as e:
+                logging.warning(f"Falha ao cancelar cursor: {e}")
+
+
+@contextmanager
+def cursor_cancelavel(connection, controle: ControleCancelamento = None):
+    cursor = connection.cursor()
+    if controle is None:
+        yield cursor
+        return
+
+    controle.registrar(cursor)
+    try:
+        yield cursor
+    except Exception as e:
+        # O driver devolve um erro genérico (ex.: HY008) quando o comando é cancelado
+        if controle.cancelado:
+            raise ConsultaCancelada("Consulta cancelada.") from e
+        raise
+    finally:
+        controle.liberar(cursor)
+
+
+class ConsultaEmAndamento:
+    def __init__(self, filtros: dict, futuro, controle: ControleCancelamento):
+        self.filtros = dict(filtros)
+        self.futuro = futuro
+        self.controle = controle
+        self.iniciada_em = time.monotonic()
+        self.concluida_em = None
+        futuro.add_done_callback(self._marcar_conclusao)
+
+    def _marcar_conclusao(self, _futuro) -> None:
+        self.concluida_em = time.monotonic()
+
+    def decorrido(self) -> float:
+        return (self.concluida_em or time.monotonic()) - self.iniciada_em
+
+    def concluida(self) -> bool:
+        return self.futuro.done()
+
+    def bem_sucedida(self) -> bool:
+        # Concluída sem cancelamento nem exceção: resultado() devolve o valor sem levantar
+        return self.futuro.done() and not self.futuro.cancelled() and self.futuro.exception() is None
+
+    def cancelar(self) -> None:
+        # Se ainda está na fila, nem chega ao banco; se já está rodando, cancela o comando
+        self.futuro.cancel()
+        self.controle.cancelar()
+        logging.info(f"Consulta cancelada após {self.decorrido():.1f}s: {self.filtros}")
+
+    def resultado(self, timeout: float = None):
+        # Futuro cancelado (por esta ou por outra sessão que o compartilha) vira ConsultaCancelada
+        try:
+            return self.futuro.result(timeout)
+        except CancelledError as e:
+            raise ConsultaCancelada("Consulta cancelada.") from e
+
+
+class ExecutorConsultas:
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="consulta"
+        )
+
+    def submeter(self, funcao, filtros: dict, **kwargs) -> ConsultaEmAndamento:
+        # 'funcao' deve aceitar o argumento 'controle' (ex.: RepositorioPrincipal.buscar_dados)
+        controle = ControleCancelamento()
+        futuro = self._executor.submit(funcao, filtros, controle=controle, **kwargs)
+        return ConsultaEmAndamento(filtros, futuro, controle)
+
+
+# Compartilhado por todas as sessões do processo (o Streamlit reexecuta o script a cada interação)
+_executor_padrao = None
+_executor_lock = threading.Lock()
+
+
+def submeter_consulta(funcao, filtros: dict, **kwargs) -> ConsultaEmAndamento:
+    global _executor_padrao
+    with _executor_lock:
+        if _executor_padrao is None:
+            _executor_padrao = ExecutorConsultas(CONSULTAS_WORKERS)
+    return _executor_padrao.submeter(funcao, filtros, **kwargs)
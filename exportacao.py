@@ -0,0 +1,267 @@
+# exportacao.py
+# Exportação em streaming do resultado de buscar_dados para XLSX, CSV e Parquet.
+# As linhas chegam em lotes (direto do cursor via iterar_lotes ou de um DataFrame) e vão
+# para o arquivo à medida que são lidas: o XLSX usa o modo constant_memory do XlsxWriter,
+# que descarrega cada linha no disco, então a memória não cresce com o tamanho da planta.
+#
+# Exemplo:
+#   python exportacao.py --planta 000123 --loja 01 --formato parquet --saida planta.parquet
+import argparse
+import csv
+import datetime
+import io
+import logging
+import math
+import os
+import time
+
+import pandas as pd
+import xlsxwriter
+
+import metricas
+from resultadoColunar import tipo_coluna
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; só é necessário para formato="parquet"
+    pa = None
+    pq = None
+
+FORMATOS = ("xlsx", "csv", "parquet")
+FORMATO_DATA = "dd/mm/yyyy"
+FORMATO_DECIMAL = "#,##0.00"
+FORMATO_INTEIRO = "0"
+NOME_ABA = "After Market"
+
+
+# --- Normalização de valores (pyodbc devolve date/Decimal; DataFrames, Timestamp/NaN) ---
+def _vazio(valor) -> bool:
+    return valor is None or valor is pd.NaT or (isinstance(valor, float) and math.isnan(valor))
+
+
+def _data(valor):
+    if _vazio(valor):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        valor = valor.to_pydatetime()
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    try:
+        return pd.Timestamp(valor).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _numero(valor):
+    if _vazio(valor):
+        return None
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _texto(valor):
+    if _vazio(valor):
+        return None
+    return str(valor)
+
+
+NORMALIZADORES = {
+    "data": _data,
+    "decimal": _numero,
+    "inteiro": _numero,
+    "categoria": _texto,
+    "texto": _texto,
+}
+
+
+def lotes_de_dataframe(df: pd.DataFrame, tamanho_lote: int = 2000):
+    # Mesmo formato de RepositorioPrincipal.iterar_lotes: (colunas, lista de tuplas)
+    colunas = list(df.columns)
+    for inicio in range(0, len(df), tamanho_lote):
+        yield colunas, list(df.iloc[inicio:inicio + tamanho_lote].itertuples(index=False, name=None))
+
+
+def _tamanho(destino) -> int:
+    if isinstance(destino, (str, os.PathLike)):
+        return os.path.getsize(destino)
+    if isinstance(destino, io.BytesIO):
+        return destino.getbuffer().nbytes
+    return 0
+
+
+# --- Escritores ---
+def _exportar_xlsx(lotes, destino) -> int:
+    workbook = xlsxwriter.Workbook(destino, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(NOME_ABA)
+    formato_cabecalho = workbook.add_format({"bold": True})
+    formatos = {
+        "data": workbook.add_format({"num_format": FORMATO_DATA}),
+        "decimal": workbook.add_format({"num_format": FORMATO_DECIMAL}),
+        "inteiro": workbook.add_format({"num_format": FORMATO_INTEIRO}),
+    }
+
+    linha = 0
+    escritores = None
+    try:
+        for colunas, lote in lotes:
+            if escritores is None:
+                # No modo constant_memory as linhas precisam ser gravadas em ordem; o
+                # cabeçalho e as larguras são definidos antes da primeira linha de dados
+                tipos = [tipo_coluna(nome) for nome in colunas]
+                for indice, (nome, tipo) in enumerate(zip(colunas, tipos)):
+                    worksheet.set_column(indice, indice, max(12, min(len(nome) + 2, 40)))
+                    worksheet.write_string(0, indice, nome, formato_cabecalho)
+                worksheet.freeze_panes(1, 0)
+                escritores = [
+                    (
+                        NORMALIZADORES[tipo],
+                        worksheet.write_datetime if tipo == "data"
+                        else worksheet.write_number if tipo in ("decimal", "inteiro")
+                        else worksheet.write_string,
+                        formatos.get(tipo),
+                    )
+                    for tipo in tipos
+                ]
+                linha = 1
+            for registro in lote:
+                for indice, valor in enumerate(registro):
+                    normalizar, escrever, formato = escritores[indice]
+                    valor = normalizar(valor)
+                    if valor is not None:
+                        escrever(linha, indice, valor, formato)
+                linha += 1
+    finally:
+        workbook.close()
+    return max(linha - 1, 0)
+
+
+def _exportar_csv(lotes, destino) -> int:
+    # Mesmo padrão dos demais CSVs do projeto: ';', UTF-8 com BOM e datas dd/mm/aaaa
+    proprio = isinstance(destino, (str, os.PathLike))
+    if proprio:
+        arquivo = open(destino, "w", encoding="utf-8-sig", newline="")
+    else:
+        arquivo = io.TextIOWrapper(destino, encoding="utf-8-sig", newline="", write_through=True)
+    linhas = 0
+    try:
+        escritor = csv.writer(arquivo, delimiter=";")
+        normalizadores = None
+        for colunas, lote in lotes:
+            if normalizadores is None:
+                tipos = [tipo_coluna(nome) for nome in colunas]
+                normalizadores = [NORMALIZADORES[tipo] for tipo in tipos]
+                formatadores = [
+                    (lambda v: v.strftime("%d/%m/%Y")) if tipo == "data" else None for tipo in tipos
+                ]
+                escritor.writerow(colunas)
+            for registro in lote:
+                valores = []
+                for valor, normalizar, formatar in zip(registro, normalizadores, formatadores):
+                    valor = normalizar(valor)
+                    valores.append("" if valor is None else formatar(valor) if formatar else valor)
+                escritor.writerow(valores)
+            linhas += len(lote)
+    finally:
+        if proprio:
+            arquivo.close()
+        else:
+            arquivo.detach()  # Não fecha o buffer do chamador
+    return linhas
+
+
+def _esquema_arrow(colunas: list):
+    tipos_arrow = {
+        "data": pa.date32(),
+        "decimal": pa.float64(),
+        "inteiro": pa.int64(),
+        "categoria": pa.string(),
+        "texto": pa.string(),
+    }
+    return pa.schema([(nome, tipos_arrow[tipo_coluna(nome)]) for nome in colunas])
+
+
+def _exportar_parquet(lotes, destino) -> int:
+    if pq is None:
+        raise RuntimeError("pyarrow não está instalado; necessário para exportar em Parquet.")
+    escritor = None
+    linhas = 0
+    try:
+        for colunas, lote in lotes:
+            if escritor is None:
+                esquema = _esquema_arrow(colunas)
+                normalizadores = [NORMALIZADORES[tipo_coluna(nome)] for nome in colunas]
+                escritor = pq.ParquetWriter(destino, esquema, compression="snappy")
+            if not lote:
+                continue
+            arrays = []
+            for indice, valores in enumerate(zip(*lote)):
+                normalizar = normalizadores[indice]
+                campo = esquema.field(indice)
+                valores = [normalizar(valor) for valor in valores]
+                if pa.types.is_integer(campo.type):
+                    valores = [None if valor is None else int(valor) for valor in valores]
+                arrays.append(pa.array(valores, type=campo.type))
+            # Cada lote vira um row group: só o lote atual fica em memória
+            escritor.write_table(pa.Table.from_arrays(arrays, schema=esquema))
+            linhas += len(lote)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return linhas
+
+
+EXPORTADORES = {"xlsx": _exportar_xlsx, "csv": _exportar_csv, "parquet": _exportar_parquet}
+
+
+def exportar(lotes, destino, formato: str = "xlsx") -> dict:
+    # lotes: iterável de (colunas, lote) como em iterar_lotes/lotes_de_dataframe
+    # destino: caminho de arquivo ou buffer binário (ex.: io.BytesIO para download/anexo)
+    if formato not in EXPORTADORES:
+        raise ValueError(f"Formato desconhecido: {formato}. Opções: {FORMATOS}")
+    inicio = time.perf_counter()
+    linhas = EXPORTADORES[formato](lotes, destino)
+    segundos = time.perf_counter() - inicio
+    metricas.registrar_fase("exportacao", segundos, formato=formato, linhas=linhas)
+    tamanho = _tamanho(destino)
+    estatisticas = {
+        "formato": formato,
+        "linhas": linhas,
+        "bytes": tamanho,
+        "segundos": round(segundos, 3),
+        "bytes_por_segundo": round(tamanho / segundos, 1) if segundos else 0.0,
+        "linhas_por_segundo": round(linhas / segundos, 1) if segundos else 0.0,
+    }
+    logging.info(f"Exportação concluída: {estatisticas}")
+    return estatisticas
+
+
+def exportar_consulta(repositorio, filtros: dict, destino, formato: str = "xlsx", tamanho_lote: int = 2000) -> dict:
+    # Do cursor para o arquivo, sem materializar o resultado (nem o limite de linhas da interface)
+    return exportar(repositorio.iterar_lotes(filtros, tamanho_lote), destino, formato)
+
+
+if __name__ == "__main__":
+    from consultaBD import RepositorioPrincipal
+
+    parser = argparse.ArgumentParser(description="Exporta o resultado de uma planta em streaming.")
+    parser.add_argument("--planta", required=True)
+    parser.add_argument("--loja", required=True)
+    parser.add_argument("--formato", choices=FORMATOS, default="xlsx")
+    parser.add_argument("--saida", required=True)
+    parser.add_argument("--tamanho-lote", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(
+        exportar_consulta(
+            RepositorioPrincipal(),
+            {"planta": args.planta, "loja": args.loja},
+            args.saida,
+            args.formato,
+            args.tamanho_lote,
+        )
+    )
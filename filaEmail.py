@@ -0,0 +1,328 @@
+# filaEmail.py
+# Despacho de e-mails em segundo plano. Os anexos são renderizados em memória (sem arquivo
+# temporário), a sessão só enfileira e recebe um id para acompanhar o status, e uma thread
+# por processo envia em lotes reaproveitando a mesma conexão SMTP, com nova tentativa e
+# backoff para falhas temporárias.
+#
+# Não usar st.* aqui: a thread não pertence a nenhuma sessão do Streamlit.
+import heapq
+import io
+import itertools
+import logging
+import smtplib
+import threading
+import time
+import uuid
+import zipfile
+from email.message import EmailMessage
+
+import pandas as pd
+
+import metricas
+from exportacao import exportar, lotes_de_dataframe
+from settings import (
+    EMAIL_COMPRIMIR_ACIMA_MB,
+    EMAIL_CONEXAO_OCIOSA,
+    EMAIL_MAX_TENTATIVAS,
+    EMAIL_TAMANHO_LOTE,
+    SMTP_PASSWORD,
+    SMTP_PORT,
+    SMTP_SERVER,
+    SMTP_USER,
+)
+
+BACKOFF_INICIAL = 10.0
+BACKOFF_MAXIMO = 600.0
+STATUS_RETIDO = 3600.0  # Segundos que o status de um e-mail concluído fica disponível
+
+
+# --- Anexos em memória ---
+def renderizar_anexo(df: pd.DataFrame, nome_base: str) -> tuple:
+    # Devolve (conteúdo, nome do arquivo, maintype, subtype)
+    buffer = io.BytesIO()
+    exportar(lotes_de_dataframe(df), buffer, "xlsx")
+    conteudo = buffer.getvalue()
+    if len(conteudo) <= EMAIL_COMPRIMIR_ACIMA_MB * 1024 * 1024:
+        return (
+            conteudo,
+            f"{nome_base}.xlsx",
+            "application",
+            "vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+
+    # O .xlsx já é compactado internamente; para anexos grandes, um CSV dentro de um .zip
+    # fica bem menor e ainda abre direto no Excel depois de extraído
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as arquivo:
+        with arquivo.open(f"{nome_base}.csv", "w") as destino:
+            exportar(lotes_de_dataframe(df), destino, "csv")
+    logging.info(
+        f"Anexo {nome_base}: {len(conteudo) / 1024 / 1024:.1f} MB em xlsx, "
+        f"{len(buffer.getvalue()) / 1024 / 1024:.1f} MB compactado."
+    )
+    return buffer.getvalue(), f"{nome_base}.zip", "application", "zip"
+
+
+def montar_mensagem(
+    remetente: str,
+    destinatario: str,
+    assunto: str,
+    corpo: str,
+    anexos: list = (),
+    cc: str = None,
+) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = assunto
+    msg["From"] = remetente
+    msg["To"] = destinatario
+    if cc:
+        msg["Cc"] = cc
+    msg.set_content(corpo)
+    for conteudo, nome_arquivo, maintype, subtype in anexos:
+        msg.add_attachment(conteudo, maintype=maintype, subtype=subtype, filename=nome_arquivo)
+    return msg
+
+
+def montar_notificacao(
+    remetente: str,
+    destinatario: str,
+    usuario: str,
+    df_principal: pd.DataFrame,
+    df_selecao: pd.DataFrame,
+) -> EmailMessage:
+    # E-mail "Análise de After Market" da tela: filtrado e seleção como anexos, cópia para o usuário
+    anexos = []
+    if not df_principal.empty:
+        anexos.append(renderizar_anexo(df_principal, "After_Market_Filtrado"))
+    if not df_selecao.empty:
+        anexos.append(renderizar_anexo(df_selecao, "After_Market_Selecao"))
+    return montar_mensagem(
+        remetente=remetente,
+        destinatario=destinatario,
+        assunto=f"Análise de After Market - {time.strftime('%d/%m/%Y')}",
+        corpo="Segue em anexo o relatório de análise de After Market.\n\nAtenciosamente,\nBot",
+        anexos=anexos,
+        cc=f"{usuario}@example.com",
+    )
+
+
+def _temporaria(erro: Exception) -> bool:
+    # 4xx e quedas de conexão valem nova tentativa; 5xx (destinatário inválido etc.) não
+    if isinstance(erro, smtplib.SMTPResponseException):
+        return 400 <= erro.smtp_code < 500
+    if isinstance(erro, smtplib.SMTPRecipientsRefused):
+        return all(400 <= codigo < 500 for codigo, _ in erro.recipients.values())
+    return _conexao_perdida(erro)
+
+
+def _conexao_perdida(erro: Exception) -> bool:
+    # SMTPException herda de OSError, mas só quedas de rede invalidam a conexão
+    return isinstance(erro, smtplib.SMTPServerDisconnected) or (
+        isinstance(erro, OSError) and not isinstance(erro, smtplib.SMTPException)
+    )
+
+
+class DespachanteEmail:
+    def __init__(
+        self,
+        servidor: str,
+        porta: int,
+        usuario: str = None,
+        senha: str = None,
+        tamanho_lote: int = EMAIL_TAMANHO_LOTE,
+        max_tentativas: int = EMAIL_MAX_TENTATIVAS,
+        conexao_ociosa: float = EMAIL_CONEXAO_OCIOSA,
+        backoff_inicial: float = BACKOFF_INICIAL,
+    ):
+        self.servidor = servidor
+        self.porta = porta
+        self.usuario = usuario
+        self.senha = senha
+        self.tamanho_lote = tamanho_lote
+        self.max_tentativas = max_tentativas
+        self.conexao_ociosa = conexao_ociosa
+        self.backoff_inicial = backoff_inicial
+
+        self._pendentes = []  # heap de (quando, ordem, id, mensagem)
+        self._ordem = itertools.count()
+        self._condicao = threading.Condition()
+        self._status = {}
+        self._smtp = None
+        self._ultimo_uso = 0.0
+        self._parar = False
+        self._thread = None
+        self._contadores = {"enviados": 0, "falhas": 0, "tentativas": 0, "conexoes": 0, "lotes": 0}
+
+    # --- Lado da sessão ---
+    def enfileirar(self, msg: EmailMessage) -> str:
+        id_envio = uuid.uuid4().hex
+        with self._condicao:
+            self._status[id_envio] = {
+                "status": "na_fila",
+                "tentativas": 0,
+                "erro": None,
+                "destinatario": msg["To"],
+                "assunto": msg["Subject"],
+                "atualizado_em": time.time(),
+            }
+            heapq.heappush(self._pendentes, (time.time(), next(self._ordem), id_envio, msg))
+            self._condicao.notify()
+        return id_envio
+
+    def status(self, id_envio: str) -> dict:
+        with self._condicao:
+            registro = self._status.get(id_envio)
+            return dict(registro) if registro else None
+
+    def estatisticas(self) -> dict:
+        with self._condicao:
+            return {
+                "na_fila": len(self._pendentes),
+                "conexao_aberta": self._smtp is not None,
+                **self._contadores,
+            }
+
+    # --- Thread de envio ---
+    def iniciar(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._parar = False
+        self._thread = threading.Thread(target=self._executar, name="fila-email", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout: float = 30.0) -> None:
+        with self._condicao:
+            self._parar = True
+            self._condicao.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._fechar_conexao()
+
+    def _proximo_lote(self) -> list:
+        while True:
+            ociosa = False
+            with self._condicao:
+                if self._parar:
+                    return []
+                agora = time.time()
+                if self._pendentes and self._pendentes[0][0] <= agora:
+                    lote = []
+                    while (
+                        self._pendentes
+                        and self._pendentes[0][0] <= time.time()
+                        and len(lote) < self.tamanho_lote
+                    ):
+                        lote.append(heapq.heappop(self._pendentes))
+                    self._contadores["lotes"] += 1
+                    return lote
+                espera = self._pendentes[0][0] - agora if self._pendentes else self.conexao_ociosa
+                ociosa = not self._condicao.wait(timeout=espera) and not self._pendentes
+            if ociosa:
+                # Sem nada para enviar: não segura a conexão do relay indefinidamente. Fora do
+                # lock: o quit() vai ao relay (até 30 s) e enfileirar/status das sessões esperariam
+                self._fechar_conexao()
+
+    def _executar(self) -> None:
+        while True:
+            lote = self._proximo_lote()
+            if not lote:
+                return
+            for _, _, id_envio, msg in lote:
+                self._enviar(id_envio, msg)
+            self._limpar_status()
+
+    def _conexao(self) -> smtplib.SMTP:
+        if self._smtp is not None and time.time() - self._ultimo_uso > self.conexao_ociosa:
+            # O relay costuma derrubar conexões paradas; confirma antes de reutilizar
+            try:
+                self._smtp.noop()
+            except smtplib.SMTPException:
+                self._fechar_conexao()
+        if self._smtp is None:
+            self._smtp = smtplib.SMTP(self.servidor, self.porta, timeout=30)
+            if self.usuario and self.senha:
+                self._smtp.login(self.usuario, self.senha)
+            self._contar("conexoes")
+        return self._smtp
+
+    def _fechar_conexao(self) -> None:
+        # Só a thread de envio (ou parar(), depois dela) usa a conexão; o quit() fica fora do lock
+        with self._condicao:
+            smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def _atualizar(self, id_envio: str, **campos) -> None:
+        with self._condicao:
+            self._status[id_envio].update(campos, atualizado_em=time.time())
+
+    def _contar(self, contador: str) -> None:
+        # Sob o mesmo lock em que estatisticas() lê os contadores
+        with self._condicao:
+            self._contadores[contador] += 1
+
+    def _enviar(self, id_envio: str, msg: EmailMessage) -> None:
+        tentativas = self._status[id_envio]["tentativas"] + 1
+        self._atualizar(id_envio, status="enviando", tentativas=tentativas)
+        self._contar("tentativas")
+        inicio = time.perf_counter()
+        try:
+            self._conexao().send_message(msg)
+            self._ultimo_uso = time.time()
+            metricas.registrar_fase("smtp_envio", time.perf_counter() - inicio)
+        except Exception as e:
+            metricas.registrar_fase("smtp_envio", time.perf_counter() - inicio, erro=type(e).__name__)
+            if _conexao_perdida(e):
+                self._smtp = None  # A próxima tentativa abre uma conexão nova
+            if _temporaria(e) and tentativas < self.max_tentativas:
+                espera = min(self.backoff_inicial * 2 ** (tentativas - 1), BACKOFF_MAXIMO)
+                logging.warning(
+                    f"E-mail {id_envio} para {msg['To']}: falha temporária ({e}); "
+                    f"nova tentativa em {espera:.0f}s."
+                )
+                self._atualizar(id_envio, status="aguardando_nova_tentativa", erro=str(e))
+                with self._condicao:
+                    heapq.heappush(
+                        self._pendentes, (time.time() + espera, next(self._ordem), id_envio, msg)
+                    )
+            else:
+                logging.error(f"E-mail {id_envio} para {msg['To']} não enviado: {e}")
+                self._atualizar(id_envio, status="falhou", erro=str(e))
+                self._contar("falhas")
+            return
+
+        logging.info(f"E-mail {id_envio} enviado para {msg['To']}.")
+        self._atualizar(id_envio, status="enviado", erro=None)
+        self._contar("enviados")
+
+    def _limpar_status(self) -> None:
+        limite = time.time() - STATUS_RETIDO
+        with self._condicao:
+            for id_envio in [
+                chave
+                for chave, registro in self._status.items()
+                if registro["status"] in ("enviado", "falhou") and registro["atualizado_em"] < limite
+            ]:
+                del self._status[id_envio]
+
+
+# Um despachante por processo, compartilhado por todas as sessões
+_despachante = None
+_despachante_lock = threading.Lock()
+
+
+def obter_despachante() -> DespachanteEmail:
+    global _despachante
+    with _despachante_lock:
+        if _despachante is None:
+            _despachante = DespachanteEmail(
+                SMTP_SERVER, int(SMTP_PORT), SMTP_USER, SMTP_PASSWORD or None
+            )
+            _despachante.iniciar()
+            metricas.registrar_coletor("email", _despachante.estatisticas)
+        return _despachante
+
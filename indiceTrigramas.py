@@ -0,0 +1,363 @@
+# indiceTrigramas.py
+# Índice de trigramas em memória para as buscas por substring de buscar_dados. Os filtros
+# pn_voss/pn_cliente/cliente viram LIKE '%x%' sobre colunas com TRIM/REPLACE, que nenhum
+# índice do SQL Server atende: cada busca varre SA7010/SA1010. Aqui o catálogo de PNs (SA7010)
+# e os nomes de clientes (SA1010) ficam indexados por trigrama no processo; a busca resolve os
+# R_E_C_N_O_ exatos localmente e a consulta recebe só essas chaves (busca de índice no banco).
+#
+# Atualização: a primeira carga é completa; as seguintes leem só R_E_C_N_O_ acima da marca
+# d'água e, a cada CATALOGO_RECONSTRUCAO_SEGUNDOS, o índice é reconstruído (pega alterações e
+# exclusões). Linhas novas ainda não indexadas continuam cobertas pelo LIKE, restrito às
+# R_E_C_N_O_ acima da marca (ver FILTROS_PRODUTOS em modelosConsulta.py). Linhas alteradas só
+# aparecem na reconstrução seguinte; por isso, se a última reconstrução tem mais de
+# CATALOGO_IDADE_MAXIMA_SEGUNDOS, o índice deixa de filtrar e a consulta volta ao LIKE.
+#
+# Exemplo:
+#   python indiceTrigramas.py --planta 000123 --loja 01 --pn-voss 4512
+import argparse
+import logging
+import threading
+import time
+from array import array
+
+import numpy as np
+
+import metricas
+from settings import (
+    CATALOGO_IDADE_MAXIMA_SEGUNDOS,
+    CATALOGO_INTERVALO_SEGUNDOS,
+    CATALOGO_RECONSTRUCAO_SEGUNDOS,
+)
+
+SQL_CATALOGO_PRODUTOS = """
+    SELECT R_E_C_N_O_, TRIM(A7_CLIENTE), TRIM(A7_LOJA), TRIM(A7_PRODUTO),
+           REPLACE(TRIM(A7_CODCLI), ' ', '')
+    FROM [dbo].[SA7010]
+    WHERE D_E_L_E_T_ <> '*' AND R_E_C_N_O_ > ?
+    ORDER BY R_E_C_N_O_
+"""
+
+SQL_CATALOGO_CLIENTES = """
+    SELECT R_E_C_N_O_, TRIM(A1_COD), TRIM(A1_LOJA), TRIM(A1_NOME), TRIM(A1_NREDUZ)
+    FROM [dbo].[SA1010]
+    WHERE D_E_L_E_T_ <> '*' AND R_E_C_N_O_ > ?
+    ORDER BY R_E_C_N_O_
+"""
+
+# Grupos (planta, loja) até este tamanho são verificados direto, sem cruzar listas de trigramas
+LIMITE_VARREDURA = 4096
+# Caracteres que o LIKE interpreta; com eles o filtro continua indo para o banco
+CURINGAS_LIKE = ("%", "_", "[")
+SEPARADOR = "\x1f"  # Entre nome e nome reduzido: nenhum trigrama da consulta o atravessa
+
+
+def normalizar(texto) -> str:
+    # A collation do Protheus (CI_AS) ignora maiúsculas/minúsculas, mas não acentos
+    return (texto or "").upper()
+
+
+def _trigramas(texto: str):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def filtro_indexavel(texto) -> bool:
+    # O índice reproduz LIKE '%x%' só para texto literal, sem espaços nas pontas (as colunas
+    # indexadas são TRIM; o banco ainda compararia o preenchimento do CHAR)
+    return bool(texto) and texto == texto.strip() and not any(c in texto for c in CURINGAS_LIKE)
+
+
+class IndiceTrigramas:
+    # Textos normalizados por id e, por trigrama, os ids que o contêm (array crescente de
+    # uint32: 4 bytes por ocorrência). Não é thread-safe; CatalogoBusca serializa o acesso.
+    def __init__(self):
+        self.textos = []
+        self._postings = {}
+
+    def __len__(self) -> int:
+        return len(self.textos)
+
+    @property
+    def trigramas(self) -> int:
+        return len(self._postings)
+
+    def adicionar(self, texto: str) -> int:
+        id_doc = len(self.textos)
+        texto = normalizar(texto)
+        self.textos.append(texto)
+        for trigrama in _trigramas(texto):
+            lista = self._postings.get(trigrama)
+            if lista is None:
+                lista = self._postings[trigrama] = array("I")
+            lista.append(id_doc)
+        return id_doc
+
+    def _candidatos(self, consulta: str):
+        # Ids que contêm todos os trigramas da consulta (superconjunto; None = consulta curta).
+        # As listas são cruzadas da menor para a maior.
+        trigramas = _trigramas(consulta)
+        if not trigramas:
+            return None
+        listas = []
+        for trigrama in trigramas:
+            lista = self._postings.get(trigrama)
+            if lista is None:
+                return np.empty(0, dtype=np.uint32)
+            listas.append(lista)
+        listas.sort(key=len)
+        ids = np.array(listas[0], dtype=np.uint32)
+        for lista in listas[1:]:
+            if not len(ids):
+                break
+            ids = ids[np.isin(ids, np.frombuffer(lista, dtype=np.uint32), assume_unique=True)]
+        return ids
+
+    def buscar(self, consulta: str, restrito=None) -> list:
+        # Ids cujo texto contém a consulta, em ordem crescente; restrito: só entre estes ids
+        consulta = normalizar(consulta)
+        textos = self.textos
+        if restrito is not None and (len(restrito) <= LIMITE_VARREDURA or len(consulta) < 3):
+            return [i for i in restrito if consulta in textos[i]]
+        ids = self._candidatos(consulta)
+        if ids is None:
+            return [i for i, texto in enumerate(textos) if consulta in texto]
+        if restrito is not None:
+            ids = ids[np.isin(ids, np.asarray(restrito, dtype=np.uint32), assume_unique=True)]
+        return [i for i in ids.tolist() if consulta in textos[i]]
+
+
+class _Estado:
+    # Uma geração do catálogo. A reconstrução monta um _Estado novo fora do lock e o troca
+    # inteiro; a atualização incremental acrescenta ao atual.
+    def __init__(self):
+        self.pn_voss = IndiceTrigramas()
+        self.pn_cliente = IndiceTrigramas()
+        self.produtos = []  # (recno, planta, loja, produto, codcli) por id
+        self.grupos = {}  # (planta, loja) -> array("I") de ids de produto
+        self.clientes_indice = IndiceTrigramas()
+        self.clientes = []  # (recno, planta, loja, nome, nreduz) por id
+        self.marca_produtos = 0
+        self.marca_clientes = 0
+        self.criado_em = time.time()
+
+    def carregar(self, conectar_erp) -> dict:
+        novos = {}
+        with conectar_erp() as conexao:
+            cursor = conexao.cursor()
+            cursor.execute(SQL_CATALOGO_PRODUTOS, (self.marca_produtos,))
+            novos["produtos"] = self._acrescentar_produtos(cursor.fetchall())
+            cursor.execute(SQL_CATALOGO_CLIENTES, (self.marca_clientes,))
+            novos["clientes"] = self._acrescentar_clientes(cursor.fetchall())
+        return novos
+
+    def _acrescentar_produtos(self, linhas) -> int:
+        for recno, planta, loja, produto, codcli in linhas:
+            registro = (int(recno), planta.strip(), loja.strip(), produto.strip(), codcli or "")
+            self.pn_voss.adicionar(registro[3])
+            id_doc = self.pn_cliente.adicionar(registro[4])
+            self.produtos.append(registro)
+            grupo = self.grupos.get(registro[1:3])
+            if grupo is None:
+                grupo = self.grupos[registro[1:3]] = array("I")
+            grupo.append(id_doc)
+            self.marca_produtos = max(self.marca_produtos, registro[0])
+        return len(linhas)
+
+    def _acrescentar_clientes(self, linhas) -> int:
+        for recno, planta, loja, nome, nreduz in linhas:
+            registro = (int(recno), planta.strip(), loja.strip(), nome or "", nreduz or "")
+            self.clientes_indice.adicionar(f"{registro[3]}{SEPARADOR}{registro[4]}")
+            self.clientes.append(registro)
+            self.marca_clientes = max(self.marca_clientes, registro[0])
+        return len(linhas)
+
+
+class CatalogoBusca:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._atualizacao_lock = threading.Lock()
+        self._estado = None
+        self._thread = None
+
+    @property
+    def pronto(self) -> bool:
+        return self._estado is not None
+
+    def atualizar(self, conectar_erp, completo: bool = False) -> dict:
+        # Incremental por R_E_C_N_O_; completo (ou índice vencido) reconstrói do zero
+        with self._atualizacao_lock:
+            inicio = time.perf_counter()
+            estado = self._estado
+            vencido = estado is None or time.time() - estado.criado_em >= CATALOGO_RECONSTRUCAO_SEGUNDOS
+            if completo or vencido:
+                novo = _Estado()
+                novos = novo.carregar(conectar_erp)
+                with self._lock:
+                    self._estado = novo
+            else:
+                # O incremental só mexe no estado dentro do lock: as buscas usam as mesmas listas
+                with conectar_erp() as conexao:
+                    cursor = conexao.cursor()
+                    cursor.execute(SQL_CATALOGO_PRODUTOS, (estado.marca_produtos,))
+                    produtos = cursor.fetchall()
+                    cursor.execute(SQL_CATALOGO_CLIENTES, (estado.marca_clientes,))
+                    clientes = cursor.fetchall()
+                with self._lock:
+                    novos = {
+                        "produtos": estado._acrescentar_produtos(produtos),
+                        "clientes": estado._acrescentar_clientes(clientes),
+                    }
+            segundos = time.perf_counter() - inicio
+            tipo = "completa" if completo or vencido else "incremental"
+            metricas.registrar_fase("catalogo_atualizacao", segundos, tipo=tipo)
+            resumo = {"tipo": tipo, **novos, "segundos": round(segundos, 3)}
+            logging.info(f"Catálogo de busca atualizado: {resumo}")
+            return resumo
+
+    def chaves_produtos(self, planta: str, loja: str, pn_voss: str = None, pn_cliente: str = None):
+        # (R_E_C_N_O_ do SA7010 da planta/loja que atendem aos filtros, marca d'água) ou None
+        # quando a busca precisa ir para o banco (índice não carregado, reconstruído há mais de
+        # CATALOGO_IDADE_MAXIMA_SEGUNDOS, que pode não refletir alterações, ou filtro com curingas)
+        filtros = [f for f in (pn_voss, pn_cliente) if f]
+        if not filtros or not all(filtro_indexavel(f) for f in filtros):
+            return None
+        inicio = time.perf_counter()
+        with self._lock:
+            estado = self._estado
+            if estado is None or time.time() - estado.criado_em > CATALOGO_IDADE_MAXIMA_SEGUNDOS:
+                return None
+            grupo = estado.grupos.get(((planta or "").strip(), (loja or "").strip()))
+            if grupo is None:
+                return [], estado.marca_produtos
+            ids = grupo
+            if pn_voss:
+                ids = estado.pn_voss.buscar(pn_voss, restrito=ids)
+            if pn_cliente:
+                ids = estado.pn_cliente.buscar(pn_cliente, restrito=ids)
+            chaves = [estado.produtos[i][0] for i in ids]
+            marca = estado.marca_produtos
+        metricas.registrar_fase("catalogo_busca", time.perf_counter() - inicio)
+        return chaves, marca
+
+    def sugerir_pn(self, texto: str, planta: str = None, loja: str = None, campo: str = "pn_voss", limite: int = 10) -> list:
+        # Typeahead: PNs que contêm o texto (os que começam com ele primeiro), um por planta
+        if not texto:
+            return []
+        posicao = 3 if campo == "pn_voss" else 4
+        with self._lock:
+            estado = self._estado
+            if estado is None:
+                return []
+            indice = estado.pn_voss if campo == "pn_voss" else estado.pn_cliente
+            restrito = None
+            if planta:
+                if loja:
+                    restrito = estado.grupos.get((planta.strip(), loja.strip()), array("I"))
+                else:
+                    restrito = array("I", sorted(
+                        i for (p, _), ids in estado.grupos.items() if p == planta.strip() for i in ids
+                    ))
+            registros = [estado.produtos[i] for i in indice.buscar(texto, restrito)]
+        return _ordenar_sugestoes(
+            texto,
+            registros,
+            lambda r: r[posicao],
+            lambda r: {"PN Voss": r[3], "PN Cliente": r[4], "Planta": r[1]},
+            limite,
+        )
+
+    def sugerir_clientes(self, texto: str, limite: int = 10) -> list:
+        # Typeahead de clientes por nome ou nome reduzido; uma sugestão por planta/loja
+        if not texto:
+            return []
+        with self._lock:
+            estado = self._estado
+            if estado is None:
+                return []
+            registros = [estado.clientes[i] for i in estado.clientes_indice.buscar(texto)]
+        return _ordenar_sugestoes(
+            texto,
+            registros,
+            lambda r: r[3] if normalizar(texto) in normalizar(r[3]) else r[4],
+            lambda r: {"Planta": r[1], "Loja": r[2], "Cliente": r[3], "Nome Reduzido": r[4]},
+            limite,
+        )
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            estado = self._estado
+            if estado is None:
+                return {"pronto": 0}
+            return {
+                "pronto": 1,
+                "produtos": len(estado.produtos),
+                "clientes": len(estado.clientes),
+                "trigramas": estado.pn_voss.trigramas + estado.pn_cliente.trigramas + estado.clientes_indice.trigramas,
+                "marca_produtos": estado.marca_produtos,
+                "marca_clientes": estado.marca_clientes,
+                "idade_segundos": round(time.time() - estado.criado_em, 1),
+            }
+
+    def iniciar_atualizacao(self, conectar_erp, intervalo: float = CATALOGO_INTERVALO_SEGUNDOS) -> None:
+        # Thread do processo que mantém o índice em dia; a primeira carga é imediata
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._laco_atualizacao, args=(conectar_erp, intervalo), name="catalogo", daemon=True
+            )
+        self._thread.start()
+
+    def _laco_atualizacao(self, conectar_erp, intervalo: float) -> None:
+        while True:
+            try:
+                self.atualizar(conectar_erp)
+            except Exception as e:
+                # Sem índice (ou com o anterior) as buscas seguem pelo LIKE no banco
+                logging.warning(f"Falha ao atualizar o catálogo de busca: {e}")
+            time.sleep(intervalo)
+
+
+def _ordenar_sugestoes(texto: str, registros: list, chave, formatar, limite: int) -> list:
+    consulta = normalizar(texto)
+    vistos = set()
+    sugestoes = []
+    registros.sort(key=lambda r: (not normalizar(chave(r)).startswith(consulta), len(chave(r)), chave(r)))
+    for registro in registros:
+        sugestao = formatar(registro)
+        identidade = tuple(sugestao.values())
+        if identidade in vistos:
+            continue
+        vistos.add(identidade)
+        sugestoes.append(sugestao)
+        if len(sugestoes) >= limite:
+            break
+    return sugestoes
+
+
+# Um catálogo por processo, compartilhado por todas as sessões (como os pools de conexão)
+catalogo = CatalogoBusca()
+metricas.registrar_coletor("catalogo", catalogo.estatisticas)
+
+
+if __name__ == "__main__":
+    from consultaBD import RepositorioPrincipal
+
+    parser = argparse.ArgumentParser(description="Carrega o catálogo de busca e mede as consultas.")
+    parser.add_argument("--planta")
+    parser.add_argument("--loja")
+    parser.add_argument("--pn-voss")
+    parser.add_argument("--pn-cliente")
+    parser.add_argument("--cliente")
+    args = parser.parse_args()
+
+    repositorio = RepositorioPrincipal()
+    print(catalogo.atualizar(repositorio._conectar, completo=True))
+    print(catalogo.estatisticas())
+    inicio = time.perf_counter()
+    if args.cliente:
+        resultado = catalogo.sugerir_clientes(args.cliente)
+    elif args.planta and args.loja:
+        resultado = catalogo.chaves_produtos(args.planta, args.loja, args.pn_voss, args.pn_cliente)
+    else:
+        resultado = catalogo.sugerir_pn(args.pn_voss or args.pn_cliente or "", campo="pn_voss" if args.pn_voss else "pn_cliente")
+    print(f"{1000 * (time.perf_counter() - inicio):.3f} ms: {resultado}")
@@ -0,0 +1,118 @@
+# inicializacao.py
+# Inicialização do processo do Streamlit. O app.py é reexecutado a cada interação; este
+# módulo não: iniciar() roda uma vez por processo, configura o logging e dispara uma thread
+# que aquece o que a primeira consulta vai precisar (imports de pandas/pyodbc/XlsxWriter,
+# conexões do pool, lojas de todas as plantas no cache, catálogo de busca de PNs) enquanto a
+# primeira tela é desenhada.
+# Os tempos de boot ficam em tempos_boot(), no log e no endpoint de métricas (aftermarket_boot_*).
+import importlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from settings import AQUECIMENTO_ATIVO, AQUECIMENTO_PLANTAS, CATALOGO_ATIVO
+
+# wsgi.py grava aqui o instante em que disparou o Streamlit: os marcos passam a incluir o
+# boot do próprio Streamlit (o que conta depois de uma reciclagem do app pool do IIS)
+VARIAVEL_INICIO = "AFTERMARKET_BOOT_INICIO"
+INICIO_PROCESSO = float(os.environ.get(VARIAVEL_INICIO) or time.time())
+
+# Módulos carregados pelo aquecimento, dos mais usados na primeira interação para os demais
+MODULOS_AQUECIMENTO = ("consultaBD", "exportacao", "filaEmail", "escritorAuditoria")
+
+_tempos = {}
+_lock = threading.Lock()
+_iniciado = False
+
+
+def marcar(nome: str) -> None:
+    # Marco em ms desde o início do processo; só o primeiro registro de cada nome vale
+    with _lock:
+        _tempos.setdefault(f"{nome}_ms", round(1000 * (time.time() - INICIO_PROCESSO), 1))
+
+
+@contextmanager
+def medir(nome: str):
+    # Duração em ms de uma etapa do boot
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _tempos[f"{nome}_ms"] = round(1000 * (time.perf_counter() - inicio), 1)
+
+
+def tempos_boot() -> dict:
+    with _lock:
+        return dict(_tempos)
+
+
+def iniciar() -> None:
+    # Chamado no topo do app.py a cada rerun; só a primeira chamada do processo faz algo
+    global _iniciado
+    with _lock:
+        if _iniciado:
+            return
+        _iniciado = True
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    marcar("app_iniciado")
+    # /metrics e o catálogo não dependem do aquecimento: banco fora do ar depois de uma
+    # reciclagem do IIS (ou um import com erro) não deixa o processo sem eles
+    _isolado("exposição de métricas", _expor_metricas)
+    threading.Thread(target=_segundo_plano, name="aquecimento", daemon=True).start()
+
+
+def _isolado(descricao: str, funcao) -> None:
+    try:
+        funcao()
+    except Exception as e:
+        logging.warning(f"Inicialização: falha em {descricao}: {e}")
+
+
+def _expor_metricas() -> None:
+    import metricas
+
+    metricas.registrar_coletor("boot", tempos_boot)
+    metricas.iniciar_exposicao()
+
+
+def _manter_catalogo() -> None:
+    # Índice de trigramas dos filtros de PN/cliente; a thread do catálogo tenta de novo a cada
+    # CATALOGO_INTERVALO_SEGUNDOS se o banco estiver fora do ar
+    from consultaBD import RepositorioPrincipal
+
+    RepositorioPrincipal().manter_catalogo()
+
+
+def _segundo_plano() -> None:
+    if AQUECIMENTO_ATIVO:
+        _aquecer()
+    if CATALOGO_ATIVO:
+        _isolado("atualização do catálogo de busca", _manter_catalogo)
+
+
+def _aquecer() -> None:
+    try:
+        for modulo in MODULOS_AQUECIMENTO:
+            with medir(f"import_{modulo}"):
+                importlib.import_module(modulo)
+
+        from consultaBD import RepositorioPrincipal
+
+        repositorio = RepositorioPrincipal()
+        with medir("aquecimento_pool"):
+            repositorio.aquecer_pool()
+        with medir("aquecimento_lojas"):
+            plantas = repositorio.precarregar_lojas(AQUECIMENTO_PLANTAS or None)
+        logging.info(f"Aquecimento: lojas de {plantas} planta(s) carregadas no cache.")
+    except Exception as e:
+        # Só uma antecipação: o que não foi aquecido é feito pela primeira consulta
+        logging.warning(f"Aquecimento incompleto: {e}")
+    finally:
+        marcar("aquecimento_concluido")
+        logging.info(f"Tempos de boot (ms): {tempos_boot()}")
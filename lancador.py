@@ -0,0 +1,364 @@
+# lancador.py
+# Sobe N processos do Streamlit (um interpretador e um GIL por worker) em portas locais e um
+# proxy reverso na porta que o IIS já usa (web.config -> 127.0.0.1:8501). O proxy distribui
+# as sessões novas para o worker pronto com menos sessões abertas e mantém cada navegador no
+# mesmo worker por cookie (a sessão do Streamlit, os uploads e as mídias vivem em um processo
+# só). Requisições e websockets são repassados sem alteração de caminho nem de query string,
+# então o ?user= injetado pelo bootstrap.aspx chega intacto ao app.
+#
+# Cada worker é verificado em /_stcore/health: só recebe sessões depois de responder (pronto)
+# e é reiniciado se o processo morrer ou se a verificação falhar seguidamente.
+#
+# Exemplos:
+#   python lancador.py --workers 4
+#   python lancador.py --workers 2 --porta 8080 --porta-workers 9000
+#   curl http://127.0.0.1:8501/_lancador/status
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from settings import (
+    FILA_AUDITORIA_PATH,
+    LANCADOR_FALHAS_REINICIO,
+    LANCADOR_INTERVALO_SAUDE,
+    LANCADOR_PORTA,
+    LANCADOR_PORTA_WORKERS,
+    LANCADOR_TEMPO_PARTIDA,
+    LANCADOR_WORKERS,
+    METRICAS_ARQUIVO,
+    METRICAS_PORTA,
+)
+
+COOKIE_WORKER = "aftermarket_worker"
+CAMINHO_SAUDE = "/_stcore/health"
+CAMINHO_STATUS = "/_lancador/status"
+LIMITE_CABECALHO = 64 * 1024
+BACKOFF_MAXIMO = 60.0
+_RE_COOKIE = re.compile(rf"(?:^|;)\s*{COOKIE_WORKER}=(\d+)")
+
+
+def _com_sufixo(caminho: str, indice: int) -> str:
+    raiz, extensao = os.path.splitext(caminho)
+    return f"{raiz}.w{indice}{extensao}"
+
+
+class Worker:
+    def __init__(self, indice: int, porta: int, comando: list, ambiente: dict, pasta_logs: str):
+        self.indice = indice
+        self.porta = porta
+        self.comando = comando
+        self.ambiente = ambiente
+        self.caminho_log = os.path.join(pasta_logs, f"worker_{indice}.log")
+        self.processo = None
+        self.iniciado_em = 0.0
+        self.pronto = False
+        self.falhas_seguidas = 0
+        self.reinicios = 0
+        self.proxima_partida = 0.0
+        self.sessoes = 0  # Websockets abertos (uma sessão do Streamlit cada)
+        self.conexoes = 0
+        self.atribuicoes = 0  # Navegadores novos encaminhados (desempate entre workers)
+
+    def iniciar(self) -> None:
+        with open(self.caminho_log, "ab") as log:
+            self.processo = subprocess.Popen(
+                self.comando, env=self.ambiente, stdout=log, stderr=subprocess.STDOUT
+            )
+        self.iniciado_em = time.monotonic()
+        self.pronto = False
+        self.falhas_seguidas = 0
+        logging.info(f"Worker {self.indice}: pid {self.processo.pid} na porta {self.porta}.")
+
+    def vivo(self) -> bool:
+        return self.processo is not None and self.processo.poll() is None
+
+    def saudavel(self, timeout: float = 3.0) -> bool:
+        try:
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{self.porta}{CAMINHO_SAUDE}", timeout=timeout
+            ) as resposta:
+                return resposta.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+    def parar(self, timeout: float = 10.0) -> None:
+        self.pronto = False
+        if not self.vivo():
+            return
+        self.processo.terminate()
+        try:
+            self.processo.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.processo.kill()
+            self.processo.wait()
+
+    def status(self) -> dict:
+        return {
+            "indice": self.indice,
+            "porta": self.porta,
+            "pid": self.processo.pid if self.processo else None,
+            "vivo": self.vivo(),
+            "pronto": self.pronto,
+            "sessoes": self.sessoes,
+            "conexoes": self.conexoes,
+            "atribuicoes": self.atribuicoes,
+            "reinicios": self.reinicios,
+            "falhas_seguidas": self.falhas_seguidas,
+        }
+
+
+class Lancador:
+    def __init__(
+        self,
+        workers: int = LANCADOR_WORKERS,
+        porta: int = LANCADOR_PORTA,
+        porta_workers: int = LANCADOR_PORTA_WORKERS,
+        comando: str = None,
+        pasta_logs: str = "./logs",
+        intervalo_saude: float = LANCADOR_INTERVALO_SAUDE,
+        falhas_reinicio: int = LANCADOR_FALHAS_REINICIO,
+        tempo_partida: float = LANCADOR_TEMPO_PARTIDA,
+    ):
+        self.porta = porta
+        self.intervalo_saude = intervalo_saude
+        self.falhas_reinicio = falhas_reinicio
+        self.tempo_partida = tempo_partida
+        self._parar = threading.Event()
+        os.makedirs(pasta_logs, exist_ok=True)
+
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+        # Segredo comum: o cookie XSRF do Streamlit continua válido se o worker reiniciar
+        segredo = secrets.token_hex(32)
+        inicio = str(time.time())
+        self.workers = []
+        for indice in range(workers):
+            porta_worker = porta_workers + indice
+            if comando:
+                # Comando alternativo (ex.: um worker simulado em testes); {porta} é substituído
+                argumentos = [parte.format(porta=porta_worker) for parte in comando.split()]
+            else:
+                argumentos = [
+                    sys.executable, "-m", "streamlit", "run", script,
+                    "--server.port", str(porta_worker),
+                    "--server.address", "127.0.0.1",
+                    "--server.headless", "true",
+                    "--server.cookieSecret", segredo,
+                ]
+            self.workers.append(
+                Worker(indice, porta_worker, argumentos, self._ambiente(indice, inicio), pasta_logs)
+            )
+
+    def _ambiente(self, indice: int, inicio: str) -> dict:
+        # Estado local por worker: fila de auditoria própria (a de um worker reiniciado é
+        # retomada por ele mesmo) e porta/arquivo de métricas próprios. O diário e a planilha
+        # do diário são compartilhados; a compactação se serializa pela trava em diarioAuditoria.py
+        ambiente = dict(
+            os.environ,
+            AFTERMARKET_WORKER=str(indice),
+            AFTERMARKET_BOOT_INICIO=inicio,
+            FILA_AUDITORIA_PATH=_com_sufixo(FILA_AUDITORIA_PATH, indice),
+        )
+        if METRICAS_PORTA:
+            ambiente["METRICAS_PORTA"] = str(METRICAS_PORTA + indice)
+        if METRICAS_ARQUIVO:
+            ambiente["METRICAS_ARQUIVO"] = _com_sufixo(METRICAS_ARQUIVO, indice)
+        return ambiente
+
+    # --- Supervisão ---
+    def _supervisionar(self) -> None:
+        while not self._parar.is_set():
+            agora = time.monotonic()
+            for worker in self.workers:
+                if not worker.vivo():
+                    if worker.processo is not None and worker.proxima_partida == 0.0:
+                        # Morreu: reinicia com backoff se morreu logo depois de subir
+                        vida = agora - worker.iniciado_em
+                        espera = 0.0 if vida > self.tempo_partida else min(2 ** worker.reinicios, BACKOFF_MAXIMO)
+                        logging.warning(
+                            f"Worker {worker.indice} saiu com código {worker.processo.returncode} "
+                            f"após {vida:.0f}s; reiniciando em {espera:.0f}s."
+                        )
+                        worker.pronto = False
+                        worker.reinicios += 1
+                        worker.proxima_partida = agora + espera
+                    if agora >= worker.proxima_partida:
+                        worker.proxima_partida = 0.0
+                        worker.iniciar()
+                    continue
+
+                if worker.saudavel():
+                    if not worker.pronto:
+                        logging.info(
+                            f"Worker {worker.indice} pronto em "
+                            f"{time.monotonic() - worker.iniciado_em:.1f}s."
+                        )
+                    worker.pronto = True
+                    worker.falhas_seguidas = 0
+                    continue
+
+                worker.falhas_seguidas += 1
+                em_partida = not worker.pronto and agora - worker.iniciado_em < self.tempo_partida
+                if worker.falhas_seguidas >= self.falhas_reinicio and not em_partida:
+                    logging.warning(
+                        f"Worker {worker.indice} sem resposta em {CAMINHO_SAUDE} "
+                        f"({worker.falhas_seguidas}x); reiniciando."
+                    )
+                    worker.parar(timeout=2.0)
+                    worker.reinicios += 1
+                    worker.iniciar()
+                elif worker.falhas_seguidas >= self.falhas_reinicio:
+                    worker.pronto = False
+            # Enquanto algum worker está subindo, verifica com mais frequência
+            subindo = any(not worker.pronto for worker in self.workers)
+            self._parar.wait(min(1.0, self.intervalo_saude) if subindo else self.intervalo_saude)
+
+    # --- Proxy ---
+    def _escolher(self, cabecalho: bytes):
+        prontos = [worker for worker in self.workers if worker.pronto]
+        if not prontos:
+            return None, False
+        for linha in cabecalho.split(b"\r\n")[1:]:
+            nome, _, valor = linha.partition(b":")
+            if nome.strip().lower() == b"cookie":
+                encontrado = _RE_COOKIE.search(valor.decode("latin-1"))
+                if encontrado:
+                    indice = int(encontrado.group(1))
+                    if indice < len(self.workers) and self.workers[indice].pronto:
+                        return self.workers[indice], False
+        # Sessão nova (ou worker anterior fora do ar): o menos ocupado, e grava o cookie
+        escolhido = min(prontos, key=lambda worker: (worker.sessoes, worker.atribuicoes))
+        escolhido.atribuicoes += 1
+        return escolhido, True
+
+    async def _responder(self, escritor, status: str, corpo: bytes, extra: str = "") -> None:
+        escritor.write(
+            f"HTTP/1.1 {status}\r\nContent-Length: {len(corpo)}\r\n{extra}"
+            f"Connection: close\r\n\r\n".encode("latin-1") + corpo
+        )
+        await escritor.drain()
+
+    async def _copiar(self, leitor, escritor, cookie: str = None) -> None:
+        try:
+            if cookie:
+                # Insere o Set-Cookie no cabeçalho da primeira resposta
+                cabecalho = await leitor.readuntil(b"\r\n\r\n")
+                escritor.write(cabecalho[:-2] + cookie.encode("latin-1") + b"\r\n")
+            while True:
+                dados = await leitor.read(65536)
+                if not dados:
+                    break
+                escritor.write(dados)
+                await escritor.drain()
+            if escritor.can_write_eof():
+                escritor.write_eof()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, OSError):
+            escritor.close()
+
+    async def _atender(self, leitor, escritor) -> None:
+        worker_escritor = None
+        worker = None
+        websocket = False
+        try:
+            try:
+                cabecalho = await leitor.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            if cabecalho.split(b" ", 2)[1:2] == [CAMINHO_STATUS.encode()]:
+                corpo = json.dumps([w.status() for w in self.workers], indent=2).encode("utf-8")
+                await self._responder(escritor, "200 OK", corpo, "Content-Type: application/json\r\n")
+                return
+
+            worker, novo = self._escolher(cabecalho)
+            if worker is None:
+                await self._responder(
+                    escritor, "503 Service Unavailable",
+                    "Aplicação iniciando, tente novamente em instantes.".encode("utf-8"),
+                    "Retry-After: 5\r\nContent-Type: text/plain; charset=utf-8\r\n",
+                )
+                return
+            try:
+                worker_leitor, worker_escritor = await asyncio.open_connection(
+                    "127.0.0.1", worker.porta, limit=LIMITE_CABECALHO
+                )
+            except OSError:
+                worker.pronto = False  # O supervisor confirma/reinicia na próxima verificação
+                await self._responder(escritor, "502 Bad Gateway", b"Worker indisponivel.")
+                return
+
+            websocket = b"upgrade: websocket" in cabecalho.lower()
+            worker.conexoes += 1
+            if websocket:
+                worker.sessoes += 1
+            cookie = (
+                f"Set-Cookie: {COOKIE_WORKER}={worker.indice}; Path=/; HttpOnly; SameSite=Lax\r\n"
+                if novo else None
+            )
+            worker_escritor.write(cabecalho)
+            await asyncio.gather(
+                self._copiar(leitor, worker_escritor),
+                self._copiar(worker_leitor, escritor, cookie),
+            )
+        finally:
+            if worker is not None and worker_escritor is not None:
+                worker.conexoes -= 1
+                if websocket:
+                    worker.sessoes -= 1
+                worker_escritor.close()
+            escritor.close()
+
+    async def _servir(self) -> None:
+        servidor = await asyncio.start_server(
+            self._atender, "0.0.0.0", self.porta, limit=LIMITE_CABECALHO
+        )
+        logging.info(
+            f"Proxy em http://0.0.0.0:{self.porta} para {len(self.workers)} worker(s) "
+            f"nas portas {self.workers[0].porta}-{self.workers[-1].porta}."
+        )
+        async with servidor:
+            while not self._parar.is_set():
+                await asyncio.sleep(0.5)
+
+    def executar(self) -> None:
+        for worker in self.workers:
+            worker.iniciar()
+        supervisor = threading.Thread(target=self._supervisionar, name="supervisor", daemon=True)
+        supervisor.start()
+        try:
+            asyncio.run(self._servir())
+        finally:
+            self.parar()
+
+    def parar(self) -> None:
+        self._parar.set()
+        for worker in self.workers:
+            worker.parar()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Sobe N workers do Streamlit atrás de um proxy local.")
+    parser.add_argument("--workers", type=int, default=LANCADOR_WORKERS)
+    parser.add_argument("--porta", type=int, default=LANCADOR_PORTA, help="Porta do proxy (a do IIS).")
+    parser.add_argument("--porta-workers", type=int, default=LANCADOR_PORTA_WORKERS,
+                        help="Porta do primeiro worker; os demais usam as seguintes.")
+    parser.add_argument("--comando", help="Comando alternativo do worker, com {porta}.")
+    parser.add_argument("--pasta-logs", default="./logs")
+    args = parser.parse_args()
+
+    lancador = Lancador(args.workers, args.porta, args.porta_workers, args.comando, args.pasta_logs)
+    signal.signal(signal.SIGTERM, lambda *_: lancador._parar.set())
+    try:
+        lancador.executar()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,268 @@
+# logUso.py
+# Log de uso da ferramenta (quem usou, quantos itens, tempo economizado).
+# Substitui os arquivos dataN.csv de uma linha: a sequência vem de um contador atômico
+# (arquivo data.seq protegido por uma trava criada com O_EXCL, que funciona também no
+# compartilhamento de rede) e os registros são acrescentados a um CSV por mês.
+#
+# Exemplos:
+#   python logUso.py migrar           # incorpora os dataN.csv antigos e os move para legado/
+#   python logUso.py ler --desde 2026-01-01
+import argparse
+import datetime
+import logging
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+COLUNAS = [
+    "Sequencia",
+    "Usuario",
+    "Rotina",
+    "Data/Hora",
+    "Quantidade de itens",
+    "Tempo_humano(segundos)",
+    "Tempo_bot(segundos)",
+]
+
+TRAVA_TIMEOUT = 30.0
+TRAVA_EXPIRACAO = 120.0  # Trava mais antiga que isso é de um processo que morreu
+
+
+@contextmanager
+def trava_arquivo(caminho: str, timeout: float = TRAVA_TIMEOUT, expiracao: float = TRAVA_EXPIRACAO):
+    # Trava entre processos (e entre máquinas, no compartilhamento): arquivo criado com O_EXCL,
+    # com um token único do dono. Enquanto está com ela, o dono renova o mtime a cada
+    # expiracao/4; só uma trava sem renovação há mais de 'expiracao' é tomada, e na saída o
+    # dono só apaga a trava se ela ainda for a dele. TimeoutError se continuar ocupada depois
+    # de 'timeout' segundos.
+    momento = datetime.datetime.now().isoformat(timespec="seconds")
+    token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}@{momento}"
+    inicio = time.monotonic()
+    while True:
+        try:
+            descritor = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            conteudo = _ler_trava(caminho)
+            if conteudo is None:
+                continue  # Liberada nesse meio-tempo
+            try:
+                if time.time() - os.path.getmtime(caminho) > expiracao:
+                    _tomar_trava_expirada(caminho, conteudo)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() - inicio >= timeout:
+                raise TimeoutError(f"Trava {caminho} ocupada há mais de {timeout}s.")
+            time.sleep(0.05)
+    parar = threading.Event()
+    try:
+        os.write(descritor, token.encode())
+        os.close(descritor)
+        threading.Thread(
+            target=_renovar_trava,
+            args=(caminho, token, parar, expiracao / 4),
+            name="trava-renovacao",
+            daemon=True,
+        ).start()
+        yield
+    finally:
+        parar.set()
+        if _ler_trava(caminho) == token:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+        else:
+            logging.warning(f"Trava {caminho} foi tomada por outro processo antes do fim.")
+
+
+def _ler_trava(caminho: str):
+    # Token do dono da trava ou None se ela não existe mais
+    try:
+        with open(caminho, encoding="utf-8", errors="replace") as arquivo:
+            return arquivo.read()
+    except FileNotFoundError:
+        return None
+
+
+def _tomar_trava_expirada(caminho: str, conteudo_visto) -> None:
+    # Check-then-act seguro: a trava é renomeada para um nome único (só um processo consegue) e
+    # o token é relido. Se não for o da trava expirada vista (outro processo já a trocou por uma
+    # nova), a trava é devolvida.
+    expirada = f"{caminho}.{uuid.uuid4().hex[:8]}.expirada"
+    try:
+        os.rename(caminho, expirada)
+    except FileNotFoundError:
+        return
+    if _ler_trava(expirada) == conteudo_visto:
+        logging.warning(f"Trava expirada removida: {caminho} ({conteudo_visto})")
+        os.remove(expirada)
+        return
+    try:
+        os.link(expirada, caminho)  # Não sobrescreve uma trava criada nesse meio-tempo
+    except FileExistsError:
+        pass
+    except OSError:
+        if not os.path.exists(caminho):  # Sem hard link (alguns compartilhamentos)
+            os.rename(expirada, caminho)
+            return
+    os.remove(expirada)
+
+
+def _renovar_trava(caminho: str, token: str, parar: threading.Event, intervalo: float) -> None:
+    # Batimento do dono: trabalhos longos (compactação) não deixam a trava parecer expirada
+    while not parar.wait(intervalo):
+        if _ler_trava(caminho) != token:
+            return
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+
+
+class LogUso:
+    def __init__(self, pasta: str, base_name: str = "data"):
+        self.pasta = pasta
+        self.base_name = base_name
+        self.caminho_contador = os.path.join(pasta, f"{base_name}.seq")
+        self.caminho_trava = os.path.join(pasta, f"{base_name}.seq.lock")
+        os.makedirs(pasta, exist_ok=True)
+
+    def _travar(self, timeout: float = TRAVA_TIMEOUT):
+        return trava_arquivo(self.caminho_trava, timeout)
+
+    # --- Contador ---
+    def _arquivos_legados(self) -> dict:
+        # {N: nome} dos dataN.csv antigos; só é usado na inicialização e na migração
+        padrao = re.compile(f"^{re.escape(self.base_name)}(\\d+)\\.csv$", re.IGNORECASE)
+        legados = {}
+        for nome in os.listdir(self.pasta):
+            encontrado = padrao.match(nome)
+            if encontrado:
+                legados[int(encontrado.group(1))] = nome
+        return legados
+
+    def _ler_contador(self) -> int:
+        try:
+            with open(self.caminho_contador, encoding="utf-8") as arquivo:
+                return int(arquivo.read().strip())
+        except FileNotFoundError:
+            # Primeira execução: continua a numeração dos dataN.csv existentes (única varredura)
+            return max(self._arquivos_legados(), default=0) + 1
+
+    def _gravar_contador(self, proximo: int) -> None:
+        temporario = f"{self.caminho_contador}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            arquivo.write(str(proximo))
+        os.replace(temporario, self.caminho_contador)
+
+    # --- Escrita ---
+    def caminho_segmento(self, momento: datetime.datetime = None) -> str:
+        # Um arquivo por mês: uso_AAAA-MM.csv
+        momento = momento or datetime.datetime.now()
+        return os.path.join(self.pasta, f"uso_{momento:%Y-%m}.csv")
+
+    def _acrescentar(self, caminho: str, df: pd.DataFrame) -> None:
+        novo = not os.path.exists(caminho)
+        df.reindex(columns=COLUNAS).to_csv(
+            caminho,
+            mode="a",
+            header=novo,
+            index=False,
+            sep=";",
+            # BOM só no início do arquivo, para o Excel reconhecer o UTF-8
+            encoding="utf-8-sig" if novo else "utf-8",
+        )
+
+    def registrar(self, registros: list) -> list:
+        # Reserva a sequência e acrescenta as linhas sob a mesma trava: sem números repetidos
+        # nem linhas intercaladas entre processos/sessões
+        if not registros:
+            return []
+        with self._travar():
+            inicio = self._ler_contador()
+            sequencias = list(range(inicio, inicio + len(registros)))
+            df = pd.DataFrame(registros)
+            df.insert(0, "Sequencia", sequencias)
+            self._acrescentar(self.caminho_segmento(), df)
+            self._gravar_contador(inicio + len(registros))
+        logging.info(f"Log de uso: {len(registros)} registro(s), sequência {sequencias[0]}..{sequencias[-1]}")
+        return sequencias
+
+    # --- Leitura ---
+    def ler(self, desde: str = None) -> pd.DataFrame:
+        segmentos = sorted(
+            nome for nome in os.listdir(self.pasta) if re.match(r"^uso_\d{4}-\d{2}\.csv$", nome)
+        )
+        if desde:
+            segmentos = [nome for nome in segmentos if nome[4:11] >= desde[:7]]
+        if not segmentos:
+            return pd.DataFrame(columns=COLUNAS)
+        df = pd.concat(
+            [
+                pd.read_csv(os.path.join(self.pasta, nome), sep=";", encoding="utf-8-sig")
+                for nome in segmentos
+            ],
+            ignore_index=True,
+        )
+        if desde:
+            df = df[pd.to_datetime(df["Data/Hora"], errors="coerce") >= pd.Timestamp(desde)]
+        return df.sort_values("Sequencia", kind="stable").reset_index(drop=True)
+
+    # --- Migração dos dataN.csv ---
+    def migrar_legado(self) -> int:
+        with self._travar():
+            legados = self._arquivos_legados()
+            if not legados:
+                return 0
+            # Garante o contador antes de mover os arquivos dos quais ele seria derivado
+            self._gravar_contador(max(self._ler_contador(), max(legados) + 1))
+
+            quadros = []
+            for numero in sorted(legados):
+                df = pd.read_csv(
+                    os.path.join(self.pasta, legados[numero]), sep=";", encoding="utf-8-sig"
+                )
+                df.insert(0, "Sequencia", numero)
+                quadros.append(df)
+            df = pd.concat(quadros, ignore_index=True)
+
+            # Cada registro vai para o segmento do mês em que foi gerado
+            momentos = pd.to_datetime(df["Data/Hora"], errors="coerce")
+            meses = momentos.dt.strftime("%Y-%m").fillna(f"{datetime.datetime.now():%Y-%m}")
+            for mes, grupo in df.groupby(meses, sort=True):
+                self._acrescentar(os.path.join(self.pasta, f"uso_{mes}.csv"), grupo)
+
+            pasta_legado = os.path.join(self.pasta, "legado")
+            os.makedirs(pasta_legado, exist_ok=True)
+            for nome in legados.values():
+                shutil.move(os.path.join(self.pasta, nome), os.path.join(pasta_legado, nome))
+
+        logging.info(f"Log de uso: {len(legados)} arquivo(s) dataN.csv migrado(s) para {pasta_legado}")
+        return len(legados)
+
+
+if __name__ == "__main__":
+    from settings import FOLDER_LOG_PATH
+
+    parser = argparse.ArgumentParser(description="Log de uso do After Market.")
+    parser.add_argument("--pasta", default=FOLDER_LOG_PATH)
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    subcomandos.add_parser("migrar", help="Incorpora os arquivos dataN.csv antigos.")
+    parser_ler = subcomandos.add_parser("ler", help="Lista os registros de uso.")
+    parser_ler.add_argument("--desde", help="AAAA-MM-DD")
+    args = parser.parse_args()
+
+    log_uso = LogUso(args.pasta)
+    if args.comando == "migrar":
+        print(f"{log_uso.migrar_legado()} arquivo(s) migrado(s).")
+    else:
+        print(log_uso.ler(args.desde).to_string(index=False))
@@ -0,0 +1,316 @@
+# metricas.py
+# Instrumentação por fase (conexão, lojas, execução da query, fetch, DataFrame, log, SMTP...).
+# Cada fase vira um span com tags (planta, lojas, linhas, parâmetros); as durações são
+# agregadas em histogramas expostos no formato texto do Prometheus (endpoint HTTP e/ou
+# arquivo para o textfile collector). Requisições acima de METRICAS_LIMITE_LENTO_MS vão
+# para um log JSON com todas as fases e a forma da SQL gerada.
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from settings import (
+    METRICAS_ARQUIVO,
+    METRICAS_INTERVALO_ARQUIVO,
+    METRICAS_LIMITE_LENTO_MS,
+    METRICAS_LOG_LENTO_PATH,
+    METRICAS_PORTA,
+)
+
+PREFIXO = "aftermarket"
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Só tags de baixa cardinalidade viram rótulo; planta, linhas etc. ficam no log de lentas
+ROTULOS_HISTOGRAMA = ("motor", "formato", "fonte", "cache")
+# Com o lancador.py cada worker expõe as próprias séries, identificadas pelo rótulo worker
+ROTULOS_PROCESSO = (
+    (("worker", os.environ["AFTERMARKET_WORKER"]),) if os.environ.get("AFTERMARKET_WORKER") else ()
+)
+
+
+class Histograma:
+    def __init__(self):
+        self.contagens = [0] * len(LIMITES_SEGUNDOS)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        for indice, limite in enumerate(LIMITES_SEGUNDOS):
+            if valor <= limite:
+                self.contagens[indice] += 1
+                break
+        self.soma += valor
+        self.total += 1
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos_texto(rotulos: tuple) -> str:
+    rotulos = ROTULOS_PROCESSO + rotulos
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in rotulos) + "}"
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+        self._coletores = []
+
+    def observar(self, nome: str, segundos: float, rotulos: tuple = ()) -> None:
+        with self._lock:
+            histograma = self._histogramas.get((nome, rotulos))
+            if histograma is None:
+                histograma = self._histogramas[(nome, rotulos)] = Histograma()
+            histograma.observar(segundos)
+
+    def incrementar(self, nome: str, valor: float = 1, rotulos: tuple = ()) -> None:
+        with self._lock:
+            self._contadores[(nome, rotulos)] = self._contadores.get((nome, rotulos), 0) + valor
+
+    def registrar_coletor(self, nome: str, funcao) -> None:
+        # funcao() -> dict de valores numéricos, exportados como gauges '<nome>_<chave>'
+        with self._lock:
+            self._coletores = [(n, f) for n, f in self._coletores if n != nome]
+            self._coletores.append((nome, funcao))
+
+    def texto_prometheus(self) -> str:
+        with self._lock:
+            histogramas = {
+                chave: (list(h.contagens), h.soma, h.total)
+                for chave, h in self._histogramas.items()
+            }
+            contadores = dict(self._contadores)
+            coletores = list(self._coletores)
+
+        linhas = []
+        tipos_declarados = set()
+        for (nome, rotulos), (contagens, soma, total) in sorted(histogramas.items()):
+            if nome not in tipos_declarados:
+                linhas.append(f"# TYPE {nome} histogram")
+                tipos_declarados.add(nome)
+            acumulado = 0
+            for limite, contagem in zip(LIMITES_SEGUNDOS, contagens):
+                acumulado += contagem
+                linhas.append(f"{nome}_bucket{_rotulos_texto(rotulos + (('le', limite),))} {acumulado}")
+            linhas.append(f"{nome}_bucket{_rotulos_texto(rotulos + (('le', '+Inf'),))} {total}")
+            linhas.append(f"{nome}_sum{_rotulos_texto(rotulos)} {soma:.6f}")
+            linhas.append(f"{nome}_count{_rotulos_texto(rotulos)} {total}")
+
+        for (nome, rotulos), valor in sorted(contadores.items()):
+            if nome not in tipos_declarados:
+                linhas.append(f"# TYPE {nome} counter")
+                tipos_declarados.add(nome)
+            linhas.append(f"{nome}{_rotulos_texto(rotulos)} {valor}")
+
+        for nome, funcao in coletores:
+            try:
+                valores = funcao() or {}
+            except Exception as e:
+                logging.warning(f"Métricas: coletor {nome} falhou: {e}")
+                continue
+            for chave, valor in sorted(valores.items()):
+                if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+                    continue
+                linhas.append(f"# TYPE {nome}_{chave} gauge")
+                linhas.append(f"{nome}_{chave}{_rotulos_texto(())} {valor}")
+        return "\n".join(linhas) + "\n"
+
+
+_registro = RegistroMetricas()
+_local = threading.local()
+
+
+def registrar_coletor(nome: str, funcao) -> None:
+    _registro.registrar_coletor(f"{PREFIXO}_{nome}", funcao)
+
+
+def incrementar(nome: str, valor: float = 1, **rotulos) -> None:
+    _registro.incrementar(f"{PREFIXO}_{nome}", valor, tuple(sorted(rotulos.items())))
+
+
+def texto_prometheus() -> str:
+    return _registro.texto_prometheus()
+
+
+# --- Spans ---
+def registrar_fase(fase: str, segundos: float, **tags) -> None:
+    # Para fases medidas fora de um 'with span(...)' (ex.: espera por conexão do pool)
+    rotulos = (("fase", fase),) + tuple(
+        (chave, tags[chave]) for chave in ROTULOS_HISTOGRAMA if tags.get(chave) is not None
+    )
+    _registro.observar(f"{PREFIXO}_fase_duracao_segundos", segundos, rotulos)
+    if tags.get("erro"):
+        _registro.incrementar(f"{PREFIXO}_fase_erros_total", 1, rotulos[:1])
+
+    pilha = getattr(_local, "pilha", None)
+    if pilha:
+        # Dentro de uma requisição: entra no detalhamento do log de requisições lentas
+        pilha[0]["fases"].append(
+            {"fase": fase, "ms": round(1000 * segundos, 2), **_tags_serializaveis(tags)}
+        )
+
+
+@contextmanager
+def span(fase: str, **tags):
+    # Uso: with span("execucao", planta=p, parametros=n) as tags: ...; tags["linhas"] = len(r)
+    # O span mais externo da thread é a "requisição" avaliada para o log de lentas.
+    pilha = getattr(_local, "pilha", None)
+    if pilha is None:
+        pilha = _local.pilha = []
+    raiz = not pilha
+    if raiz:
+        pilha.append({"fase": fase, "tags": tags, "fases": []})
+    inicio = time.perf_counter()
+    try:
+        yield tags
+    except BaseException as e:
+        tags["erro"] = type(e).__name__
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        if raiz:
+            requisicao = pilha.pop()
+            registrar_fase(fase, segundos, **tags)
+            if 1000 * segundos >= METRICAS_LIMITE_LENTO_MS:
+                _registrar_lenta(requisicao, segundos)
+        else:
+            registrar_fase(fase, segundos, **tags)
+
+
+def anotar(**tags) -> None:
+    # Acrescenta detalhes à requisição corrente (ex.: sql=..., lojas=n) para o log de lentas
+    pilha = getattr(_local, "pilha", None)
+    if pilha:
+        pilha[0]["tags"].update(tags)
+
+
+def _tags_serializaveis(tags: dict) -> dict:
+    return {
+        chave: valor if isinstance(valor, (int, float, str, bool, dict, type(None))) else str(valor)
+        for chave, valor in tags.items()
+        if chave != "sql"
+    }
+
+
+# --- Log de requisições lentas ---
+_PADRAO_PIVOT = re.compile(r",\s*(ISNULL\()?MAX\(CASE WHEN T\.D2_LOJA = \? THEN .*? AS \[[^\]]*\]")
+_log_lento_lock = threading.Lock()
+
+
+def forma_sql(sql: str) -> dict:
+    # Normaliza a SQL (sem comentários/literais/espaços) e colapsa o bloco do PIVOT, que se
+    # repete 7x por loja: o que importa é a forma e quantas colunas foram geradas
+    texto = re.sub(r"--[^\n]*", " ", sql)
+    texto = re.sub(r"'[^']*'", "'?'", texto)
+    texto = re.sub(r"\s+", " ", texto).strip()
+    colunas_pivot = len(_PADRAO_PIVOT.findall(texto))
+    texto = _PADRAO_PIVOT.sub("", texto)
+    if colunas_pivot:
+        texto = texto.replace(
+            "AS [Nome Reduzido] FROM", f"AS [Nome Reduzido] /* +{colunas_pivot} colunas PIVOT */ FROM", 1
+        )
+    return {
+        "hash": hashlib.sha1(texto.encode("utf-8")).hexdigest()[:12],
+        "colunas_pivot": colunas_pivot,
+        "parametros": sql.count("?"),
+        "texto": texto[:4000],
+    }
+
+
+def _registrar_lenta(requisicao: dict, segundos: float) -> None:
+    tags = requisicao["tags"]
+    registro = {
+        "momento": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "fase": requisicao["fase"],
+        "ms": round(1000 * segundos, 2),
+        "tags": _tags_serializaveis(tags),
+        "fases": requisicao["fases"],
+    }
+    if tags.get("sql"):
+        registro["sql"] = forma_sql(tags["sql"])
+    logging.warning(
+        f"Requisição lenta: {requisicao['fase']} em {registro['ms']:.0f} ms {registro['tags']}"
+    )
+    incrementar("requisicoes_lentas_total", fase=requisicao["fase"])
+    if not METRICAS_LOG_LENTO_PATH:
+        return
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(METRICAS_LOG_LENTO_PATH)), exist_ok=True)
+        with _log_lento_lock, open(METRICAS_LOG_LENTO_PATH, "a", encoding="utf-8") as arquivo:
+            arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        logging.error(f"Métricas: não foi possível gravar o log de lentas: {e}")
+
+
+# --- Exposição ---
+def _servidor_http(porta: int):
+    # http.server só é importado quando o endpoint é ligado (custo de import no boot)
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ManipuladorMetricas(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            corpo = texto_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            pass  # Sem uma linha de log por coleta do Prometheus
+
+    return ThreadingHTTPServer(("0.0.0.0", porta), ManipuladorMetricas)
+
+
+def gravar_arquivo(caminho: str) -> None:
+    # Troca atômica: o textfile collector nunca lê um arquivo pela metade
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        arquivo.write(texto_prometheus())
+    os.replace(temporario, caminho)
+
+
+_exposicao_iniciada = False
+_exposicao_lock = threading.Lock()
+
+
+def iniciar_exposicao(porta: int = METRICAS_PORTA, arquivo: str = METRICAS_ARQUIVO) -> None:
+    # Idempotente: o Streamlit reexecuta o app a cada interação
+    global _exposicao_iniciada
+    with _exposicao_lock:
+        if _exposicao_iniciada:
+            return
+        _exposicao_iniciada = True
+
+    if porta:
+        try:
+            servidor = _servidor_http(porta)
+        except OSError as e:
+            logging.warning(f"Métricas: porta {porta} indisponível ({e}); endpoint HTTP desativado.")
+        else:
+            servidor.daemon_threads = True
+            threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+            logging.info(f"Métricas disponíveis em http://0.0.0.0:{porta}/metrics")
+
+    if arquivo:
+        def gravar_periodicamente():
+            while True:
+                try:
+                    gravar_arquivo(arquivo)
+                except OSError as e:
+                    logging.warning(f"Métricas: falha ao gravar {arquivo}: {e}")
+                time.sleep(METRICAS_INTERVALO_ARQUIVO)
+
+        threading.Thread(target=gravar_periodicamente, name="metricas-arquivo", daemon=True).start()
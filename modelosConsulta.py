@@ -0,0 +1,403 @@
+# modelosConsulta.py
+# Modelos fixos das consultas de buscar_dados. O texto de cada comando não muda com a
+# quantidade de lojas nem com os filtros preenchidos: a lista de lojas vai em um único
+# parâmetro JSON (OPENJSON), os filtros opcionais usam '@filtro IS NULL OR ...' e o PIVOT
+# por loja é feito no Python (motorLocal.pivotar_longo). Cada valor é ligado uma vez só, em
+# variáveis do lote (DECLARE @x = ?), e os tipos dos parâmetros são fixos (setinputsizes):
+# o SQL Server compila um plano por modelo e passa a reutilizá-lo em todas as requisições.
+#
+# Exemplo (planos em cache no servidor; requer VIEW SERVER STATE):
+#   python modelosConsulta.py
+import logging
+import re
+import threading
+
+import metricas
+
+MARCADOR = "aftermarket"  # Comentário no início de cada comando: /* aftermarket:nome */
+
+# Tamanho declarado dos parâmetros (setinputsizes); 0 = NVARCHAR(MAX)
+TAMANHOS_ENTRADA = {"VARCHAR": 200, "NVARCHAR(MAX)": 0, "INT": 0}
+
+_lock = threading.Lock()
+_usos = {}  # nome -> {"execucoes": n, "primeiras_execucoes": n}
+
+
+class ModeloConsulta:
+    def __init__(self, nome: str, variaveis: list, corpo: str):
+        # variaveis: [(nome, tipo T-SQL)], na ordem dos '?'; o corpo usa @nome
+        self.nome = nome
+        self.variaveis = variaveis
+        declaracoes = ",\n            ".join(f"@{variavel} {tipo} = ?" for variavel, tipo in variaveis)
+        self.sql = f"/* {MARCADOR}:{nome} */\n        DECLARE {declaracoes};\n{corpo}"
+
+    def parametros(self, **valores) -> list:
+        # Variáveis não informadas vão como NULL (filtro desligado)
+        desconhecidas = set(valores) - {variavel for variavel, _ in self.variaveis}
+        if desconhecidas:
+            raise ValueError(f"Variáveis desconhecidas no modelo {self.nome}: {sorted(desconhecidas)}")
+        return [valores.get(variavel) for variavel, _ in self.variaveis]
+
+    def _tamanhos_entrada(self) -> list:
+        import pyodbc
+
+        tamanhos = []
+        for _, tipo in self.variaveis:
+            if tipo == "INT":
+                tamanhos.append((pyodbc.SQL_INTEGER, 0, 0))
+            else:
+                tamanho = TAMANHOS_ENTRADA["NVARCHAR(MAX)" if tipo == "NVARCHAR(MAX)" else "VARCHAR"]
+                tamanhos.append((pyodbc.SQL_WVARCHAR, tamanho, 0))
+        return tamanhos
+
+    def executar(self, cursor, **valores):
+        parametros = self.parametros(**valores)
+        # Sem tipos fixos o pyodbc declara cada texto com o próprio comprimento (nvarchar(7),
+        # nvarchar(9)...) e cada comprimento vira um plano diferente no cache do SQL Server
+        if hasattr(cursor, "setinputsizes"):
+            cursor.setinputsizes(self._tamanhos_entrada())
+        _registrar_uso(self.nome)
+        return cursor.execute(self.sql, parametros)
+
+
+def _registrar_uso(nome: str) -> None:
+    # Visão do processo: só separa a primeira execução de cada modelo das demais. Se ela compilou
+    # ou reutilizou um plano (de outro worker, de outra sessão), e se o plano foi recompilado
+    # depois, só o servidor sabe: planos_em_cache() traz esses números.
+    with _lock:
+        uso = _usos.setdefault(nome, {"execucoes": 0, "primeiras_execucoes": 0})
+        primeira = uso["execucoes"] == 0
+        uso["execucoes"] += 1
+        uso["primeiras_execucoes"] += primeira
+    metricas.incrementar("sql_execucoes", modelo=nome, tipo="primeira_execucao" if primeira else "repeticao")
+
+
+def estatisticas() -> dict:
+    with _lock:
+        execucoes = sum(uso["execucoes"] for uso in _usos.values())
+        primeiras = sum(uso["primeiras_execucoes"] for uso in _usos.values())
+    return {
+        "formas": len(_usos),
+        "execucoes": execucoes,
+        "primeiras_execucoes": primeiras,
+        "repeticoes": execucoes - primeiras,
+    }
+
+
+def usos_por_modelo() -> dict:
+    with _lock:
+        return {nome: dict(uso) for nome, uso in _usos.items()}
+
+
+SQL_PLANOS_EM_CACHE = """
+    SELECT T.text, P.usecounts, P.size_in_bytes
+    FROM sys.dm_exec_cached_plans AS P
+    CROSS APPLY sys.dm_exec_sql_text(P.plan_handle) AS T
+    WHERE T.text LIKE '%/* ' + ? + ':%'
+"""
+
+
+def planos_em_cache(conectar_erp) -> dict:
+    # Planos dos modelos no cache do SQL Server: 'planos' > 1 para o mesmo modelo indica
+    # recompilação (ex.: tipos de parâmetro diferentes); 'usos' - 'planos' são reutilizações
+    padrao = re.compile(rf"/\* {MARCADOR}:(\w+) \*/")
+    planos = {}
+    with conectar_erp() as conexao:
+        cursor = conexao.cursor()
+        cursor.execute(SQL_PLANOS_EM_CACHE, (MARCADOR,))
+        for texto, usos, tamanho in cursor.fetchall():
+            m = padrao.search(texto or "")
+            if not m:
+                continue
+            plano = planos.setdefault(m.group(1), {"planos": 0, "usos": 0, "bytes": 0})
+            plano["planos"] += 1
+            plano["usos"] += usos
+            plano["bytes"] += tamanho
+    return planos
+
+
+# --- Modelos ---
+FILTROS_PRODUTOS = """
+                  AND (@pn_voss IS NULL OR A7.A7_PRODUTO LIKE @pn_voss)
+                  AND (@pn_cliente IS NULL OR REPLACE(TRIM(A7.A7_CODCLI), ' ', '') LIKE @pn_cliente)
+                  AND (@cliente IS NULL OR TRIM(A1.A1_NOME) LIKE @cliente OR TRIM(A1.A1_NREDUZ) LIKE @cliente)
+                  -- R_E_C_N_O_ resolvidos pelo índice de trigramas; acima da marca, só o LIKE
+                  AND (@chaves IS NULL OR A7.R_E_C_N_O_ > @marca
+                       OR A7.R_E_C_N_O_ IN (SELECT CAST([value] AS INT) FROM OPENJSON(@chaves)))
+"""
+
+VARIAVEIS_FILTROS = [
+    ("pn_voss", "VARCHAR(200)"),
+    ("pn_cliente", "VARCHAR(200)"),
+    ("cliente", "VARCHAR(200)"),
+    ("chaves", "NVARCHAR(MAX)"),
+    ("marca", "INT"),
+]
+
+# TOP (@limite) não aceita NULL: sem limite, o maior INT
+SEM_LIMITE = 2147483647
+
+# Uma linha por produto x loja (formato longo), já agregada como no PIVOT original; as linhas
+# de um mesmo produto vêm em sequência
+PRODUTOS_LOJAS = ModeloConsulta(
+    "produtos_lojas",
+    [
+        ("planta", "VARCHAR(20)"),
+        ("loja", "VARCHAR(20)"),
+        ("lojas", "NVARCHAR(MAX)"),
+        *VARIAVEIS_FILTROS,
+        ("limite", "INT"),
+        ("apos_cliente", "VARCHAR(200)"),
+        ("apos_pn_voss", "VARCHAR(200)"),
+        ("apos_pn_cliente", "VARCHAR(200)"),
+    ],
+    f"""
+        WITH DatasNF AS (
+            -- 1. Busca NFs
+            SELECT
+                TRIM(D2_COD) AS D2_COD, TRIM(D2_CLIENTE) AS D2_CLIENTE, TRIM(D2_LOJA) AS D2_LOJA,
+                MAX(D2_EMISSAO) AS DataUltimaNF, MIN(D2_EMISSAO) AS DataPrimeiraNF
+            FROM [dbo].[SD2010]
+            WHERE D_E_L_E_T_ <> '*' AND D2_CLIENTE = @planta
+            GROUP BY TRIM(D2_COD), TRIM(D2_CLIENTE), TRIM(D2_LOJA)
+        ),
+        PrevisaoVendas AS (
+            -- 2. Busca Previsões
+            SELECT
+                TRIM(C4_PRODUTO) AS C4_PRODUTO, TRIM(C4_CLIENTE) AS C4_CLIENTE, TRIM(C4_LOJA) AS C4_LOJA,
+                SUM(CASE WHEN TRY_CAST(C4_DATA AS DATE) >= CAST(GETDATE() AS DATE) THEN C4_QUANT ELSE 0 END) AS QuantidadePrevisaoFutura,
+                CAST(MAX(C4_DATA) AS DATE) AS DataPrevisao
+            FROM [dbo].[SC4010]
+            WHERE D_E_L_E_T_ <> '*' AND C4_CLIENTE = @planta AND C4_DATA <> ''
+            GROUP BY TRIM(C4_PRODUTO), TRIM(C4_CLIENTE), TRIM(C4_LOJA)
+        ),
+        ProdutosFiltrados AS (
+            -- 3. FILTRA os produtos com base na LOJA PRINCIPAL e filtros da UI
+            SELECT DISTINCT
+                A1.A1_COD AS Planta,
+                TRIM(A1.A1_NOME) AS Cliente,
+                TRIM(A1.A1_NREDUZ) AS [Nome Reduzido Cliente Mestre],
+                REPLACE(TRIM(A7.A7_CODCLI), ' ', '') AS [PN Cliente],
+                A7.A7_PRODUTO AS [PN Voss]
+            FROM [dbo].[SA1010] AS A1
+            INNER JOIN [dbo].[SA7010] AS A7
+                ON A7.A7_CLIENTE = A1.A1_COD
+                AND TRIM(A7.A7_LOJA) = TRIM(A1.A1_LOJA)
+                AND A7.D_E_L_E_T_ <> '*'
+            WHERE A1.A1_COD = @planta
+              AND TRIM(A1.A1_LOJA) = @loja
+              AND A1.D_E_L_E_T_ <> '*'
+{FILTROS_PRODUTOS}
+        ),
+        Produtos AS (
+            -- 4. Limite de linhas e paginação por chave: a partir da chave da página anterior
+            SELECT TOP (@limite) PF.*
+            FROM ProdutosFiltrados AS PF
+            WHERE @apos_cliente IS NULL
+               OR PF.Cliente > @apos_cliente
+               OR (PF.Cliente = @apos_cliente AND PF.[PN Voss] > @apos_pn_voss)
+               OR (PF.Cliente = @apos_cliente AND PF.[PN Voss] = @apos_pn_voss AND PF.[PN Cliente] > @apos_pn_cliente)
+            ORDER BY PF.Cliente, PF.[PN Voss], PF.[PN Cliente]
+        ),
+        LojaNomes AS (
+            -- 5. Nome Reduzido das lojas pedidas (lista JSON, já na ordem das colunas)
+            SELECT DISTINCT
+                TRIM(A1_LOJA) AS Loja, TRIM(A1_NREDUZ) AS NomeReduzidoClienteLoja
+            FROM [dbo].[SA1010]
+            WHERE A1_COD = @planta
+              AND D_E_L_E_T_ <> '*'
+              AND TRIM(A1_LOJA) IN (SELECT [value] FROM OPENJSON(@lojas))
+        ),
+        PrecosVenda AS (
+            -- 6. Busca Preços de Venda
+            SELECT
+                A7_CLIENTE,
+                TRIM(A7_LOJA) AS A7_LOJA,
+                A7_PRODUTO,
+                A7_XPRCLIQ
+            FROM [dbo].[SA7010]
+            WHERE A7_CLIENTE = @planta
+              AND D_E_L_E_T_ <> '*'
+        ),
+        TabelaBase AS (
+            -- 7. Monta a ESTRUTURA (PRODUTO x LOJA) e anexa os dados
+            SELECT
+                P.Cliente,
+                P.[Nome Reduzido Cliente Mestre] AS [Nome Reduzido Mestre],
+                P.[PN Cliente],
+                P.[PN Voss],
+                LN.Loja AS D2_LOJA,
+                LN.NomeReduzidoClienteLoja,
+                P.Planta,
+                CAST(UNF.DataUltimaNF AS DATE) AS DataUltimaNF,
+                CAST(UNF.DataPrimeiraNF AS DATE) AS DataPrimeiraNF,
+                PV.DataPrevisao,
+                ISNULL(PV.QuantidadePrevisaoFutura, 0) AS QuantidadePrevisaoFutura,
+                DATEDIFF(DAY, UNF.DataUltimaNF, GETDATE()) AS DiasDesdeUltimaNF,
+                CAST(PVN.A7_XPRCLIQ AS DECIMAL(18,2)) AS PrecoVenda
+
+            FROM Produtos AS P
+            CROSS JOIN LojaNomes AS LN
+            LEFT JOIN DatasNF AS UNF
+                ON UNF.D2_COD = P.[PN Voss]
+                AND UNF.D2_CLIENTE = P.Planta
+                AND UNF.D2_LOJA = LN.Loja
+            LEFT JOIN PrevisaoVendas AS PV
+                ON PV.C4_PRODUTO = P.[PN Voss]
+                AND PV.C4_CLIENTE = P.Planta
+                AND PV.C4_LOJA = LN.Loja
+            LEFT JOIN PrecosVenda AS PVN
+                ON PVN.A7_PRODUTO = P.[PN Voss]
+                AND PVN.A7_CLIENTE = P.Planta
+                AND PVN.A7_LOJA = LN.Loja
+        )
+        SELECT
+            T.Cliente,
+            T.[PN Voss],
+            T.[PN Cliente],
+            T.Planta,
+            T.[Nome Reduzido Mestre] AS [Nome Reduzido],
+            T.D2_LOJA AS Loja,
+            MAX(T.NomeReduzidoClienteLoja) AS NomeReduzidoClienteLoja,
+            MAX(T.DataPrimeiraNF) AS DataPrimeiraNF,
+            MAX(T.DataUltimaNF) AS DataUltimaNF,
+            MAX(T.DataPrevisao) AS DataPrevisao,
+            MAX(T.QuantidadePrevisaoFutura) AS QuantidadePrevisaoFutura,
+            MAX(T.DiasDesdeUltimaNF) AS DiasDesdeUltimaNF,
+            MAX(T.PrecoVenda) AS PrecoVenda
+        FROM TabelaBase AS T
+        GROUP BY T.Cliente, T.[PN Voss], T.[PN Cliente], T.Planta, T.[Nome Reduzido Mestre], T.D2_LOJA
+        ORDER BY T.Cliente, T.[PN Voss], T.[PN Cliente], T.D2_LOJA;
+""",
+)
+
+# --- Fontes estreitas do motor local ---
+NOMES_LOJAS = ModeloConsulta(
+    "nomes_lojas",
+    [("planta", "VARCHAR(20)")],
+    """
+        SELECT TRIM(A1_LOJA) AS Loja, MAX(TRIM(A1_NREDUZ)) AS NomeReduzidoClienteLoja
+        FROM [dbo].[SA1010]
+        WHERE A1_COD = @planta AND D_E_L_E_T_ <> '*'
+        GROUP BY TRIM(A1_LOJA)
+""",
+)
+
+PRODUTOS = ModeloConsulta(
+    "produtos",
+    [("planta", "VARCHAR(20)"), ("loja", "VARCHAR(20)"), *VARIAVEIS_FILTROS],
+    f"""
+        SELECT DISTINCT
+            A1.A1_COD AS Planta,
+            TRIM(A1.A1_NOME) AS Cliente,
+            TRIM(A1.A1_NREDUZ) AS [Nome Reduzido Cliente Mestre],
+            REPLACE(TRIM(A7.A7_CODCLI), ' ', '') AS [PN Cliente],
+            A7.A7_PRODUTO AS [PN Voss]
+        FROM [dbo].[SA1010] AS A1
+        INNER JOIN [dbo].[SA7010] AS A7
+            ON A7.A7_CLIENTE = A1.A1_COD
+            AND TRIM(A7.A7_LOJA) = TRIM(A1.A1_LOJA)
+            AND A7.D_E_L_E_T_ <> '*'
+        WHERE A1.A1_COD = @planta
+          AND TRIM(A1.A1_LOJA) = @loja
+          AND A1.D_E_L_E_T_ <> '*'
+{FILTROS_PRODUTOS}
+""",
+)
+
+# Produtos de todas as lojas da planta (motor "planta"): a loja principal e os filtros de
+# PN/cliente são aplicados localmente por motorLocal.PlantaLocal
+PRODUTOS_PLANTA = ModeloConsulta(
+    "produtos_planta",
+    [("planta", "VARCHAR(20)")],
+    """
+        SELECT DISTINCT
+            TRIM(A1.A1_LOJA) AS Loja,
+            A1.A1_COD AS Planta,
+            TRIM(A1.A1_NOME) AS Cliente,
+            TRIM(A1.A1_NREDUZ) AS [Nome Reduzido Cliente Mestre],
+            REPLACE(TRIM(A7.A7_CODCLI), ' ', '') AS [PN Cliente],
+            A7.A7_PRODUTO AS [PN Voss]
+        FROM [dbo].[SA1010] AS A1
+        INNER JOIN [dbo].[SA7010] AS A7
+            ON A7.A7_CLIENTE = A1.A1_COD
+            AND TRIM(A7.A7_LOJA) = TRIM(A1.A1_LOJA)
+            AND A7.D_E_L_E_T_ <> '*'
+        WHERE A1.A1_COD = @planta
+          AND A1.D_E_L_E_T_ <> '*'
+""",
+)
+
+DATAS_NF = ModeloConsulta(
+    "datas_nf",
+    [("planta", "VARCHAR(20)")],
+    """
+        SELECT
+            TRIM(D2_COD) AS D2_COD, TRIM(D2_LOJA) AS D2_LOJA,
+            CAST(MAX(D2_EMISSAO) AS DATE) AS DataUltimaNF,
+            CAST(MIN(D2_EMISSAO) AS DATE) AS DataPrimeiraNF,
+            DATEDIFF(DAY, MAX(D2_EMISSAO), GETDATE()) AS DiasDesdeUltimaNF
+        FROM [dbo].[SD2010]
+        WHERE D_E_L_E_T_ <> '*' AND D2_CLIENTE = @planta
+        GROUP BY TRIM(D2_COD), TRIM(D2_LOJA)
+""",
+)
+
+PREVISOES = ModeloConsulta(
+    "previsoes",
+    [("planta", "VARCHAR(20)")],
+    """
+        SELECT
+            TRIM(C4_PRODUTO) AS C4_PRODUTO, TRIM(C4_LOJA) AS C4_LOJA,
+            SUM(CASE WHEN TRY_CAST(C4_DATA AS DATE) >= CAST(GETDATE() AS DATE) THEN C4_QUANT ELSE 0 END) AS QuantidadePrevisaoFutura,
+            CAST(MAX(C4_DATA) AS DATE) AS DataPrevisao
+        FROM [dbo].[SC4010]
+        WHERE D_E_L_E_T_ <> '*' AND C4_CLIENTE = @planta AND C4_DATA <> ''
+        GROUP BY TRIM(C4_PRODUTO), TRIM(C4_LOJA)
+""",
+)
+
+PRECOS = ModeloConsulta(
+    "precos",
+    [("planta", "VARCHAR(20)")],
+    """
+        SELECT
+            A7_PRODUTO, TRIM(A7_LOJA) AS A7_LOJA,
+            MAX(CAST(A7_XPRCLIQ AS DECIMAL(18,2))) AS PrecoVenda
+        FROM [dbo].[SA7010]
+        WHERE A7_CLIENTE = @planta AND D_E_L_E_T_ <> '*'
+        GROUP BY A7_PRODUTO, TRIM(A7_LOJA)
+""",
+)
+
+LOJAS_PLANTA = ModeloConsulta(
+    "lojas_planta",
+    [("planta", "VARCHAR(20)")],
+    """
+        SELECT DISTINCT TRIM(A1_LOJA)
+        FROM [dbo].[SA1010]
+        WHERE A1_COD = @planta AND D_E_L_E_T_ <> '*'
+        ORDER BY 1
+""",
+)
+
+MODELOS = (
+    PRODUTOS_LOJAS,
+    NOMES_LOJAS,
+    PRODUTOS,
+    PRODUTOS_PLANTA,
+    DATAS_NF,
+    PREVISOES,
+    PRECOS,
+    LOJAS_PLANTA,
+)
+
+metricas.registrar_coletor("modelos_sql", estatisticas)
+
+
+if __name__ == "__main__":
+    from consultaBD import RepositorioPrincipal
+
+    logging.basicConfig(level=logging.INFO)
+    for nome, plano in sorted(planos_em_cache(RepositorioPrincipal()._conectar).items()):
+        print(f"{nome}: {plano}")
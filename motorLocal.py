@@ -0,0 +1,272 @@
+# motorLocal.py
+# Junta e pivota localmente os conjuntos "estreitos" buscados do Protheus, reproduzindo
+# exatamente o layout de colunas do PIVOT por loja (Nome Reduzido, Primeira NF... por loja).
+# pivotar_longo faz o mesmo a partir do formato longo do modelo 'produtos_lojas', e
+# PlantaLocal guarda as fontes de uma planta inteira para derivar qualquer loja principal.
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_BASE = ["Cliente", "PN Voss", "PN Cliente", "Planta", "Nome Reduzido"]
+
+# (prefixo da coluna de saída, fonte, coluna da fonte) na mesma ordem do PIVOT em SQL
+METRICAS_POR_LOJA = [
+    ("Primeira NF", "datas_nf", "DataPrimeiraNF"),
+    ("Última NF", "datas_nf", "DataUltimaNF"),
+    ("Previsão Vendas", "previsoes", "DataPrevisao"),
+    ("Qtd Previsão Futura", "previsoes", "QuantidadePrevisaoFutura"),
+    ("Dias", "datas_nf", "DiasDesdeUltimaNF"),
+    ("Preço Venda", "precos", "PrecoVenda"),
+]
+
+# Colunas de chave (produto, loja) de cada fonte
+CHAVES_FONTES = {
+    "datas_nf": ("D2_COD", "D2_LOJA"),
+    "previsoes": ("C4_PRODUTO", "C4_LOJA"),
+    "precos": ("A7_PRODUTO", "A7_LOJA"),
+}
+
+
+def _chave(serie: pd.Series) -> pd.Series:
+    # O SQL Server ignora espaços à direita na comparação; os campos do Protheus são CHAR
+    return serie.astype(str).str.rstrip()
+
+
+def _matriz(fonte: pd.DataFrame, chaves: tuple, coluna: str, produtos: pd.Index, lojas: pd.Index):
+    # Matriz produtos x lojas preenchida de uma vez só por indexação vetorizada
+    matriz = np.full((len(produtos), len(lojas)), None, dtype=object)
+    if fonte is None or fonte.empty:
+        return matriz
+    linhas = produtos.get_indexer(_chave(fonte[chaves[0]]))
+    colunas = lojas.get_indexer(_chave(fonte[chaves[1]]))
+    validos = (linhas >= 0) & (colunas >= 0)
+    valores = fonte[coluna].to_numpy(dtype=object)
+    matriz[linhas[validos], colunas[validos]] = valores[validos]
+    return matriz
+
+
+def matrizes_fontes(fontes: dict, produtos: pd.Index, lojas: pd.Index) -> dict:
+    # (fonte, coluna) -> matriz produtos x lojas de cada métrica do PIVOT
+    return {
+        (fonte, coluna): _matriz(fontes[fonte], CHAVES_FONTES[fonte], coluna, produtos, lojas)
+        for _, fonte, coluna in METRICAS_POR_LOJA
+    }
+
+
+def nomes_por_loja(nomes_lojas: pd.DataFrame) -> dict:
+    if nomes_lojas is None or nomes_lojas.empty:
+        return {}
+    return (
+        nomes_lojas.assign(Loja=_chave(nomes_lojas["Loja"]))
+        .groupby("Loja")["NomeReduzidoClienteLoja"]
+        .max()
+        .to_dict()
+    )
+
+
+def _montar_colunas(base: pd.DataFrame, lojas: list, matrizes: dict, nomes: dict) -> pd.DataFrame:
+    # matrizes já com as linhas de 'base' e as colunas na ordem de 'lojas'
+    colunas = {nome: base[nome].to_numpy(dtype=object) for nome in COLUNAS_BASE}
+    for j, loja in enumerate(lojas):
+        colunas[f"Nome Reduzido {loja}"] = np.full(len(base), nomes.get(loja), dtype=object)
+        for prefixo, fonte, coluna in METRICAS_POR_LOJA:
+            valores = matrizes[(fonte, coluna)][:, j]
+            if coluna == "QuantidadePrevisaoFutura":
+                # ISNULL(..., 0) do PIVOT original
+                valores = np.where(pd.isna(valores), 0, valores)
+            colunas[f"{prefixo} {loja}"] = valores
+    return pd.DataFrame(colunas)
+
+
+def montar_pivot(
+    produtos: pd.DataFrame,
+    lojas: list,
+    nomes_lojas: pd.DataFrame,
+    datas_nf: pd.DataFrame,
+    previsoes: pd.DataFrame,
+    precos: pd.DataFrame,
+    limite: int = None,
+) -> pd.DataFrame:
+    # produtos: Planta, Cliente, Nome Reduzido Cliente Mestre, PN Cliente, PN Voss (DISTINCT)
+    # lojas: lista já ordenada com a loja principal primeiro
+    if produtos.empty or not lojas:
+        return pd.DataFrame(columns=COLUNAS_BASE)
+
+    base = (
+        produtos.rename(columns={"Nome Reduzido Cliente Mestre": "Nome Reduzido"})[COLUNAS_BASE]
+        .sort_values(["Cliente", "PN Voss"], kind="stable")
+        .reset_index(drop=True)
+    )
+    if limite:
+        base = base.head(limite)
+
+    chave_base = _chave(base["PN Voss"])
+    indice_produtos = pd.Index(chave_base.unique())
+    indice_lojas = pd.Index(lojas)
+    linhas_base = indice_produtos.get_indexer(chave_base)
+
+    fontes = {"datas_nf": datas_nf, "previsoes": previsoes, "precos": precos}
+    matrizes = {
+        chave: matriz[linhas_base]
+        for chave, matriz in matrizes_fontes(fontes, indice_produtos, indice_lojas).items()
+    }
+    return _montar_colunas(base, lojas, matrizes, nomes_por_loja(nomes_lojas))
+
+
+# --- Planta inteira em memória (motor "planta" de buscar_dados) ---
+# Filtros da tela -> colunas comparadas com LIKE '%valor%' (como em FILTROS_PRODUTOS)
+FILTROS_LOCAIS = {
+    "pn_voss": ("PN Voss",),
+    "pn_cliente": ("PN Cliente",),
+    "cliente": ("Cliente", "Nome Reduzido"),
+}
+
+
+def like_para_regex(padrao: str) -> str:
+    # LIKE do SQL Server -> expressão regular: % e _ curingas, [abc]/[^abc] conjuntos
+    partes = []
+    i = 0
+    while i < len(padrao):
+        caractere = padrao[i]
+        fim = padrao.find("]", i + 2) if caractere == "[" else -1
+        if caractere == "%":
+            partes.append(".*")
+        elif caractere == "_":
+            partes.append(".")
+        elif fim > 0:
+            conjunto = padrao[i + 1 : fim]
+            negado = conjunto.startswith("^")
+            conjunto = conjunto[negado:].replace("\\", "\\\\").replace("]", "\\]")
+            partes.append(f"[{'^' if negado else ''}{conjunto}]")
+            i = fim
+        else:
+            partes.append(re.escape(caractere))
+        i += 1
+    return "".join(partes)
+
+
+class PlantaLocal:
+    # Fontes de uma planta inteira, buscadas uma vez: produtos de todas as lojas e as métricas
+    # (NF, previsões, preços) já cruzadas em matrizes produtos x lojas. Trocar a loja principal
+    # ou os filtros de PN/cliente só seleciona linhas e reordena colunas, sem voltar ao banco.
+    def __init__(
+        self,
+        produtos: pd.DataFrame,
+        lojas: list,
+        nomes_lojas: pd.DataFrame,
+        datas_nf: pd.DataFrame,
+        previsoes: pd.DataFrame,
+        precos: pd.DataFrame,
+    ):
+        # produtos: Loja + colunas de PRODUTOS, uma linha por produto de cada loja da planta
+        self.lojas = list(lojas)
+        self.produtos = (
+            produtos.rename(columns={"Nome Reduzido Cliente Mestre": "Nome Reduzido"})
+            .assign(Loja=_chave(produtos["Loja"]))
+            .drop_duplicates(["Loja"] + COLUNAS_BASE)
+            .reset_index(drop=True)
+        )
+        chave_produtos = _chave(self.produtos["PN Voss"])
+        self.indice_produtos = pd.Index(chave_produtos.unique())
+        # Linha de cada produto (de cada loja) nas matrizes
+        self.linhas = self.indice_produtos.get_indexer(chave_produtos)
+        self.por_loja = {
+            loja: np.asarray(posicoes) for loja, posicoes in self.produtos.groupby("Loja").indices.items()
+        }
+        self.matrizes = matrizes_fontes(
+            {"datas_nf": datas_nf, "previsoes": previsoes, "precos": precos},
+            self.indice_produtos,
+            pd.Index(self.lojas),
+        )
+        self.nomes = nomes_por_loja(nomes_lojas)
+        self.criado_em = time.time()
+
+    def derivar(self, loja: str, filtros: dict = None, limite: int = None) -> pd.DataFrame:
+        # Mesmo resultado do PIVOT para a loja principal e os filtros pn_voss/pn_cliente/cliente
+        loja = (loja or "").strip()
+        lojas = ([loja] if loja in self.lojas else []) + [l for l in self.lojas if l != loja]
+        posicoes = self.por_loja.get(loja)
+        if posicoes is None or not lojas:
+            return pd.DataFrame(columns=COLUNAS_BASE)
+
+        base = self.produtos.iloc[posicoes]
+        for campo, colunas in FILTROS_LOCAIS.items():
+            valor = (filtros or {}).get(campo)
+            if not valor:
+                continue
+            # LIKE '%valor%' sem diferenciar maiúsculas (collation CI do Protheus); NULL não casa
+            regex = like_para_regex(f"%{valor}%")
+            casa = np.zeros(len(base), dtype=bool)
+            for coluna in colunas:
+                resultado = base[coluna].astype(object).str.fullmatch(regex, case=False, flags=re.DOTALL)
+                casa |= resultado.fillna(False).to_numpy(dtype=bool)
+            base = base[casa]
+
+        base = base.sort_values(["Cliente", "PN Voss", "PN Cliente"], kind="stable")
+        if limite:
+            base = base.head(limite)
+        linhas = self.linhas[base.index.to_numpy()]
+        colunas_lojas = pd.Index(self.lojas).get_indexer(lojas)
+        matrizes = {chave: matriz[np.ix_(linhas, colunas_lojas)] for chave, matriz in self.matrizes.items()}
+        return _montar_colunas(base.reset_index(drop=True), lojas, matrizes, self.nomes)
+
+    def tamanho_bytes(self) -> int:
+        # Produtos (profundo) + ponteiros das matrizes; os valores das matrizes são os mesmos
+        # objetos vindos do driver e entram aproximados por 32 bytes cada
+        produtos = int(self.produtos.memory_usage(deep=True).sum())
+        return produtos + sum(m.nbytes + 32 * m.size for m in self.matrizes.values())
+
+
+# (prefixo da coluna de saída, coluna do formato longo) na ordem das colunas de cada loja
+METRICAS_LONGO = [("Nome Reduzido", "NomeReduzidoClienteLoja")] + [
+    (prefixo, coluna) for prefixo, _, coluna in METRICAS_POR_LOJA
+]
+
+
+def colunas_pivot(lojas: list) -> list:
+    return COLUNAS_BASE + [f"{prefixo} {loja}" for loja in lojas for prefixo, _ in METRICAS_LONGO]
+
+
+def frame_longo(linhas: list, colunas: list) -> pd.DataFrame:
+    # dtype=object preserva os tipos do driver (int, Decimal, date), como no PIVOT em SQL
+    return pd.DataFrame([tuple(linha) for linha in linhas], columns=colunas, dtype=object)
+
+
+def pivotar_longo(longo: pd.DataFrame, lojas: list) -> pd.DataFrame:
+    # longo: uma linha por produto x loja (COLUNAS_BASE, Loja e as métricas), já agregada no
+    # banco e com as linhas de cada produto em sequência; lojas: ordem das colunas, com a loja
+    # principal primeiro
+    if longo.empty or not lojas:
+        return pd.DataFrame(columns=colunas_pivot(lojas))
+
+    chaves = longo[COLUNAS_BASE].to_numpy(dtype=object)
+    novo_produto = np.concatenate(([True], (chaves[1:] != chaves[:-1]).any(axis=1)))
+    linhas = np.cumsum(novo_produto) - 1
+    primeiras = np.flatnonzero(novo_produto)
+    colunas_lojas = pd.Index(lojas).get_indexer(_chave(longo["Loja"]))
+    validos = colunas_lojas >= 0
+
+    colunas = {nome: longo[nome].to_numpy(dtype=object)[primeiras] for nome in COLUNAS_BASE}
+    matrizes = {}
+    for prefixo, coluna in METRICAS_LONGO:
+        # ISNULL(..., 0) do PIVOT original: loja sem linha fica com quantidade 0
+        vazio = 0 if coluna == "QuantidadePrevisaoFutura" else None
+        matriz = np.full((len(primeiras), len(lojas)), vazio, dtype=object)
+        matriz[linhas[validos], colunas_lojas[validos]] = longo[coluna].to_numpy(dtype=object)[validos]
+        matrizes[prefixo] = matriz
+    for j, loja in enumerate(lojas):
+        for prefixo, _ in METRICAS_LONGO:
+            colunas[f"{prefixo} {loja}"] = matrizes[prefixo][:, j]
+    return pd.DataFrame(colunas)
+
+
+def para_registros(df: pd.DataFrame) -> list:
+    # Mesmo formato de buscar_dados: lista de dicts com None para valores ausentes
+    if df.empty:
+        return []
+    colunas = list(df.columns)
+    valores = df.to_numpy(dtype=object)
+    valores[pd.isna(valores)] = None
+    return [dict(zip(colunas, linha)) for linha in valores.tolist()]
@@ -0,0 +1,282 @@
+# perfilRequisicao.py
+# Perfil sob demanda de um rerun do Streamlit. Quando uma planta está lenta, um administrador
+# abre a tela com ?perfil=1 (ou o processo sobe com PERFIL_ATIVO=1) e o trecho do rerun entre
+# iniciar() e finalizar(), inclusive as consultas que ele submeter ao executor de
+# execucaoConsultas.py (via envolver()), é medido com:
+# - cProfile (tempo por função; cpu.prof abre no snakeviz/pstats);
+# - amostragem das pilhas a cada PERFIL_INTERVALO_AMOSTRA_MS (cpu.folded, formato "collapsed"
+#   do flamegraph.pl/speedscope);
+# - tracemalloc (memoria.txt com as linhas que mais alocaram, memoria.folded para flamegraph
+#   ponderado por bytes e o snapshot bruto em memoria.tracemalloc).
+# Os arquivos vão num .zip em PERFIL_PATH, junto com os filtros da requisição, e a tela oferece
+# o download. Só usuários de PERFIL_ADMINS; um perfil por vez no processo (tracemalloc e o
+# perfilador são globais). Desligado, iniciar() só lê um parâmetro e anotar()/envolver() só
+# conferem um atributo da thread: nada é importado nem instalado.
+#
+# Exemplo (perfil de uma chamada fora do Streamlit):
+#   python perfilRequisicao.py --planta 000123 --loja 01
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from settings import PERFIL_ADMINS, PERFIL_ATIVO, PERFIL_INTERVALO_AMOSTRA_MS, PERFIL_PATH
+
+PARAMETRO_URL = "perfil"
+QUADROS_MEMORIA = 25  # Profundidade das pilhas guardadas pelo tracemalloc
+
+_local = threading.local()
+_exclusivo = threading.Lock()
+
+
+def solicitado(parametros) -> bool:
+    # parametros: st.query_params (ou dict); PERFIL_ATIVO liga para todo rerun de administrador
+    return PERFIL_ATIVO or str(parametros.get(PARAMETRO_URL) or "") in ("1", "true", "sim")
+
+
+def autorizado(usuario: str) -> bool:
+    return bool(usuario) and usuario.strip().lower() in PERFIL_ADMINS
+
+
+def _nome_quadro(quadro) -> str:
+    codigo = quadro.f_code
+    return f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}"
+
+
+class _Amostrador(threading.Thread):
+    # Lê as pilhas das threads acompanhadas em intervalos fixos: pilha colapsada -> amostras
+    def __init__(self, intervalo: float):
+        super().__init__(name="perfil-amostrador", daemon=True)
+        self.intervalo = intervalo
+        self.threads = set()
+        self.pilhas = {}
+        self._parar = threading.Event()
+
+    def run(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            quadros = sys._current_frames()
+            for ident in list(self.threads):
+                quadro = quadros.get(ident)
+                nomes = []
+                while quadro is not None:
+                    nomes.append(_nome_quadro(quadro))
+                    quadro = quadro.f_back
+                if nomes:
+                    pilha = ";".join(reversed(nomes))
+                    self.pilhas[pilha] = self.pilhas.get(pilha, 0) + 1
+
+    def parar(self) -> None:
+        self._parar.set()
+        self.join()
+
+
+class PerfilRerun:
+    def __init__(self, usuario: str):
+        import cProfile
+        import tracemalloc
+
+        self.usuario = usuario
+        self.anotacoes = {}
+        self.iniciado_em = time.time()
+        self._inicio = time.perf_counter()
+        self._perfis = [cProfile.Profile()]
+        self._lock = threading.Lock()
+        self._amostrador = _Amostrador(PERFIL_INTERVALO_AMOSTRA_MS / 1000)
+        self._amostrador.threads.add(threading.get_ident())
+        self._tracemalloc_proprio = not tracemalloc.is_tracing()
+        if self._tracemalloc_proprio:
+            tracemalloc.start(QUADROS_MEMORIA)
+        self._amostrador.start()
+        self._perfis[0].enable()
+
+    def envolver(self, funcao):
+        # Para funções que rodam em outra thread (executor de consultas): perfil próprio,
+        # somado ao do rerun no final, e a thread passa a ser amostrada
+        import cProfile
+
+        def executar_com_perfil(*args, **kwargs):
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:
+                perfil = None  # Python 3.12+: o perfilador do rerun já vê todas as threads
+            ident = threading.get_ident()
+            self._amostrador.threads.add(ident)
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                self._amostrador.threads.discard(ident)
+                if perfil is not None:
+                    perfil.disable()
+                    with self._lock:
+                        self._perfis.append(perfil)
+
+        return executar_com_perfil
+
+    def finalizar(self) -> tuple:
+        # Para a coleta e grava o .zip; devolve (nome do arquivo, bytes, resumo)
+        import io
+        import pstats
+        import tracemalloc
+        import zipfile
+
+        # Perfilador, amostrador e tracemalloc são desligados mesmo que um passo falhe
+        try:
+            self._perfis[0].disable()
+        finally:
+            try:
+                self._amostrador.parar()
+                snapshot = tracemalloc.take_snapshot().filter_traces(
+                    (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+                )
+            finally:
+                if self._tracemalloc_proprio:
+                    tracemalloc.stop()
+        duracao = time.perf_counter() - self._inicio
+
+        with self._lock:
+            perfis = list(self._perfis)
+        texto_cpu = io.StringIO()
+        estatisticas = pstats.Stats(perfis[0], stream=texto_cpu)
+        for perfil in perfis[1:]:
+            estatisticas.add(perfil)
+        estatisticas.sort_stats("cumulative").print_stats(40)
+        linhas_memoria = snapshot.statistics("lineno")
+        pilhas_memoria = {}
+        for estatistica in snapshot.statistics("traceback"):
+            pilha = ";".join(
+                f"{os.path.basename(quadro.filename)}:{quadro.lineno}" for quadro in estatistica.traceback
+            )
+            pilhas_memoria[pilha] = pilhas_memoria.get(pilha, 0) + estatistica.size
+
+        resumo = {
+            "momento": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.iniciado_em)),
+            "usuario": self.usuario,
+            "duracao_ms": round(1000 * duracao, 1),
+            "amostras": sum(self._amostrador.pilhas.values()),
+            "memoria_alocada_bytes": sum(e.size for e in linhas_memoria),
+            "maiores_alocacoes": [
+                {"linha": str(e.traceback[0]), "bytes": e.size, "blocos": e.count}
+                for e in linhas_memoria[:10]
+            ],
+            **self.anotacoes,
+        }
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as arquivo_zip:
+            arquivo_zip.writestr("resumo.json", json.dumps(resumo, ensure_ascii=False, indent=2, default=str))
+            arquivo_zip.writestr("cpu.txt", texto_cpu.getvalue())
+            arquivo_zip.writestr("cpu.prof", _dump_pstats(estatisticas))
+            arquivo_zip.writestr("cpu.folded", _colapsadas(self._amostrador.pilhas))
+            arquivo_zip.writestr("memoria.txt", "\n".join(str(e) for e in linhas_memoria[:50]))
+            arquivo_zip.writestr("memoria.folded", _colapsadas(pilhas_memoria))
+            arquivo_zip.writestr("memoria.tracemalloc", _dump_snapshot(snapshot))
+        conteudo = buffer.getvalue()
+
+        filtros = self.anotacoes.get("filtros") or {}
+        nome = "perfil_{}_{}_{}.zip".format(
+            time.strftime("%Y%m%d_%H%M%S", time.localtime(self.iniciado_em)),
+            filtros.get("planta") or "sem-planta",
+            filtros.get("loja") or "sem-loja",
+        )
+        try:
+            os.makedirs(PERFIL_PATH, exist_ok=True)
+            with open(os.path.join(PERFIL_PATH, nome), "wb") as arquivo:
+                arquivo.write(conteudo)
+        except OSError as e:
+            logging.error(f"Perfil: não foi possível gravar {nome} em {PERFIL_PATH}: {e}")
+        logging.info(f"Perfil de {self.usuario} gravado: {nome} ({resumo['duracao_ms']} ms)")
+        return nome, conteudo, resumo
+
+
+def _colapsadas(pilhas: dict) -> str:
+    return "".join(f"{pilha} {peso}\n" for pilha, peso in sorted(pilhas.items()))
+
+
+def _dump_pstats(estatisticas) -> bytes:
+    import marshal
+
+    return marshal.dumps(estatisticas.stats)
+
+
+def _dump_snapshot(snapshot) -> bytes:
+    import tempfile
+
+    with tempfile.TemporaryDirectory(prefix="perfil_") as pasta:
+        caminho = os.path.join(pasta, "memoria.tracemalloc")
+        snapshot.dump(caminho)
+        with open(caminho, "rb") as arquivo:
+            return arquivo.read()
+
+
+# --- Interface usada pelo app.py ---
+def iniciar(parametros, obter_usuario):
+    # Início do rerun. Devolve o PerfilRerun ou None (desligado, sem permissão ou outro perfil
+    # em andamento no processo)
+    if not solicitado(parametros):
+        return None
+    usuario = obter_usuario()
+    if not autorizado(usuario):
+        logging.warning(f"Perfil solicitado por {usuario}, que não está em PERFIL_ADMINS.")
+        return None
+    if not _exclusivo.acquire(blocking=False):
+        logging.info("Perfil já em andamento neste processo; rerun sem perfil.")
+        return None
+    try:
+        perfil = PerfilRerun(usuario)
+    except Exception:
+        _exclusivo.release()
+        raise
+    _local.perfil = perfil
+    return perfil
+
+
+def finalizar(perfil):
+    # Fim do rerun: (nome, bytes do .zip, resumo) ou None se não havia perfil. Chamar num
+    # finally: st.stop() e st.rerun() interrompem o script com exceção, e um perfil não
+    # finalizado deixa o perfilador ligado e o processo sem novos perfis
+    if perfil is None:
+        return None
+    try:
+        return perfil.finalizar()
+    finally:
+        _local.perfil = None
+        _exclusivo.release()
+
+
+def anotar(**valores) -> None:
+    # Ex.: anotar(filtros=filtros); vai para o resumo.json e para o nome do arquivo
+    perfil = getattr(_local, "perfil", None)
+    if perfil is not None:
+        perfil.anotacoes.update(valores)
+
+
+def envolver(funcao):
+    # Sem perfil ativo na thread, devolve a própria função
+    perfil = getattr(_local, "perfil", None)
+    return funcao if perfil is None else perfil.envolver(funcao)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from consultaBD import RepositorioPrincipal
+
+    parser = argparse.ArgumentParser(description="Perfil de uma chamada de buscar_dados.")
+    parser.add_argument("--planta", required=True)
+    parser.add_argument("--loja", required=True)
+    parser.add_argument("--motor", default="sql")
+    args = parser.parse_args()
+
+    filtros = {"planta": args.planta, "loja": args.loja}
+    _exclusivo.acquire()
+    _local.perfil = perfil = PerfilRerun("linha_de_comando")
+    anotar(filtros=filtros, motor=args.motor)
+    try:
+        RepositorioPrincipal().buscar_dados(filtros, usar_cache=False, motor=args.motor)
+    finally:
+        nome, _, resumo = finalizar(perfil)
+    print(os.path.join(PERFIL_PATH, nome))
+    print(json.dumps(resumo, ensure_ascii=False, indent=2, default=str))
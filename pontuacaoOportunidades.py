@@ -0,0 +1,230 @@
+# pontuacaoOportunidades.py
+# Responde à pergunta central do After Market: quais PN Voss estão sem NF recente e sem
+# previsão futura em cada loja da planta, e quais dessas lacunas valem mais a pena. O
+# resultado largo de buscar_dados (Dias/Qtd Previsão Futura/Preço Venda por loja) vira
+# matrizes NumPy produtos x lojas e todas as pontuações saem de uma passada vetorizada.
+#
+# Exemplos:
+#   python pontuacaoOportunidades.py --planta 000123 --loja 01 --top 50
+#   python pontuacaoOportunidades.py --medir       # 50 mil produtos x 40 lojas sintéticos
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from motorLocal import COLUNAS_BASE
+from settings import OPORTUNIDADE_DIAS_SEM_NF
+
+# Pesos da pontuação final (0 a 100): inatividade da loja, evidência de demanda nas demais
+# lojas da planta e valor potencial (preço x quantidade de referência)
+PESOS = {"inatividade": 0.4, "evidencia": 0.3, "valor": 0.3}
+# Dias a partir dos quais a inatividade é máxima (quem nunca comprou também conta como 1)
+DIAS_INATIVIDADE_MAXIMA = 3 * 365
+
+
+class MatrizesLoja:
+    # Resultado de buscar_dados reorganizado: uma linha por produto, uma coluna por loja
+    def __init__(self, base: pd.DataFrame, lojas: list, dias, previsao, preco):
+        self.base = base  # COLUNAS_BASE, na ordem das linhas das matrizes
+        self.lojas = lojas
+        self.dias = dias  # float64, NaN = nunca houve NF na loja
+        self.previsao = previsao  # float64, quantidade de previsão futura (0 = sem previsão)
+        self.preco = preco  # float64, NaN = sem preço cadastrado no SA7
+
+
+def _lojas(colunas) -> list:
+    return [nome[len("Dias "):] for nome in colunas if nome.startswith("Dias ")]
+
+
+def _matriz(df: pd.DataFrame, prefixo: str, lojas: list) -> np.ndarray:
+    matriz = np.empty((len(df), len(lojas)), dtype="float64")
+    for j, loja in enumerate(lojas):
+        coluna = df[f"{prefixo} {loja}"]
+        if coluna.dtype == object:
+            coluna = pd.to_numeric(coluna, errors="coerce")  # Decimal/None do pyodbc
+        matriz[:, j] = coluna.to_numpy(dtype="float64", na_value=np.nan)
+    return matriz
+
+
+def matrizes(dados) -> MatrizesLoja:
+    # dados: lista de dicts (buscar_dados) ou DataFrame (buscar_dataframe)
+    if isinstance(dados, pd.DataFrame):
+        df = dados
+    else:
+        dados = list(dados)
+        colunas = list(dados[0]) if dados else []
+        lojas = _lojas(colunas)
+        necessarias = COLUNAS_BASE + [
+            f"{prefixo} {loja}" for loja in lojas for prefixo in ("Dias", "Qtd Previsão Futura", "Preço Venda")
+        ]
+        df = pd.DataFrame.from_records(dados, columns=[c for c in necessarias if c in colunas])
+    lojas = _lojas(df.columns)
+    previsao = _matriz(df, "Qtd Previsão Futura", lojas)
+    np.nan_to_num(previsao, copy=False, nan=0.0)
+    return MatrizesLoja(
+        df[[c for c in COLUNAS_BASE if c in df.columns]].reset_index(drop=True),
+        lojas,
+        _matriz(df, "Dias", lojas),
+        previsao,
+        _matriz(df, "Preço Venda", lojas),
+    )
+
+
+def _media_linhas(matriz: np.ndarray, validos: np.ndarray) -> np.ndarray:
+    # Média por produto só das células válidas, sem aviso de "mean of empty slice"
+    quantidade = validos.sum(axis=1)
+    soma = np.where(validos, matriz, 0.0).sum(axis=1)
+    return np.divide(soma, quantidade, out=np.full(len(matriz), np.nan), where=quantidade > 0)
+
+
+def pontuar(
+    dados,
+    dias_sem_nf: int = OPORTUNIDADE_DIAS_SEM_NF,
+    pesos: dict = None,
+    limite: int = None,
+) -> pd.DataFrame:
+    # Uma linha por lacuna (PN Voss x loja sem NF há mais de dias_sem_nf e sem previsão
+    # futura), ordenada pela pontuação. limite: só as N melhores (seleção parcial, O(n)).
+    pesos = {**PESOS, **(pesos or {})}
+    m = dados if isinstance(dados, MatrizesLoja) else matrizes(dados)
+    quantidade_lojas = len(m.lojas)
+    if not len(m.base) or not quantidade_lojas:
+        return pd.DataFrame(columns=COLUNAS_BASE + ["Loja", "Pontuação"])
+
+    # Matrizes produtos x lojas; NaN <= dias_sem_nf é falso, então "nunca vendeu" não é ativa
+    com_previsao = m.previsao > 0
+    ativa = (m.dias <= dias_sem_nf) | com_previsao
+    lojas_ativas = ativa.sum(axis=1)
+    sem_preco = np.isnan(m.preco)
+
+    # Evidência de demanda: fração das outras lojas da planta em que o produto está ativo
+    evidencia = lojas_ativas / max(quantidade_lojas - 1, 1)
+    # Valor potencial: preço da loja (ou médio do produto) x previsão média das lojas ativas
+    preco_medio = _media_linhas(m.preco, ~sem_preco)
+    quantidade_referencia = np.nan_to_num(_media_linhas(m.previsao, com_previsao), nan=1.0)
+
+    # A pontuação é montada negativa e em uma única matriz, com operações in-place (cada
+    # passada sobre produtos x lojas custa o mesmo que as contas): argpartition direto nela
+    escala = 100 / sum(pesos.values())
+    custo = m.dias * (-pesos["inatividade"] * escala / DIAS_INATIVIDADE_MAXIMA)
+    # Inatividade limitada a 1; fmax troca o NaN (nunca vendeu) pelo máximo na mesma passada
+    np.fmax(custo, -pesos["inatividade"] * escala, out=custo)
+    custo -= (evidencia * (pesos["evidencia"] * escala))[:, None]
+
+    valor_log = np.where(sem_preco, preco_medio[:, None], m.preco)
+    valor_log *= quantidade_referencia[:, None]
+    # Escala logarítmica (poucos itens caros não achatam os demais); fmax zera o NaN (sem preço)
+    np.log1p(valor_log, out=valor_log)
+    np.fmax(valor_log, 0.0, out=valor_log)
+    valor_log *= ~ativa  # O máximo da normalização considera só as lacunas
+    maximo = valor_log.max()
+    if maximo > 0:
+        valor_log *= pesos["valor"] * escala / maximo
+        custo -= valor_log
+    np.copyto(custo, np.inf, where=ativa)
+
+    # Seleção sobre a matriz achatada: com limite, só as N melhores (seleção parcial, O(n))
+    plana = custo.ravel()
+    lacunas = plana.size - int(lojas_ativas.sum())
+    if limite and limite < lacunas:
+        ordem = np.argpartition(plana, limite - 1)[:limite]
+    else:
+        ordem = np.flatnonzero(~ativa)
+    ordem = ordem[np.argsort(plana[ordem], kind="stable")]
+    linhas, colunas = np.divmod(ordem, quantidade_lojas)
+
+    # Componentes recalculados só para as lacunas selecionadas
+    dias = m.dias[linhas, colunas]
+    preco = np.where(sem_preco[linhas, colunas], preco_medio[linhas], m.preco[linhas, colunas])
+    resultado = m.base.iloc[linhas].reset_index(drop=True)
+    resultado["Loja"] = np.asarray(m.lojas, dtype=object)[colunas]
+    resultado["Dias sem NF"] = dias
+    resultado["Lojas ativas"] = lojas_ativas[linhas]
+    resultado["Cobertura previsão"] = (com_previsao.sum(axis=1) / quantidade_lojas)[linhas]
+    resultado["Preço referência"] = preco
+    resultado["Qtd referência"] = quantidade_referencia[linhas]
+    resultado["Valor potencial"] = np.nan_to_num(preco * quantidade_referencia[linhas], nan=0.0)
+    resultado["Inatividade"] = np.fmin(dias / DIAS_INATIVIDADE_MAXIMA, 1.0)
+    resultado["Evidência"] = evidencia[linhas]
+    resultado["Pontuação"] = np.round(-plana[ordem], 2)
+    return resultado
+
+
+def resumo_por_produto(oportunidades: pd.DataFrame) -> pd.DataFrame:
+    # Uma linha por PN Voss: quantas lojas com lacuna, valor somado e melhor pontuação
+    if oportunidades.empty:
+        return oportunidades
+    return (
+        oportunidades.groupby(["PN Voss", "PN Cliente"], sort=False)
+        .agg(
+            **{
+                "Lojas com lacuna": ("Loja", "count"),
+                "Lojas": ("Loja", ", ".join),
+                "Valor potencial": ("Valor potencial", "sum"),
+                "Pontuação": ("Pontuação", "max"),
+            }
+        )
+        .sort_values("Pontuação", ascending=False, kind="stable")
+        .reset_index()
+    )
+
+
+# --- Medição com dados sintéticos ---
+def _matrizes_sinteticas(produtos: int, lojas: int, semente: int = 42) -> MatrizesLoja:
+    gerador = np.random.default_rng(semente)
+    base = pd.DataFrame(
+        {
+            "Cliente": "MONTADORA 1 LTDA",
+            "PN Voss": [f"VS{i:09d}" for i in range(produtos)],
+            "PN Cliente": [f"{i % 97} {i:06d}" for i in range(produtos)],
+            "Planta": "100000",
+            "Nome Reduzido": "PLANTA 1",
+        }
+    )
+    dias = gerador.integers(0, 1500, (produtos, lojas)).astype("float64")
+    dias[gerador.random((produtos, lojas)) < 0.3] = np.nan
+    previsao = np.where(gerador.random((produtos, lojas)) < 0.2, gerador.integers(1, 500, (produtos, lojas)), 0)
+    preco = np.round(gerador.uniform(1, 900, (produtos, lojas)), 2)
+    preco[gerador.random((produtos, lojas)) < 0.4] = np.nan
+    return MatrizesLoja(base, [f"{n + 1:02d}" for n in range(lojas)], dias, previsao.astype("float64"), preco)
+
+
+def medir(produtos: int = 50000, lojas: int = 40, repeticoes: int = 5) -> dict:
+    m = _matrizes_sinteticas(produtos, lojas)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        oportunidades = pontuar(m, limite=1000)
+        tempos.append(time.perf_counter() - inicio)
+    inicio = time.perf_counter()
+    todas = pontuar(m)
+    tempo_todas = time.perf_counter() - inicio
+    return {
+        "produtos": produtos,
+        "lojas": lojas,
+        "lacunas": len(todas),
+        "top1000_ms": round(1000 * min(tempos), 1),
+        "todas_ms": round(1000 * tempo_todas, 1),
+        "melhor": oportunidades.iloc[0][["PN Voss", "Loja", "Pontuação"]].to_dict(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lacunas de NF/previsão por loja, ordenadas por oportunidade.")
+    parser.add_argument("--planta")
+    parser.add_argument("--loja")
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--dias-sem-nf", type=int, default=OPORTUNIDADE_DIAS_SEM_NF)
+    parser.add_argument("--medir", action="store_true", help="Mede com dados sintéticos.")
+    args = parser.parse_args()
+
+    if args.medir:
+        for produtos, lojas in ((5000, 10), (20000, 30), (50000, 40)):
+            print(medir(produtos, lojas))
+    else:
+        from consultaBD import RepositorioPrincipal
+
+        dados = RepositorioPrincipal().buscar_dataframe({"planta": args.planta, "loja": args.loja})
+        with pd.option_context("display.width", 200, "display.max_columns", 20):
+            print(pontuar(dados, args.dias_sem_nf, limite=args.top).to_string(index=False))
@@ -0,0 +1,258 @@
+# poolConexoes.py
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolEsgotadoError(Exception):
+    pass
+
+
+class _ConexaoPool:
+    # Guarda a conexão física junto com os instantes usados pela política de ociosidade
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.criada_em = time.monotonic()
+        self.devolvida_em = self.criada_em
+
+
+class PoolConexoes:
+    def __init__(
+        self,
+        fabrica_conexao,
+        tamanho_minimo: int = 1,
+        tamanho_maximo: int = 8,
+        timeout_espera: float = 30.0,
+        max_ocioso: float = 300.0,
+        intervalo_verificacao: float = 30.0,
+        consulta_verificacao: str = "SELECT 1",
+    ):
+        if tamanho_maximo < 1:
+            raise ValueError("tamanho_maximo deve ser pelo menos 1.")
+
+        self._fabrica_conexao = fabrica_conexao
+        self.tamanho_minimo = max(0, min(tamanho_minimo, tamanho_maximo))
+        self.tamanho_maximo = tamanho_maximo
+        self.timeout_espera = timeout_espera
+        self.max_ocioso = max_ocioso
+        self.intervalo_verificacao = intervalo_verificacao
+        self.consulta_verificacao = consulta_verificacao
+
+        self._livres = deque()
+        self._total = 0  # Conexões abertas (livres + em uso + sendo criadas)
+        self._fechado = False
+        self._condicao = threading.Condition(threading.Lock())
+
+        self._checkouts = 0
+        self._esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_max = 0.0
+        self._criadas = 0
+        self._reconexoes = 0
+        self._descartadas_ociosas = 0
+        self._timeouts = 0
+
+    # --- Criação e descarte de conexões físicas ---
+    def _criar(self) -> _ConexaoPool:
+        conexao = self._fabrica_conexao()
+        with self._condicao:
+            self._criadas += 1
+        return _ConexaoPool(conexao)
+
+    def _fechar_fisica(self, item: _ConexaoPool) -> None:
+        try:
+            item.conexao.close()
+        except Exception as e:
+            logging.warning(f"Pool: erro ao fechar conexão descartada: {e}")
+
+    def _liberar_vaga(self) -> None:
+        with self._condicao:
+            self._total -= 1
+            self._condicao.notify()
+
+    def _conexao_saudavel(self, item: _ConexaoPool) -> bool:
+        try:
+            cursor = item.conexao.cursor()
+            cursor.execute(self.consulta_verificacao)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception as e:
+            logging.warning(f"Pool: conexão falhou na verificação de saúde: {e}")
+            return False
+
+    # --- Aquecimento ---
+    def aquecer(self, em_segundo_plano: bool = False) -> None:
+        if em_segundo_plano:
+            threading.Thread(
+                target=self.aquecer, name="pool-aquecimento", daemon=True
+            ).start()
+            return
+
+        inicio = time.perf_counter()
+        while True:
+            with self._condicao:
+                if self._fechado or self._total >= self.tamanho_minimo:
+                    break
+                self._total += 1
+            try:
+                item = self._criar()
+            except Exception as e:
+                self._liberar_vaga()
+                logging.error(f"Pool: falha ao aquecer conexões: {e}")
+                return
+            with self._condicao:
+                self._livres.append(item)
+                self._condicao.notify()
+
+        logging.info(
+            f"Pool aquecido com {self._total} conexão(ões) em "
+            f"{time.perf_counter() - inicio:.2f}s."
+        )
+
+    # --- Checkout / Checkin ---
+    def _obter(self) -> _ConexaoPool:
+        inicio = time.perf_counter()
+        prazo = time.monotonic() + self.timeout_espera
+        esperou = False
+
+        with self._condicao:
+            while True:
+                if self._fechado:
+                    raise PoolEsgotadoError("O pool de conexões foi encerrado.")
+                if self._livres:
+                    item = self._livres.pop()  # LIFO: reaproveita a conexão mais "quente"
+                    criar = False
+                    break
+                if self._total < self.tamanho_maximo:
+                    self._total += 1
+                    item = None
+                    criar = True
+                    break
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise PoolEsgotadoError(
+                        f"Nenhuma conexão livre após {self.timeout_espera}s "
+                        f"({self.tamanho_maximo} em uso)."
+                    )
+                esperou = True
+                self._condicao.wait(restante)
+
+            espera = time.perf_counter() - inicio
+            self._checkouts += 1
+            if esperou:
+                self._esperas += 1
+            self._tempo_espera_total += espera
+            self._tempo_espera_max = max(self._tempo_espera_max, espera)
+
+        if criar:
+            try:
+                return self._criar()
+            except Exception:
+                self._liberar_vaga()
+                raise
+
+        agora = time.monotonic()
+        ociosa_ha = agora - item.devolvida_em
+        if self.max_ocioso and ociosa_ha > self.max_ocioso:
+            # Conexões paradas por muito tempo costumam ser derrubadas por firewall/servidor
+            self._fechar_fisica(item)
+            with self._condicao:
+                self._descartadas_ociosas += 1
+            return self._recriar()
+
+        if ociosa_ha > self.intervalo_verificacao and not self._conexao_saudavel(item):
+            self._fechar_fisica(item)
+            with self._condicao:
+                self._reconexoes += 1
+            return self._recriar()
+
+        return item
+
+    def _recriar(self) -> _ConexaoPool:
+        # A vaga continua reservada para quem fez o checkout
+        try:
+            return self._criar()
+        except Exception:
+            self._liberar_vaga()
+            raise
+
+    def _devolver(self, item: _ConexaoPool, quebrada: bool) -> None:
+        if quebrada:
+            self._fechar_fisica(item)
+            with self._condicao:
+                self._reconexoes += 1
+            self._liberar_vaga()
+            return
+
+        try:
+            # Não deixa transação aberta para o próximo usuário da conexão
+            item.conexao.rollback()
+        except Exception as e:
+            logging.warning(f"Pool: rollback falhou, descartando conexão: {e}")
+            self._fechar_fisica(item)
+            self._liberar_vaga()
+            return
+
+        item.devolvida_em = time.monotonic()
+        with self._condicao:
+            if self._fechado:
+                fechar = True
+            else:
+                fechar = False
+                self._livres.append(item)
+                self._condicao.notify()
+        if fechar:
+            self._fechar_fisica(item)
+            self._liberar_vaga()
+
+    @contextmanager
+    def conexao(self):
+        item = self._obter()
+        quebrada = False
+        try:
+            yield item.conexao
+        except Exception as e:
+            # Erros de comunicação (SQLSTATE 08xxx) invalidam a conexão física
+            sqlstate = str(e.args[0]) if getattr(e, "args", None) else ""
+            quebrada = sqlstate.startswith("08")
+            raise
+        finally:
+            self._devolver(item, quebrada)
+
+    # --- Estatísticas e encerramento ---
+    def estatisticas(self) -> dict:
+        with self._condicao:
+            em_uso = self._total - len(self._livres)
+            return {
+                "tamanho_maximo": self.tamanho_maximo,
+                "abertas": self._total,
+                "livres": len(self._livres),
+                "em_uso": em_uso,
+                "checkouts": self._checkouts,
+                "checkouts_com_espera": self._esperas,
+                "espera_media_ms": (
+                    1000 * self._tempo_espera_total / self._checkouts
+                    if self._checkouts
+                    else 0.0
+                ),
+                "espera_max_ms": 1000 * self._tempo_espera_max,
+                "timeouts": self._timeouts,
+                "criadas": self._criadas,
+                "reconexoes": self._reconexoes,
+                "descartadas_ociosas": self._descartadas_ociosas,
+            }
+
+    def fechar(self) -> None:
+        with self._condicao:
+            self._fechado = True
+            livres = list(self._livres)
+            self._livres.clear()
+            self._total -= len(livres)
+            self._condicao.notify_all()
+        for item in livres:
+            self._fechar_fisica(item)
+        logging.info("Pool de conexões encerrado.")
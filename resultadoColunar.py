@@ -0,0 +1,213 @@
+# resultadoColunar.py
+# Monta o resultado de buscar_dados em colunas tipadas direto dos lotes do cursor,
+# sem criar um dict por linha (que repete o nome de cada coluna em todas as linhas).
+import math
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow é opcional; só é necessário para formato="arrow"
+    pa = None
+
+PREFIXOS_DATA = ("Primeira NF ", "Última NF ", "Previsão Vendas ")
+PREFIXOS_DECIMAL = ("Preço Venda ", "Qtd Previsão Futura ")
+PREFIXOS_INTEIRO = ("Dias ",)
+COLUNAS_CATEGORICAS = ("Cliente", "Planta", "Nome Reduzido")
+
+
+def tipo_coluna(nome: str) -> str:
+    if nome.startswith(PREFIXOS_DATA):
+        return "data"
+    if nome.startswith(PREFIXOS_DECIMAL):
+        return "decimal"
+    if nome.startswith(PREFIXOS_INTEIRO):
+        return "inteiro"
+    # 'Nome Reduzido {loja}' se repete em todas as linhas: categoria economiza muito
+    if nome in COLUNAS_CATEGORICAS or nome.startswith("Nome Reduzido "):
+        return "categoria"
+    return "texto"
+
+
+# datetime64[D] conta dias desde 1970-01-01; date.toordinal() conta desde 0001-01-01
+_ORDINAL_EPOCA = 719163
+_NAT = np.iinfo("int64").min
+
+
+def _datas(valores) -> np.ndarray:
+    dias = np.fromiter(
+        (_NAT if v is None else v.toordinal() - _ORDINAL_EPOCA for v in valores),
+        dtype="int64",
+        count=len(valores),
+    )
+    return dias.view("datetime64[D]")
+
+
+def _floats(valores) -> np.ndarray:
+    try:
+        return np.array(valores, dtype="float64")  # Caminho rápido: lote sem nulos
+    except TypeError:
+        pass
+    return np.array(
+        [math.nan if v is None else float(v) for v in valores], dtype="float64"
+    )
+
+
+class ConstrutorColunar:
+    def __init__(self, colunas: list):
+        self.colunas = list(colunas)
+        self.tipos = [tipo_coluna(nome) for nome in self.colunas]
+        self._pedacos = [[] for _ in self.colunas]
+        # Colunas categóricas guardam só códigos int32 + dicionário de valores
+        self._categorias = [{} if tipo == "categoria" else None for tipo in self.tipos]
+        self.linhas = 0
+
+    def adicionar(self, lote: list) -> None:
+        if not lote:
+            return
+        self.linhas += len(lote)
+        for indice, valores in enumerate(zip(*lote)):
+            tipo = self.tipos[indice]
+            if tipo == "data":
+                pedaco = _datas(valores)
+            elif tipo in ("decimal", "inteiro"):
+                pedaco = _floats(valores)
+            elif tipo == "categoria":
+                # factorize resolve o lote em C; só os poucos valores distintos passam
+                # pelo dicionário global para manter os códigos estáveis entre lotes
+                codigos, distintos = pd.factorize(np.array(valores, dtype=object))
+                categorias = self._categorias[indice]
+                mapa = np.array(
+                    [categorias.setdefault(v, len(categorias)) for v in distintos],
+                    dtype="int32",
+                )
+                pedaco = np.where(codigos < 0, -1, mapa[codigos] if len(mapa) else -1)
+                pedaco = pedaco.astype("int32")
+            else:
+                pedaco = np.array(valores, dtype=object)
+            self._pedacos[indice].append(pedaco)
+
+    def _coluna(self, indice: int):
+        tipo = self.tipos[indice]
+        pedacos = self._pedacos[indice]
+        if pedacos:
+            valores = np.concatenate(pedacos)
+        else:
+            valores = np.array([], dtype="float64" if tipo in ("decimal", "inteiro") else object)
+
+        if tipo == "data":
+            return pd.Series(valores.astype("datetime64[s]"))
+        if tipo == "decimal":
+            return pd.Series(valores)
+        if tipo == "inteiro":
+            return pd.Series(valores).astype("Int64")
+        if tipo == "categoria":
+            return pd.Series(
+                pd.Categorical.from_codes(
+                    valores.astype("int32") if len(valores) else np.array([], dtype="int32"),
+                    categories=list(self._categorias[indice]),
+                )
+            )
+        return pd.Series(valores, dtype=object)
+
+    def dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {nome: self._coluna(i) for i, nome in enumerate(self.colunas)}
+        )
+
+    def tabela_arrow(self):
+        if pa is None:
+            raise ImportError("pyarrow não está instalado; use formato='pandas'.")
+        return pa.Table.from_pandas(self.dataframe(), preserve_index=False)
+
+
+def montar_resultado(lotes, formato: str = "pandas"):
+    # 'lotes' é o gerador de RepositorioPrincipal.iterar_lotes: (colunas, linhas)
+    construtor = None
+    for colunas, lote in lotes:
+        if construtor is None:
+            construtor = ConstrutorColunar(colunas)
+        construtor.adicionar(lote)
+
+    if construtor is None:
+        return pa.table({}) if formato == "arrow" and pa is not None else pd.DataFrame()
+    if formato == "arrow":
+        return construtor.tabela_arrow()
+    return construtor.dataframe()
+
+
+# --- Medição: lista de dicts + DataFrame (caminho atual) vs. construção colunar ---
+def _linhas_sinteticas(quantidade: int, lojas: int) -> tuple:
+    import datetime
+    from decimal import Decimal
+
+    colunas = ["Cliente", "PN Voss", "PN Cliente", "Planta", "Nome Reduzido"]
+    for n in range(lojas):
+        loja = f"{n + 1:02d}"
+        colunas += [
+            f"Nome Reduzido {loja}",
+            f"Primeira NF {loja}",
+            f"Última NF {loja}",
+            f"Previsão Vendas {loja}",
+            f"Qtd Previsão Futura {loja}",
+            f"Dias {loja}",
+            f"Preço Venda {loja}",
+        ]
+
+    hoje = datetime.date.today()
+    linhas = []
+    for i in range(quantidade):
+        linha = ["MONTADORA 1 LTDA", f"VS{i:09d}", f"{i % 97} {i:06d}", "100000", "PLANTA 1"]
+        for n in range(lojas):
+            tem_nf = (i + n) % 3 != 0
+            linha += [
+                f"PLANTA 1-{n + 1:02d}",
+                hoje - datetime.timedelta(days=900 + i % 400) if tem_nf else None,
+                hoje - datetime.timedelta(days=i % 400) if tem_nf else None,
+                hoje + datetime.timedelta(days=i % 200) if i % 2 else None,
+                Decimal(i % 1000),
+                i % 400 if tem_nf else None,
+                Decimal(f"{(i % 5000) / 10:.2f}"),
+            ]
+        linhas.append(tuple(linha))
+    return colunas, linhas
+
+
+def medir(quantidade: int = 5000, lojas: int = 10, tamanho_lote: int = 1000) -> dict:
+    colunas, linhas = _linhas_sinteticas(quantidade, lojas)
+    lotes = [linhas[i : i + tamanho_lote] for i in range(0, len(linhas), tamanho_lote)]
+
+    def caminho_atual():
+        registros = [dict(zip(colunas, row)) for lote in lotes for row in lote]
+        return pd.DataFrame(registros)
+
+    def caminho_colunar():
+        return montar_resultado((colunas, lote) for lote in lotes)
+
+    resultados = {}
+    for nome, funcao in (("dicts", caminho_atual), ("colunar", caminho_colunar)):
+        # Tempo e memória em execuções separadas: o tracemalloc distorce o tempo
+        inicio = time.perf_counter()
+        df = funcao()
+        duracao = time.perf_counter() - inicio
+        del df
+
+        tracemalloc.start()
+        df = funcao()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados[nome] = {
+            "segundos": round(duracao, 4),
+            "pico_mb": round(pico / 1024 / 1024, 2),
+            "dataframe_mb": round(float(df.memory_usage(deep=True).sum()) / 1024 / 1024, 2),
+        }
+        del df
+    return {"linhas": quantidade, "lojas": lojas, "colunas": len(colunas), **resultados}
+
+
+if __name__ == "__main__":
+    for quantidade, lojas in ((5000, 5), (5000, 20), (50000, 10)):
+        print(medir(quantidade, lojas))
@@ -20,4 +20,106 @@ FOLDER_LOG_PATH_LOCAL = os.getenv("FOLDER_PATH_LOCAL", "./logs/AfterMarket_Base.
 SMTP_SERVER = os.getenv("SMTP_SERVER")
 SMTP_PORT = os.getenv("SMTP_PORT")
 SMTP_USER = os.getenv("SMTP_USER")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
\ No newline at end of file
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+
+# --- Pool de Conexões do Banco ---
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_MAX_OCIOSO = float(os.getenv("DB_POOL_MAX_OCIOSO", "300"))
+DB_POOL_VERIFICACAO = float(os.getenv("DB_POOL_VERIFICACAO", "30"))
+
+# --- Cache de Resultados (compartilhado entre sessões do processo) ---
+CACHE_TTL_SEGUNDOS = float(os.getenv("CACHE_TTL_SEGUNDOS", "600"))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", "256"))
+CACHE_LOJAS_TTL_SEGUNDOS = float(os.getenv("CACHE_LOJAS_TTL_SEGUNDOS", "86400"))
+
+# --- Snapshot local do Protheus (motor "snapshot" de buscar_dados) ---
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "./dados/snapshot_protheus.db")
+
+# --- Análise em lote (analiseLote.py) ---
+LOTE_CONCORRENCIA = int(os.getenv("LOTE_CONCORRENCIA", "4"))
+LOTE_SAIDA_PATH = os.getenv("LOTE_SAIDA_PATH", "./relatorios_lote/")
+
+# --- Execução de consultas em segundo plano (execucaoConsultas.py) ---
+CONSULTAS_WORKERS = int(os.getenv("CONSULTAS_WORKERS", "8"))
+
+# --- Diário de auditoria (diarioAuditoria.py) ---
+DIARIO_PATH = os.getenv("DIARIO_PATH", "./dados/diario_aftermarket.db")
+# Planilha cuja aba "Base - AfterMarket" a compactação reconstrói; por padrão a dos gestores,
+# a mesma que a tela atualizava (as outras abas da pasta são mantidas)
+DIARIO_EXCEL_PATH = os.getenv("DIARIO_EXCEL_PATH", FOLDER_LOG_PATH_LOCAL)
+
+# --- Escritor de auditoria em segundo plano (escritorAuditoria.py) ---
+FILA_AUDITORIA_PATH = os.getenv("FILA_AUDITORIA_PATH", "./dados/fila_auditoria.db")
+AUDITORIA_INTERVALO_FLUSH = float(os.getenv("AUDITORIA_INTERVALO_FLUSH", "5"))
+AUDITORIA_BACKOFF_MAX = float(os.getenv("AUDITORIA_BACKOFF_MAX", "300"))
+# Segundos entre compactações da planilha do diário (só se houver seleções novas); 0 = só sob demanda
+AUDITORIA_INTERVALO_COMPACTACAO = float(os.getenv("AUDITORIA_INTERVALO_COMPACTACAO", "300"))
+
+# --- Fila de e-mails (filaEmail.py) ---
+EMAIL_TAMANHO_LOTE = int(os.getenv("EMAIL_TAMANHO_LOTE", "20"))
+EMAIL_MAX_TENTATIVAS = int(os.getenv("EMAIL_MAX_TENTATIVAS", "5"))
+EMAIL_CONEXAO_OCIOSA = float(os.getenv("EMAIL_CONEXAO_OCIOSA", "60"))
+EMAIL_COMPRIMIR_ACIMA_MB = float(os.getenv("EMAIL_COMPRIMIR_ACIMA_MB", "5"))
+
+# --- Métricas (metricas.py) ---
+# Porta do endpoint /metrics (0 = desativado) e/ou arquivo .prom para o textfile collector
+METRICAS_PORTA = int(os.getenv("METRICAS_PORTA", "0"))
+METRICAS_ARQUIVO = os.getenv("METRICAS_ARQUIVO", "")
+METRICAS_INTERVALO_ARQUIVO = float(os.getenv("METRICAS_INTERVALO_ARQUIVO", "15"))
+# Requisições acima deste tempo vão para o log de lentas com fases e forma da SQL
+METRICAS_LIMITE_LENTO_MS = float(os.getenv("METRICAS_LIMITE_LENTO_MS", "2000"))
+METRICAS_LOG_LENTO_PATH = os.getenv("METRICAS_LOG_LENTO_PATH", "./logs/consultas_lentas.jsonl")
+
+# --- Inicialização do processo (inicializacao.py) ---
+# Aquecimento em segundo plano: módulos pesados, pool de conexões e lojas no cache
+AQUECIMENTO_ATIVO = os.getenv("AQUECIMENTO_ATIVO", "1") == "1"
+# Plantas separadas por vírgula; vazio = lojas de todas as plantas
+AQUECIMENTO_PLANTAS = [p.strip() for p in os.getenv("AQUECIMENTO_PLANTAS", "").split(",") if p.strip()]
+
+# --- Lançador multi-worker (lancador.py) ---
+# Workers do Streamlit atrás de um proxy local na porta do IIS; 1 = processo único (wsgi.py)
+LANCADOR_WORKERS = int(os.getenv("LANCADOR_WORKERS", "1"))
+LANCADOR_PORTA = int(os.getenv("LANCADOR_PORTA", "8501"))
+LANCADOR_PORTA_WORKERS = int(os.getenv("LANCADOR_PORTA_WORKERS", "8511"))
+LANCADOR_INTERVALO_SAUDE = float(os.getenv("LANCADOR_INTERVALO_SAUDE", "5"))
+LANCADOR_FALHAS_REINICIO = int(os.getenv("LANCADOR_FALHAS_REINICIO", "3"))
+LANCADOR_TEMPO_PARTIDA = float(os.getenv("LANCADOR_TEMPO_PARTIDA", "60"))
+
+# --- Pontuação de oportunidades (pontuacaoOportunidades.py) ---
+# Loja sem NF há mais que isso (e sem previsão futura) é lacuna
+OPORTUNIDADE_DIAS_SEM_NF = int(os.getenv("OPORTUNIDADE_DIAS_SEM_NF", "365"))
+
+# --- Catálogo de busca (indiceTrigramas.py) ---
+# Índice de trigramas de PN Voss/PN Cliente/clientes em memória; 0 = filtros só via LIKE no banco
+CATALOGO_ATIVO = os.getenv("CATALOGO_ATIVO", "1") == "1"
+# Atualização incremental (R_E_C_N_O_ novos) e reconstrução completa (alterações e exclusões)
+CATALOGO_INTERVALO_SEGUNDOS = float(os.getenv("CATALOGO_INTERVALO_SEGUNDOS", "300"))
+CATALOGO_RECONSTRUCAO_SEGUNDOS = float(os.getenv("CATALOGO_RECONSTRUCAO_SEGUNDOS", "600"))
+# Idade máxima da última reconstrução para o índice filtrar consultas; acima disso, só o LIKE
+CATALOGO_IDADE_MAXIMA_SEGUNDOS = float(os.getenv("CATALOGO_IDADE_MAXIMA_SEGUNDOS", "900"))
+
+# --- Armazém de resultados (armazemResultados.py) ---
+# Resultados compartilhados pelas sessões do processo, uma cópia por conjunto distinto
+ARMAZEM_MAX_MB = float(os.getenv("ARMAZEM_MAX_MB", "512"))
+ARMAZEM_TTL_SEGUNDOS = float(os.getenv("ARMAZEM_TTL_SEGUNDOS", "600"))
+
+# --- Agendador de consultas (agendadorConsultas.py) ---
+# Consultas pesadas ao ERP ao mesmo tempo por processo; as demais esperam em fila (segundos)
+AGENDADOR_MAX_SIMULTANEAS = int(os.getenv("AGENDADOR_MAX_SIMULTANEAS", "4"))
+AGENDADOR_TIMEOUT_FILA = float(os.getenv("AGENDADOR_TIMEOUT_FILA", "120"))
+
+# --- Motor planta (motorLocal.PlantaLocal) ---
+# Fontes de cada planta inteira em memória; troca de loja principal e filtros não volta ao ERP
+PLANTA_TTL_SEGUNDOS = float(os.getenv("PLANTA_TTL_SEGUNDOS", "600"))
+PLANTA_CACHE_MAX_MB = float(os.getenv("PLANTA_CACHE_MAX_MB", "512"))
+# Motor usado pela tela (app.py): planta, sql, local ou snapshot
+CONSULTA_MOTOR = os.getenv("CONSULTA_MOTOR", "planta")
+
+# --- Perfil sob demanda (perfilRequisicao.py) ---
+# ?perfil=1 na URL (ou PERFIL_ATIVO=1 para todo rerun) perfila a tela; só para os usuários listados
+PERFIL_ATIVO = os.getenv("PERFIL_ATIVO", "0") == "1"
+PERFIL_ADMINS = [u.strip().lower() for u in os.getenv("PERFIL_ADMINS", "").split(",") if u.strip()]
+PERFIL_PATH = os.getenv("PERFIL_PATH", "./logs/perfis/")
+PERFIL_INTERVALO_AMOSTRA_MS = float(os.getenv("PERFIL_INTERVALO_AMOSTRA_MS", "5"))
@@ -0,0 +1,141 @@
+# smtpSimulado.py
+# Servidor SMTP mínimo para desenvolvimento e testes da fila de e-mails (filaEmail.py),
+# no lugar do relay interno. Guarda as mensagens recebidas em memória (e, opcionalmente,
+# em arquivos .eml) e pode recusar temporariamente as primeiras entregas para exercitar
+# as novas tentativas.
+#
+# Exemplo:
+#   python smtpSimulado.py --porta 8025 --pasta ./emails_recebidos
+#   (no .env: SMTP_SERVER=127.0.0.1 e SMTP_PORT=8025)
+import argparse
+import email
+import email.policy
+import logging
+import os
+import socketserver
+import threading
+import time
+
+
+class _SessaoSMTP(socketserver.StreamRequestHandler):
+    def _responder(self, linha: str) -> None:
+        self.wfile.write(f"{linha}\r\n".encode("ascii"))
+
+    def handle(self) -> None:
+        servidor = self.server
+        with servidor.lock:
+            servidor.conexoes += 1
+        self._responder("220 smtpSimulado pronto")
+        remetente, destinatarios = None, []
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode("utf-8", "replace").strip()
+            verbo = comando.split(" ", 1)[0].upper()
+
+            if verbo in ("EHLO", "HELO"):
+                self._responder("250-smtpSimulado" if verbo == "EHLO" else "250 smtpSimulado")
+                if verbo == "EHLO":
+                    self._responder("250-8BITMIME")
+                    self._responder("250 SIZE 52428800")
+            elif verbo == "MAIL":
+                remetente, destinatarios = comando[10:].strip(), []
+                self._responder("250 OK")
+            elif verbo == "RCPT":
+                destinatarios.append(comando[8:].strip())
+                self._responder("250 OK")
+            elif verbo == "DATA":
+                with servidor.lock:
+                    recusar = servidor.falhas_restantes > 0
+                    if recusar:
+                        servidor.falhas_restantes -= 1
+                if recusar:
+                    self._responder("451 Falha temporaria simulada")
+                    continue
+                self._responder("354 Termine com <CRLF>.<CRLF>")
+                partes = []
+                while True:
+                    linha_dados = self.rfile.readline()
+                    if not linha_dados or linha_dados in (b".\r\n", b".\n"):
+                        break
+                    if linha_dados.startswith(b".."):
+                        linha_dados = linha_dados[1:]
+                    partes.append(linha_dados)
+                if servidor.atraso:
+                    time.sleep(servidor.atraso)
+                servidor.guardar(remetente, destinatarios, b"".join(partes))
+                self._responder("250 OK: mensagem aceita")
+            elif verbo == "RSET":
+                remetente, destinatarios = None, []
+                self._responder("250 OK")
+            elif verbo == "NOOP":
+                self._responder("250 OK")
+            elif verbo == "QUIT":
+                self._responder("221 Ate logo")
+                return
+            else:
+                self._responder("502 Comando nao implementado")
+
+
+class ServidorSMTPSimulado(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        porta: int = 0,
+        pasta: str = None,
+        falhas_iniciais: int = 0,
+        atraso: float = 0.0,
+    ):
+        # porta=0: o sistema escolhe uma porta livre (veja self.porta)
+        super().__init__((host, porta), _SessaoSMTP)
+        self.pasta = pasta
+        self.falhas_restantes = falhas_iniciais
+        self.atraso = atraso
+        self.lock = threading.Lock()
+        self.mensagens = []
+        self.conexoes = 0
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+    @property
+    def porta(self) -> int:
+        return self.server_address[1]
+
+    def guardar(self, remetente: str, destinatarios: list, conteudo: bytes) -> None:
+        mensagem = email.message_from_bytes(conteudo, policy=email.policy.default)
+        with self.lock:
+            self.mensagens.append(
+                {"remetente": remetente, "destinatarios": destinatarios, "mensagem": mensagem}
+            )
+            numero = len(self.mensagens)
+        if self.pasta:
+            with open(os.path.join(self.pasta, f"mensagem_{numero:05d}.eml"), "wb") as arquivo:
+                arquivo.write(conteudo)
+        logging.info(f"smtpSimulado: mensagem {numero} de {remetente} para {destinatarios}")
+
+    def iniciar_em_segundo_plano(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="smtp-simulado", daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Servidor SMTP simulado para testes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8025)
+    parser.add_argument("--pasta", help="Grava cada mensagem recebida como .eml.")
+    parser.add_argument("--falhas-iniciais", type=int, default=0,
+                        help="Responde 451 às primeiras N entregas.")
+    args = parser.parse_args()
+
+    with ServidorSMTPSimulado(args.host, args.porta, args.pasta, args.falhas_iniciais) as servidor:
+        print(f"smtpSimulado ouvindo em {args.host}:{servidor.porta} (Ctrl+C para sair)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
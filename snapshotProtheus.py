@@ -0,0 +1,284 @@
+# snapshotProtheus.py
+# Base analítica local (SQLite) com os agregados do Protheus usados por buscar_dados.
+# SD2010 e SC4010 são lidas de forma incremental a partir do último R_E_C_N_O_ visto;
+# SA1010/SA7010 (cadastros, bem menores) são recarregadas por completo a cada atualização.
+import argparse
+import datetime
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS controle (
+        tabela TEXT PRIMARY KEY, ultimo_recno INTEGER NOT NULL, atualizado_em TEXT
+    );
+    CREATE TABLE IF NOT EXISTS clientes (
+        planta TEXT, loja TEXT, nome TEXT, nreduz TEXT
+    );
+    CREATE INDEX IF NOT EXISTS ix_clientes ON clientes (planta, loja);
+    CREATE TABLE IF NOT EXISTS produtos (
+        planta TEXT, loja TEXT, produto TEXT, codcli TEXT, preco REAL
+    );
+    CREATE INDEX IF NOT EXISTS ix_produtos ON produtos (planta, loja);
+    CREATE TABLE IF NOT EXISTS nf_agregado (
+        planta TEXT, loja TEXT, produto TEXT, primeira_nf TEXT, ultima_nf TEXT,
+        PRIMARY KEY (planta, loja, produto)
+    );
+    CREATE TABLE IF NOT EXISTS previsoes (
+        recno INTEGER PRIMARY KEY, planta TEXT, loja TEXT, produto TEXT, data TEXT, quant REAL
+    );
+    CREATE INDEX IF NOT EXISTS ix_previsoes ON previsoes (planta);
+"""
+
+SQL_ERP_MAX_RECNO = "SELECT ISNULL(MAX(R_E_C_N_O_), 0) FROM [dbo].[{tabela}]"
+
+SQL_ERP_CLIENTES = """
+    SELECT TRIM(A1_COD), TRIM(A1_LOJA), TRIM(A1_NOME), TRIM(A1_NREDUZ)
+    FROM [dbo].[SA1010]
+    WHERE D_E_L_E_T_ <> '*'
+"""
+
+SQL_ERP_PRODUTOS = """
+    SELECT TRIM(A7_CLIENTE), TRIM(A7_LOJA), A7_PRODUTO, A7_CODCLI, A7_XPRCLIQ
+    FROM [dbo].[SA7010]
+    WHERE D_E_L_E_T_ <> '*'
+"""
+
+SQL_ERP_NF = """
+    SELECT TRIM(D2_CLIENTE), TRIM(D2_LOJA), TRIM(D2_COD), MIN(D2_EMISSAO), MAX(D2_EMISSAO)
+    FROM [dbo].[SD2010]
+    WHERE D_E_L_E_T_ <> '*' AND R_E_C_N_O_ > ? AND R_E_C_N_O_ <= ?
+    GROUP BY TRIM(D2_CLIENTE), TRIM(D2_LOJA), TRIM(D2_COD)
+"""
+
+SQL_ERP_PREVISOES = """
+    SELECT R_E_C_N_O_, TRIM(C4_CLIENTE), TRIM(C4_LOJA), TRIM(C4_PRODUTO), C4_DATA, C4_QUANT
+    FROM [dbo].[SC4010]
+    WHERE D_E_L_E_T_ <> '*' AND C4_DATA <> '' AND R_E_C_N_O_ > ? AND R_E_C_N_O_ <= ?
+"""
+
+
+def _para_data(valor):
+    # Datas do Protheus vêm como 'AAAAMMDD'
+    if not valor or not str(valor).strip():
+        return None
+    texto = str(valor).strip()
+    try:
+        return datetime.date(int(texto[:4]), int(texto[4:6]), int(texto[6:8]))
+    except ValueError:
+        return None
+
+
+class SnapshotProtheus:
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        diretorio = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(diretorio, exist_ok=True)
+        with self._abrir() as conexao:
+            conexao.executescript(ESQUEMA)
+
+    @contextmanager
+    def _abrir(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            conexao.execute("PRAGMA journal_mode=WAL")  # Leitores não bloqueiam a atualização
+            with conexao:  # commit ao final (rollback em caso de erro)
+                yield conexao
+        finally:
+            conexao.close()
+
+    # --- Atualização a partir do ERP ---
+    def _marca_dagua(self, conexao, tabela: str) -> int:
+        linha = conexao.execute(
+            "SELECT ultimo_recno FROM controle WHERE tabela = ?", (tabela,)
+        ).fetchone()
+        return linha[0] if linha else 0
+
+    def _registrar_marca(self, conexao, tabela: str, recno: int) -> None:
+        conexao.execute(
+            "INSERT INTO controle (tabela, ultimo_recno, atualizado_em) VALUES (?, ?, ?) "
+            "ON CONFLICT(tabela) DO UPDATE SET ultimo_recno = excluded.ultimo_recno, "
+            "atualizado_em = excluded.atualizado_em",
+            (tabela, recno, datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+
+    def atualizar(self, conectar_erp, completo: bool = False) -> dict:
+        # conectar_erp: fábrica de context manager de conexão (ex.: RepositorioPrincipal._conectar).
+        # O modo incremental não enxerga exclusões/alterações de linhas antigas;
+        # agende uma atualização completa periódica (ex.: madrugada).
+        inicio = time.perf_counter()
+        resumo = {"completo": completo}
+
+        with conectar_erp() as erp, self._abrir() as local:
+            cursor = erp.cursor()
+
+            if completo:
+                local.execute("DELETE FROM nf_agregado")
+                local.execute("DELETE FROM previsoes")
+                local.execute("DELETE FROM controle")
+
+            cursor.execute(SQL_ERP_CLIENTES)
+            clientes = [tuple(row) for row in cursor.fetchall()]
+            local.execute("DELETE FROM clientes")
+            local.executemany("INSERT INTO clientes VALUES (?, ?, ?, ?)", clientes)
+            resumo["clientes"] = len(clientes)
+
+            cursor.execute(SQL_ERP_PRODUTOS)
+            produtos = [
+                (row[0], row[1], row[2], row[3], None if row[4] is None else float(row[4]))
+                for row in cursor.fetchall()
+            ]
+            local.execute("DELETE FROM produtos")
+            local.executemany("INSERT INTO produtos VALUES (?, ?, ?, ?, ?)", produtos)
+            resumo["produtos"] = len(produtos)
+
+            # SD2010: só as NFs novas desde a última marca; MIN/MAX são mesclados no upsert
+            desde = self._marca_dagua(local, "SD2010")
+            cursor.execute(SQL_ERP_MAX_RECNO.format(tabela="SD2010"))
+            ate = cursor.fetchone()[0] or 0
+            cursor.execute(SQL_ERP_NF, [desde, ate])
+            nfs = [tuple(row) for row in cursor.fetchall()]
+            local.executemany(
+                "INSERT INTO nf_agregado VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(planta, loja, produto) DO UPDATE SET "
+                "primeira_nf = MIN(primeira_nf, excluded.primeira_nf), "
+                "ultima_nf = MAX(ultima_nf, excluded.ultima_nf)",
+                nfs,
+            )
+            self._registrar_marca(local, "SD2010", max(ate, desde))
+            resumo["nf_agregados"] = len(nfs)
+
+            desde = self._marca_dagua(local, "SC4010")
+            cursor.execute(SQL_ERP_MAX_RECNO.format(tabela="SC4010"))
+            ate = cursor.fetchone()[0] or 0
+            cursor.execute(SQL_ERP_PREVISOES, [desde, ate])
+            previsoes = [
+                (row[0], row[1], row[2], row[3], str(row[4]).strip(), float(row[5] or 0))
+                for row in cursor.fetchall()
+            ]
+            local.executemany(
+                "INSERT OR REPLACE INTO previsoes VALUES (?, ?, ?, ?, ?, ?)", previsoes
+            )
+            self._registrar_marca(local, "SC4010", max(ate, desde))
+            resumo["previsoes"] = len(previsoes)
+
+        resumo["segundos"] = round(time.perf_counter() - inicio, 2)
+        logging.info(f"Snapshot do Protheus atualizado em {self.caminho}: {resumo}")
+        return resumo
+
+    def atualizado_em(self) -> str:
+        with self._abrir() as conexao:
+            linha = conexao.execute("SELECT MIN(atualizado_em) FROM controle").fetchone()
+        return linha[0] if linha else None
+
+    # --- Leitura: mesmas fontes estreitas do motor local ---
+    def _frame(self, conexao, sql: str, parametros: list) -> pd.DataFrame:
+        cursor = conexao.execute(sql, parametros)
+        columns = [column[0] for column in cursor.description]
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+    def fontes(self, filtros: dict) -> dict:
+        planta = str(filtros.get("planta")).strip()
+        loja_principal = str(filtros.get("loja")).strip()
+        hoje = datetime.date.today()
+
+        condicoes = []
+        parametros_produtos = [planta, loja_principal]
+        if filtros.get("pn_voss"):
+            condicoes.append("P.produto LIKE ?")
+            parametros_produtos.append(f"%{filtros['pn_voss']}%")
+        if filtros.get("pn_cliente"):
+            condicoes.append("REPLACE(TRIM(P.codcli), ' ', '') LIKE ?")
+            parametros_produtos.append(f"%{filtros['pn_cliente']}%")
+        if filtros.get("cliente"):
+            condicoes.append("(C.nome LIKE ? OR C.nreduz LIKE ?)")
+            parametros_produtos += [f"%{filtros['cliente']}%"] * 2
+        where_extra = "".join(f" AND {condicao}" for condicao in condicoes)
+
+        with self._abrir() as conexao:
+            lojas = [
+                row[0]
+                for row in conexao.execute(
+                    "SELECT DISTINCT loja FROM clientes WHERE planta = ? ORDER BY 1", (planta,)
+                )
+            ]
+            if loja_principal in lojas:
+                lojas.remove(loja_principal)
+                lojas.insert(0, loja_principal)
+
+            nomes_lojas = self._frame(
+                conexao,
+                "SELECT loja AS Loja, MAX(nreduz) AS NomeReduzidoClienteLoja "
+                "FROM clientes WHERE planta = ? GROUP BY loja",
+                [planta],
+            )
+            produtos = self._frame(
+                conexao,
+                f"""
+                SELECT DISTINCT
+                    C.planta AS Planta, C.nome AS Cliente,
+                    C.nreduz AS [Nome Reduzido Cliente Mestre],
+                    REPLACE(TRIM(P.codcli), ' ', '') AS [PN Cliente],
+                    P.produto AS [PN Voss]
+                FROM clientes AS C
+                INNER JOIN produtos AS P ON P.planta = C.planta AND P.loja = C.loja
+                WHERE C.planta = ? AND C.loja = ? {where_extra}
+                """,
+                parametros_produtos,
+            )
+            datas_nf = self._frame(
+                conexao,
+                "SELECT produto AS D2_COD, loja AS D2_LOJA, ultima_nf AS DataUltimaNF, "
+                "primeira_nf AS DataPrimeiraNF FROM nf_agregado WHERE planta = ?",
+                [planta],
+            )
+            previsoes = self._frame(
+                conexao,
+                "SELECT produto AS C4_PRODUTO, loja AS C4_LOJA, "
+                "SUM(CASE WHEN data >= ? THEN quant ELSE 0 END) AS QuantidadePrevisaoFutura, "
+                "MAX(data) AS DataPrevisao "
+                "FROM previsoes WHERE planta = ? GROUP BY produto, loja",
+                [hoje.strftime("%Y%m%d"), planta],
+            )
+            precos = self._frame(
+                conexao,
+                "SELECT produto AS A7_PRODUTO, loja AS A7_LOJA, "
+                "MAX(ROUND(preco, 2)) AS PrecoVenda "
+                "FROM produtos WHERE planta = ? GROUP BY produto, loja",
+                [planta],
+            )
+
+        # Datas 'AAAAMMDD' -> date e dias desde a última NF, como no DATEDIFF do SQL Server
+        for coluna in ("DataUltimaNF", "DataPrimeiraNF"):
+            datas_nf[coluna] = [_para_data(v) for v in datas_nf[coluna]]
+        datas_nf["DiasDesdeUltimaNF"] = [
+            None if data is None else (hoje - data).days for data in datas_nf["DataUltimaNF"]
+        ]
+        previsoes["DataPrevisao"] = [_para_data(v) for v in previsoes["DataPrevisao"]]
+
+        return {
+            "lojas": lojas,
+            "nomes_lojas": nomes_lojas,
+            "produtos": produtos,
+            "datas_nf": datas_nf,
+            "previsoes": previsoes,
+            "precos": precos,
+        }
+
+
+if __name__ == "__main__":
+    # Uso agendado (cron/Agendador de Tarefas): python snapshotProtheus.py [--completo]
+    from consultaBD import RepositorioPrincipal
+    from settings import SNAPSHOT_PATH
+
+    parser = argparse.ArgumentParser(description="Atualiza o snapshot local do Protheus.")
+    parser.add_argument("--completo", action="store_true", help="Recarrega tudo do zero.")
+    parser.add_argument("--caminho", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    repositorio = RepositorioPrincipal()
+    print(SnapshotProtheus(args.caminho).atualizar(repositorio._conectar, args.completo))
@@ -0,0 +1,426 @@
+# testeCarga.py
+# Teste de carga com N sessões simultâneas contra a base simulada do Protheus (bancoSimulado.py),
+# o SMTP simulado (smtpSimulado.py) e uma pasta temporária no lugar do compartilhamento de rede.
+# Cada sessão é uma thread do mesmo processo, como as sessões do Streamlit, e repete o fluxo da
+# tela com uma pausa de "leitura" entre os passos:
+#   escolher                  -> listar_plantas / listar_lojas e sorteio de planta e loja
+#   buscar_dados              -> consulta no executor (buscar_resultado) e visão do armazém
+#   selecionar                -> sorteio de linhas do resultado
+#   enviar_para_excel         -> montar_registros_selecao + fila do escritor de auditoria
+#   enviar_email_notificacao  -> anexos + fila de e-mails
+# As sessões sobem em degraus (--sessoes 1 2 4 8 16); cada degrau roda --duracao segundos, com
+# os caches zerados no início. Por degrau: vazão (fluxos/s), p50/p95/p99 de cada passo e do fluxo
+# inteiro, entrega dos e-mails pelo SMTP e a fila do escritor. O ponto de saturação é o primeiro
+# degrau em que dobrar as sessões não traz ganho de vazão (--ganho-minimo) ou em que o p95 do
+# fluxo passa de --limite-p95-ms; a capacidade é o degrau anterior.
+#
+# Exemplos:
+#   python testeCarga.py
+#   python testeCarga.py --escala 4:8:500:100000 --sessoes 1 2 4 8 16 32 --duracao 60 --motor sql
+#   python testeCarga.py --base ./dados/protheus_simulado.db --latencia-conexao 0.05 --limite-p95-ms 5000
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+
+import bancoSimulado
+from smtpSimulado import ServidorSMTPSimulado
+
+PASSOS = ("escolher", "buscar_dados", "selecionar", "enviar_para_excel", "enviar_email_notificacao")
+ESCALA_PADRAO = "3:5:300:50000"  # plantas:lojas_por_planta:produtos_por_planta:linhas_nf
+ERROS_GUARDADOS = 5  # Mensagens de erro de exemplo por degrau
+
+
+def preparar_ambiente(pasta: str, porta_smtp: int) -> None:
+    # Antes de importar settings: o escritor de auditoria e a fila de e-mails são criados a
+    # partir dele e devem apontar para a pasta temporária e para o SMTP simulado
+    compartilhamento = os.path.join(pasta, "compartilhamento")
+    os.makedirs(compartilhamento, exist_ok=True)
+    os.environ.update(
+        {
+            "FOLDER_PATH": compartilhamento + os.sep,
+            "FOLDER_PATH_LOCAL": os.path.join(compartilhamento, "AfterMarket_Base.xlsx"),
+            "DIARIO_PATH": os.path.join(pasta, "diario_aftermarket.db"),
+            "FILA_AUDITORIA_PATH": os.path.join(pasta, "fila_auditoria.db"),
+            "METRICAS_LOG_LENTO_PATH": os.path.join(pasta, "consultas_lentas.jsonl"),
+            "SMTP_SERVER": "127.0.0.1",
+            "SMTP_PORT": str(porta_smtp),
+            "SMTP_USER": "aftermarket.carga@example.com",
+            "SMTP_PASSWORD": "",
+        }
+    )
+
+
+class _Coleta:
+    # Tempos e erros de um degrau, compartilhados pelas threads das sessões
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tempos = {passo: [] for passo in PASSOS + ("fluxo",)}
+        self.erros = {passo: 0 for passo in PASSOS}
+        self.exemplos_erro = []
+        self.envios = []  # (id_envio, momento em que foi enfileirado)
+        self.linhas = 0
+
+    @contextlib.contextmanager
+    def medir(self, passo: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self.erros[passo] += 1
+                if len(self.exemplos_erro) < ERROS_GUARDADOS:
+                    self.exemplos_erro.append(f"{passo}: {type(e).__name__}: {e}")
+            raise
+        duracao = time.perf_counter() - inicio
+        with self._lock:
+            self.tempos[passo].append(duracao)
+
+    def registrar(self, passo: str, segundos: float) -> None:
+        with self._lock:
+            self.tempos[passo].append(segundos)
+
+    def registrar_envio(self, id_envio: str, linhas: int) -> None:
+        with self._lock:
+            self.envios.append((id_envio, time.time()))
+            self.linhas += linhas
+
+
+class ContextoCarga:
+    # O que as sessões compartilham: o repositório sobre a base simulada e os parâmetros do fluxo
+    def __init__(self, repositorio, motor: str, plantas: list, max_selecao: int, pausa: float):
+        self.repositorio = repositorio
+        self.motor = motor
+        self.plantas = plantas
+        self.max_selecao = max_selecao
+        self.pausa = pausa
+
+
+def executar_fluxo(contexto: ContextoCarga, usuario: str, aleatorio: random.Random,
+                   coleta: _Coleta, parar: threading.Event) -> None:
+    # Um ciclo da tela; exceção em um passo interrompe o ciclo (como o st.error na tela)
+    from armazemResultados import armazem
+    from diarioAuditoria import montar_registros_selecao
+    from escritorAuditoria import obter_escritor
+    from execucaoConsultas import submeter_consulta
+    from filaEmail import montar_notificacao, obter_despachante
+    from settings import SMTP_USER
+
+    def pausar():
+        if contexto.pausa:
+            parar.wait(aleatorio.uniform(0.5, 1.5) * contexto.pausa)
+
+    repositorio = contexto.repositorio
+    inicio = time.perf_counter()
+    pausado = 0.0
+
+    with coleta.medir("escolher"):
+        planta = aleatorio.choice(contexto.plantas or repositorio.listar_plantas())
+        loja = aleatorio.choice(repositorio.listar_lojas(planta))
+    filtros = {"planta": planta, "loja": loja}
+
+    marca = time.perf_counter()
+    pausar()
+    pausado += time.perf_counter() - marca
+
+    with coleta.medir("buscar_dados"):
+        df = None
+        while df is None:
+            # Conjunto despejado do armazém entre a consulta e a visão: consulta de novo
+            consulta = submeter_consulta(repositorio.buscar_resultado, filtros, motor=contexto.motor)
+            df = armazem.visao(consulta.resultado())
+    if df.empty:
+        return
+
+    marca = time.perf_counter()
+    pausar()
+    pausado += time.perf_counter() - marca
+
+    with coleta.medir("selecionar"):
+        quantidade = aleatorio.randint(1, min(len(df), contexto.max_selecao))
+        df_selecao = df.iloc[sorted(aleatorio.sample(range(len(df)), quantidade))]
+
+    with coleta.medir("enviar_para_excel"):
+        registros = montar_registros_selecao(df_selecao, loja)
+        obter_escritor().enfileirar_selecao(registros, usuario=usuario)
+
+    marca = time.perf_counter()
+    pausar()
+    pausado += time.perf_counter() - marca
+
+    with coleta.medir("enviar_email_notificacao"):
+        msg = montar_notificacao(SMTP_USER, f"{usuario}.gestor@example.com", usuario, df, df_selecao)
+        id_envio = obter_despachante().enfileirar(msg)
+    coleta.registrar_envio(id_envio, len(df))
+
+    # Fluxo = tempo de resposta do sistema, sem as pausas de leitura
+    coleta.registrar("fluxo", time.perf_counter() - inicio - pausado)
+
+
+def _executar_sessao(contexto: ContextoCarga, usuario: str, semente: int,
+                     coleta: _Coleta, parar: threading.Event) -> None:
+    aleatorio = random.Random(semente)
+    while not parar.is_set():
+        try:
+            executar_fluxo(contexto, usuario, aleatorio, coleta, parar)
+        except Exception:
+            # Já contado no passo; a sessão espera e recomeça, como quem tenta de novo na tela
+            parar.wait(contexto.pausa or 0.1)
+
+
+def _aguardar_fundo(coleta: _Coleta, timeout: float) -> dict:
+    # E-mails até o SMTP e fila do escritor vazia; devolve os tempos de entrega
+    from escritorAuditoria import obter_escritor
+    from filaEmail import obter_despachante
+
+    despachante = obter_despachante()
+    escritor = obter_escritor()
+    prazo = time.monotonic() + timeout
+    while True:
+        registros = [(despachante.status(id_envio), momento) for id_envio, momento in coleta.envios]
+        pendentes = sum(1 for r, _ in registros if r and r["status"] not in ("enviado", "falhou"))
+        fila_auditoria = escritor.estatisticas()["profundidade_fila"]
+        if (not pendentes and not fila_auditoria) or time.monotonic() >= prazo:
+            break
+        time.sleep(0.2)
+    entregas = [r["atualizado_em"] - momento for r, momento in registros if r and r["status"] == "enviado"]
+    return {
+        "entregas": entregas,
+        "emails_falhos": sum(1 for r, _ in registros if r and r["status"] == "falhou"),
+        "emails_pendentes": pendentes,
+        "fila_auditoria": fila_auditoria,
+    }
+
+
+def _resumo_tempos(valores: list) -> dict:
+    from benchmark import _percentil
+
+    return {
+        "quantidade": len(valores),
+        "p50_ms": round(1000 * _percentil(valores, 50), 2),
+        "p95_ms": round(1000 * _percentil(valores, 95), 2),
+        "p99_ms": round(1000 * _percentil(valores, 99), 2),
+        "max_ms": round(1000 * max(valores), 2) if valores else 0.0,
+    }
+
+
+def medir_degrau(contexto: ContextoCarga, sessoes: int, duracao: float, semente: int,
+                 timeout_fundo: float) -> dict:
+    from agendadorConsultas import agendador
+    from escritorAuditoria import obter_escritor
+
+    # Cada degrau começa com os caches zerados: a primeira consulta de cada planta vai ao banco
+    contexto.repositorio.invalidar_cache()
+    coleta = _Coleta()
+    parar = threading.Event()
+    agendador_antes = agendador.estatisticas()
+    auditoria_antes = obter_escritor().estatisticas()
+    cpu_antes = time.process_time()
+
+    threads = [
+        threading.Thread(
+            target=_executar_sessao,
+            args=(contexto, f"carga{i + 1:03d}", semente + i, coleta, parar),
+            name=f"sessao-carga-{i + 1}",
+            daemon=True,
+        )
+        for i in range(sessoes)
+    ]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duracao)
+    parar.set()  # Fluxos em andamento terminam; nenhum novo começa
+    for thread in threads:
+        thread.join()
+    decorrido = time.perf_counter() - inicio
+    cpu = time.process_time() - cpu_antes
+
+    fundo = _aguardar_fundo(coleta, timeout_fundo)
+    agendador_depois = agendador.estatisticas()
+    auditoria = obter_escritor().estatisticas()
+    fluxos = len(coleta.tempos["fluxo"])
+    return {
+        "sessoes": sessoes,
+        "duracao_s": round(decorrido, 2),
+        "fluxos": fluxos,
+        "vazao_fluxos_s": round(fluxos / decorrido, 3),
+        "vazao_fluxos_min": round(60 * fluxos / decorrido, 1),
+        "cpu_processo_pct": round(100 * cpu / decorrido, 1),
+        "fluxo": _resumo_tempos(coleta.tempos["fluxo"]),
+        "passos": {
+            passo: {**_resumo_tempos(coleta.tempos[passo]), "erros": coleta.erros[passo]}
+            for passo in PASSOS
+        },
+        "erros": sum(coleta.erros.values()),
+        "exemplos_erro": coleta.exemplos_erro,
+        "linhas_anexadas": coleta.linhas,
+        "entrega_email": {
+            **_resumo_tempos(fundo["entregas"]),
+            "falhas": fundo["emails_falhos"],
+            "pendentes": fundo["emails_pendentes"],
+        },
+        "auditoria": {
+            "fila_restante": fundo["fila_auditoria"],
+            **{
+                chave: auditoria[chave] - auditoria_antes[chave]
+                for chave in ("descargas", "registros_gravados", "falhas")
+            },
+        },
+        "agendador": {
+            chave: agendador_depois[chave] - agendador_antes[chave]
+            for chave in ("execucoes", "coalescidas", "admitidas_com_espera", "timeouts")
+        },
+    }
+
+
+def ponto_saturacao(degraus: list, ganho_minimo: float, limite_p95_ms: float = None):
+    # Primeiro degrau em que mais sessões não trazem ganho de vazão sobre o anterior (menos que
+    # ganho_minimo, relativo) ou em que o p95 do fluxo passa do limite. None: não saturou.
+    for indice, atual in enumerate(degraus):
+        anterior = degraus[indice - 1] if indice else None
+        motivo = None
+        if limite_p95_ms and atual["fluxo"]["p95_ms"] > limite_p95_ms:
+            motivo = f"p95 do fluxo {atual['fluxo']['p95_ms']:.0f} ms acima de {limite_p95_ms:.0f} ms"
+        elif anterior is not None and anterior["vazao_fluxos_s"]:
+            ganho = atual["vazao_fluxos_s"] / anterior["vazao_fluxos_s"] - 1
+            if ganho < ganho_minimo:
+                motivo = (
+                    f"vazão {anterior['vazao_fluxos_s']:.2f} -> {atual['vazao_fluxos_s']:.2f} fluxos/s "
+                    f"({ganho:+.0%}) com {anterior['sessoes']} -> {atual['sessoes']} sessões"
+                )
+        if motivo:
+            return {
+                "sessoes": atual["sessoes"],
+                "capacidade_sessoes": anterior["sessoes"] if anterior else 0,
+                "vazao_maxima_fluxos_s": max(d["vazao_fluxos_s"] for d in degraus[: indice + 1]),
+                "motivo": motivo,
+            }
+    return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Teste de carga com sessões simultâneas e serviços simulados.")
+    parser.add_argument("--sessoes", nargs="+", type=int, default=[1, 2, 4, 8, 16],
+                        help="Degraus de sessões simultâneas, em ordem crescente.")
+    parser.add_argument("--duracao", type=float, default=30.0, help="Segundos por degrau.")
+    parser.add_argument("--pausa", type=float, default=0.5,
+                        help="Pausa média entre os passos (leitura da tela), em segundos.")
+    parser.add_argument("--motor", help="Motor de buscar_dados (padrão: CONSULTA_MOTOR).")
+    parser.add_argument("--base", help="Base simulada já gerada; sem ela, uma base --escala é gerada.")
+    parser.add_argument("--escala", default=ESCALA_PADRAO,
+                        help="plantas:lojas_por_planta:produtos_por_planta:linhas_nf")
+    parser.add_argument("--plantas", nargs="+", help="Restringe o sorteio a estas plantas.")
+    parser.add_argument("--max-selecao", type=int, default=20, help="Máximo de linhas selecionadas por fluxo.")
+    parser.add_argument("--latencia-conexao", type=float, default=0.0,
+                        help="Segundos de handshake simulado por conexão nova.")
+    parser.add_argument("--atraso-smtp", type=float, default=0.0,
+                        help="Segundos de atraso do SMTP simulado por mensagem.")
+    parser.add_argument("--ganho-minimo", type=float, default=0.1,
+                        help="Ganho relativo de vazão abaixo do qual o degrau é considerado saturado.")
+    parser.add_argument("--limite-p95-ms", type=float, help="p95 do fluxo a partir do qual o degrau satura.")
+    parser.add_argument("--timeout-fundo", type=float, default=120.0,
+                        help="Espera máxima pelos e-mails e pela fila de auditoria ao fim de cada degrau.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", default="resultados_carga")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="carga_aftermarket_") as pasta, \
+            ServidorSMTPSimulado(atraso=args.atraso_smtp) as smtp:
+        smtp.iniciar_em_segundo_plano()
+        preparar_ambiente(pasta, smtp.porta)
+
+        # Só agora: settings lê o ambiente preparado acima
+        from benchmark import _versao
+        from consultaBD import MOTORES, RepositorioPrincipal
+        from escritorAuditoria import obter_escritor
+        from filaEmail import obter_despachante
+        from settings import CONSULTA_MOTOR
+
+        logging.getLogger().setLevel(logging.WARNING)  # consultaBD configura o log em INFO
+        motor = args.motor or CONSULTA_MOTOR
+        if motor not in MOTORES:
+            parser.error(f"motor inválido: {motor} (opções: {', '.join(MOTORES)})")
+
+        caminho_base = args.base
+        if not caminho_base:
+            plantas, lojas, produtos, linhas_nf = (int(parte) for parte in args.escala.split(":"))
+            caminho_base = os.path.join(pasta, "protheus.db")
+            inicio = time.perf_counter()
+            bancoSimulado.gerar_base(
+                caminho_base,
+                plantas=plantas,
+                lojas_por_planta=lojas,
+                produtos_por_planta=produtos,
+                linhas_nf=linhas_nf,
+                linhas_previsao=max(1000, linhas_nf // 10),
+            )
+            print(f"Base {args.escala} gerada em {time.perf_counter() - inicio:.1f}s")
+
+        repositorio = RepositorioPrincipal(
+            fabrica_conexao=bancoSimulado.fabrica_conexao(caminho_base, args.latencia_conexao)
+        )
+        contexto = ContextoCarga(repositorio, motor, args.plantas, args.max_selecao, args.pausa)
+
+        degraus = []
+        for sessoes in args.sessoes:
+            degrau = medir_degrau(contexto, sessoes, args.duracao, args.semente, args.timeout_fundo)
+            degraus.append(degrau)
+            print(f"{sessoes} sessão(ões): {degrau['fluxos']} fluxos, "
+                  f"{degrau['vazao_fluxos_s']:.2f} fluxos/s, p95 {degrau['fluxo']['p95_ms']:.0f} ms, "
+                  f"{degrau['erros']} erro(s)")
+
+        saturacao = ponto_saturacao(degraus, args.ganho_minimo, args.limite_p95_ms)
+        emails_recebidos = len(smtp.mensagens)
+        obter_despachante().parar()
+        obter_escritor().parar()
+        repositorio._pool.fechar()
+        smtp.shutdown()
+
+    os.makedirs(args.saida, exist_ok=True)
+    caminho = os.path.join(args.saida, f"carga_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(
+            {
+                "versao": _versao(),
+                "data": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "plataforma": platform.platform(),
+                "cpus": os.cpu_count(),
+                "parametros": {**vars(args), "motor": motor},
+                "degraus": degraus,
+                "saturacao": saturacao,
+                "emails_recebidos_smtp": emails_recebidos,
+            },
+            arquivo,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    print()
+    print(f"{'sessões':>8}{'fluxos/s':>10}{'fluxo p95':>11}  " + "".join(f"{p[:14]:>16}" for p in PASSOS))
+    print(f"{'':>8}{'':>10}{'ms':>11}  " + "".join(f"{'p50/p95/p99 ms':>16}" for _ in PASSOS))
+    for d in degraus:
+        colunas = "".join(
+            f"{'{:.0f}/{:.0f}/{:.0f}'.format(d['passos'][p]['p50_ms'], d['passos'][p]['p95_ms'], d['passos'][p]['p99_ms']):>16}"
+            for p in PASSOS
+        )
+        print(f"{d['sessoes']:>8}{d['vazao_fluxos_s']:>10.2f}{d['fluxo']['p95_ms']:>11.0f}  {colunas}")
+    if saturacao:
+        print(f"Saturação com {saturacao['sessoes']} sessões (capacidade: {saturacao['capacidade_sessoes']} "
+              f"sessões, até {saturacao['vazao_maxima_fluxos_s']:.2f} fluxos/s): {saturacao['motivo']}")
+    else:
+        print(f"Sem saturação até {args.sessoes[-1]} sessões; acrescente degraus maiores.")
+    print(f"Resultados gravados em {caminho}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,9 @@
 import subprocess
 import os
 import sys
+import time
+
+from settings import LANCADOR_WORKERS
 
 # Obtém o caminho absoluto do diretório onde este script está
 base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,7 +15,16 @@ if not os.path.exists(script_path):
     print(f"Erro: Arquivo não encontrado: {script_path}")
     sys.exit(1)
 
+# Com mais de um worker, o lançador sobe os processos e o proxy na porta do IIS
+if LANCADOR_WORKERS > 1:
+    from lancador import Lancador
+
+    Lancador().executar()
+    sys.exit(0)
+
 # Chama o Streamlit via subprocess
 # Adiciona 'sys.executable' para garantir que use o mesmo interpretador Python
 cmd = [sys.executable, "-m", "streamlit", "run", script_path]
-subprocess.run(cmd)
\ No newline at end of file
+# Instante do disparo: inicializacao.py mede a partir dele o tempo até a primeira tela
+env = dict(os.environ, AFTERMARKET_BOOT_INICIO=str(time.time()))
+subprocess.run(cmd, env=env)
\ No newline at end of file